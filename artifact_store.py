@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+
+class ArtifactBudgetError(Exception):
+    """Raised when a single output is larger than the configured budget."""
+
+
+class ArtifactStore:
+    """Generated outputs of each job, kept on disk instead of in session state.
+
+    Every job gets its own temporary directory. Artifacts are registered
+    with their size; once a job goes over job_budget bytes, or all jobs
+    together over global_budget bytes, the least recently used artifacts are
+    deleted. Jobs not seen for job_ttl seconds are removed by
+    cleanup_expired(). Session state only needs to keep artifact names.
+    """
+
+    def __init__(self, root=None, job_budget=512 * 1024 * 1024, global_budget=4 * 1024 * 1024 * 1024,
+                 job_ttl=6 * 60 * 60):
+        self.root = Path(root) if root else Path(tempfile.mkdtemp(prefix="report_artifacts_"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.job_budget = job_budget
+        self.global_budget = global_budget
+        self.job_ttl = job_ttl
+        self._lock = threading.RLock()
+        self._artifacts = OrderedDict()  # {(job id, name): size}, least recently used first
+        self._last_seen = {}  # {job id: time.time() of last use}
+
+    def job_dir(self, job_id):
+        """Returns (and creates) the directory of a job."""
+        path = self.root / job_id
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def path(self, job_id, name):
+        """Path where an artifact of a job is (or will be) stored."""
+        return self.job_dir(job_id) / name
+
+    def touch_job(self, job_id):
+        with self._lock:
+            self._last_seen[job_id] = time.time()
+
+    def register(self, job_id, name):
+        """Records an artifact written to path(job_id, name) and enforces the budgets."""
+        size = self.path(job_id, name).stat().st_size
+        with self._lock:
+            key = (job_id, name)
+            self._artifacts[key] = size
+            self._artifacts.move_to_end(key)
+            self._last_seen[job_id] = time.time()
+            if size > self.job_budget or size > self.global_budget:
+                self.delete(job_id, name)
+                raise ArtifactBudgetError(
+                    f"{name} is {size / 1024 / 1024:.1f} MB, more than the storage budget for one job allows")
+            self._evict(lambda item: item[0] == job_id, self.job_budget, key)
+            self._evict(lambda item: True, self.global_budget, key)
+        return self.path(job_id, name)
+
+    def put_bytes(self, job_id, name, data):
+        """Writes bytes as an artifact and registers it."""
+        self.path(job_id, name).write_bytes(data)
+        return self.register(job_id, name)
+
+    def get_path(self, job_id, name):
+        """Returns the path of an artifact (marking it recently used) or None if it is gone."""
+        with self._lock:
+            key = (job_id, name)
+            if key not in self._artifacts:
+                return None
+            self._artifacts.move_to_end(key)
+            self._last_seen[job_id] = time.time()
+        path = self.path(job_id, name)
+        return path if path.exists() else None
+
+    def read(self, job_id, name):
+        """Returns the bytes of an artifact or None if it is gone."""
+        path = self.get_path(job_id, name)
+        return path.read_bytes() if path is not None else None
+
+    def delete(self, job_id, name):
+        with self._lock:
+            self._artifacts.pop((job_id, name), None)
+        try:
+            os.remove(self.path(job_id, name))
+        except FileNotFoundError:
+            pass
+
+    def job_bytes(self, job_id):
+        with self._lock:
+            return sum(size for (owner, _), size in self._artifacts.items() if owner == job_id)
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(self._artifacts.values())
+
+    def clear_job(self, job_id):
+        """Deletes every artifact and the directory of a job."""
+        with self._lock:
+            for key in [key for key in self._artifacts if key[0] == job_id]:
+                del self._artifacts[key]
+            self._last_seen.pop(job_id, None)
+        shutil.rmtree(self.root / job_id, ignore_errors=True)
+
+    def cleanup_expired(self, now=None):
+        """Removes jobs that have not been used for job_ttl seconds."""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [job_id for job_id, seen in self._last_seen.items() if now - seen > self.job_ttl]
+        for job_id in expired:
+            self.clear_job(job_id)
+        return expired
+
+    def _evict(self, in_scope, budget, keep):
+        # Caller holds the lock; drops least recently used artifacts in scope until the budget fits
+        used = sum(size for key, size in self._artifacts.items() if in_scope(key))
+        for key in list(self._artifacts):
+            if used <= budget:
+                break
+            if key == keep or not in_scope(key):
+                continue
+            used -= self._artifacts[key]
+            self.delete(*key)
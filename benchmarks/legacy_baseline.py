@@ -0,0 +1,36 @@
+"""Legacy baseline of the benchmarks: placeholders replaced in python-docx, one row at a time.
+
+This is how the Streamlit app and ReportGenerator rendered reports before
+the compiled template engine: every row parses the template again, walks
+its paragraphs and saves the document. None of the entry points uses it any
+more; run_benchmarks.py keeps it as the 'legacy' target so the speedup of
+the engine stays measurable. Values are formatted by intake.format_columns,
+like everywhere else.
+"""
+from template_engine import DOUBLE_BRACE_PATTERN, build_column_index, replace_in_paragraph, story_paragraphs
+
+
+def normalize_column(name):
+    """Normalizes a column or placeholder name for case-insensitive lookup."""
+    return str(name).strip().lower()
+
+
+def column_index(columns):
+    """{normalized column name: position}, built once per run."""
+    return build_column_index(list(columns), normalize_column)[0]
+
+
+def replace_fields(document, values, index):
+    """Replaces the {{placeholders}} of a python-docx Document with a row of formatted values.
+
+    values is the row as a sequence of strings, index the column_index of its columns.
+    Placeholders without a column are left as they are.
+    """
+    def value_for(match):
+        position = index.get(normalize_column(match.group(1)))
+        return values[position] if position is not None else None
+
+    for paragraph in story_paragraphs(document):
+        if '{{' in ''.join(paragraph.itertext()):
+            replace_in_paragraph(paragraph, DOUBLE_BRACE_PATTERN, value_for)
+    return document
@@ -0,0 +1,301 @@
+"""Throughput benchmarks for the report generators.
+
+Generates a synthetic template and workbook, then measures rows/sec,
+per-stage latency and peak RSS of each target in its own process:
+
+- engine: ReportGenerator with the compiled template engine
+- streamlit: generate_job_outputs, the background job of the Streamlit app
+- langflow: generate_reports_component of langflow_report_generator.py
+- legacy: python-docx per row (legacy_baseline.py), what the engine replaced
+
+Results are saved as JSON so runs on different commits can be compared:
+
+    python benchmarks/run_benchmarks.py --rows 500
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synthetic import build_template, build_workbook
+from stage_timer import StageTimer
+
+TARGETS = ("engine", "streamlit", "langflow", "legacy")
+EXCEL_FILE = "bench.xlsx"
+DOUBLE_TEMPLATE = "bench_double.docx"
+SINGLE_TEMPLATE = "bench_single.docx"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, None where it cannot be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def fresh_inputs(workdir, name):
+    """Copies the synthetic files into a new Inputs directory, so every pass starts with unprocessed rows."""
+    inputs = Path(workdir) / name / "Inputs"
+    shutil.copytree(Path(workdir) / "source", inputs)
+    (inputs.parent / "Outputs").mkdir()
+    return inputs
+
+
+def bench_engine(workdir, workers):
+    from intake import write_processed_cells
+    from report_generator import ReportGenerator
+
+    # End to end, as the command line runs it
+    inputs = fresh_inputs(workdir, "engine_run")
+    generator = ReportGenerator(input_dir=inputs, output_dir=inputs.parent / "Outputs", workers=workers)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        df = generator.load_excel_data(EXCEL_FILE)
+        generator.generate(df, EXCEL_FILE, SINGLE_TEMPLATE)
+        seconds = time.perf_counter() - start
+
+    # Stage by stage, serially with the iter_reports stream generate renders with
+    inputs = fresh_inputs(workdir, "engine_stages")
+    output_dir = inputs.parent / "Outputs"
+    generator = ReportGenerator(input_dir=inputs, output_dir=output_dir, journal=False)
+    timer = generator.timer
+    with contextlib.redirect_stdout(io.StringIO()):
+        with timer.time("load_workbook"):
+            df = generator.load_excel_data(EXCEL_FILE)
+        # Compiling the template, formatting and rendering are timed by the stream
+        updates = {}
+        for index, output_filename, report_bytes in generator.iter_reports(df, SINGLE_TEMPLATE):
+            with timer.time("write_report"):
+                (output_dir / output_filename).write_bytes(report_bytes)
+            updates[index] = output_filename
+        with timer.time("write_back"):
+            write_processed_cells(inputs / EXCEL_FILE, updates)
+    return len(df), seconds, timer.summary()
+
+
+def bench_streamlit(workdir, workers):
+    from artifact_store import ArtifactStore
+    from report_jobs import ReportJob, generate_job_outputs
+    from template_library import TemplateLibrary
+
+    # The app hands each upload to this background job; stages are timed by the job itself
+    inputs = fresh_inputs(workdir, "streamlit")
+    store = ArtifactStore(root=Path(workdir) / "streamlit_artifacts")
+    job = ReportJob("bench", store.job_dir("bench"))
+    excel_bytes = (inputs / EXCEL_FILE).read_bytes()
+    template_bytes = (inputs / DOUBLE_TEMPLATE).read_bytes()
+    start = time.perf_counter()
+    state = generate_job_outputs(job, store, TemplateLibrary(), excel_bytes, EXCEL_FILE, template_bytes)
+    seconds = time.perf_counter() - start
+    if state["state"] != "completed":
+        raise RuntimeError(f"Streamlit job ended as {state['state']}: {state.get('error')}")
+    return job.snapshot()["processed_count"], seconds, state["timings"]
+
+
+def bench_legacy(workdir, workers):
+    import pandas as pd
+    from docx import Document
+    from intake import format_columns
+    from legacy_baseline import column_index, replace_fields
+
+    inputs = fresh_inputs(workdir, "legacy")
+    template_bytes = (inputs / DOUBLE_TEMPLATE).read_bytes()
+    timer = StageTimer()
+    start = time.perf_counter()
+    with timer.time("load_workbook"):
+        df = pd.read_excel(inputs / EXCEL_FILE)
+        df.columns = [str(col).strip('{}') for col in df.columns]
+    with timer.time("format_values"):
+        formatted = format_columns(df)
+    index = column_index(formatted.columns)
+    for row in formatted.itertuples(index=False, name=None):
+        with timer.time("parse_template"):
+            document = Document(io.BytesIO(template_bytes))
+        with timer.time("replace_fields"):
+            replace_fields(document, row, index)
+        with timer.time("save_report"):
+            document.save(io.BytesIO())
+    seconds = time.perf_counter() - start
+    return len(df), seconds, timer.summary()
+
+
+def bench_langflow(workdir, workers):
+    import langflow_report_generator as langflow
+    from report_generator import ReportGenerator
+
+    # The component works on Inputs/ and Outputs/ of the current directory
+    inputs = fresh_inputs(workdir, "langflow_run")
+    previous_dir = os.getcwd()
+    try:
+        os.chdir(inputs.parent)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            df = langflow.load_excel_data_component(EXCEL_FILE)
+            langflow.generate_reports_component(df, EXCEL_FILE, SINGLE_TEMPLATE)
+            seconds = time.perf_counter() - start
+
+        # Stage by stage, with the iter_reports stream the component renders with
+        inputs = fresh_inputs(workdir, "langflow_stages")
+        os.chdir(inputs.parent)
+        generator = ReportGenerator(input_dir="Inputs", output_dir="Outputs", journal=False)
+        timer = generator.timer
+        with contextlib.redirect_stdout(io.StringIO()):
+            with timer.time("load_workbook"):
+                df = langflow.load_excel_data_component(EXCEL_FILE)
+            # Compiling the template, formatting and rendering are timed by the stream
+            for index, output_filename, report_bytes in generator.iter_reports(df, SINGLE_TEMPLATE):
+                with timer.time("write_report"):
+                    (Path("Outputs") / output_filename).write_bytes(report_bytes)
+                df.loc[index, 'processed'] = output_filename
+            with timer.time("write_back"):
+                df.to_excel(inputs / EXCEL_FILE, index=False)
+    finally:
+        os.chdir(previous_dir)
+    return len(df), seconds, timer.summary()
+
+
+BENCHMARKS = {"engine": bench_engine, "streamlit": bench_streamlit, "langflow": bench_langflow,
+              "legacy": bench_legacy}
+
+
+def run_target(target, workdir, workers, results):
+    # Runs in a fresh process so the peak RSS belongs to this target alone
+    rows, seconds, stages = BENCHMARKS[target](workdir, workers)
+    results.put({
+        "rows": rows,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(rows / seconds, 2) if seconds else None,
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    workdir = Path(tempfile.mkdtemp(prefix="report_bench_"))
+    try:
+        source = workdir / "source"
+        source.mkdir()
+        template_options = dict(paragraphs=args.paragraphs, placeholders=args.placeholders, columns=args.columns,
+                                tables=args.tables, nested_tables=not args.no_nested_tables,
+                                split_ratio=args.split_ratio, seed=args.seed)
+        build_template(source / DOUBLE_TEMPLATE, braces="double", **template_options)
+        build_template(source / SINGLE_TEMPLATE, braces="single", **template_options)
+        build_workbook(source / EXCEL_FILE, rows=args.rows, columns=args.columns, seed=args.seed)
+
+        context = multiprocessing.get_context("spawn")
+        results = {}
+        for target in args.targets:
+            print(f"Running {target} ({args.rows} rows)...")
+            queue = context.Queue()
+            process = context.Process(target=run_target, args=(target, str(workdir), args.workers, queue))
+            process.start()
+            try:
+                results[target] = queue.get(timeout=args.timeout)
+            except Exception:
+                results[target] = {"error": f"no result (exit code {process.exitcode})"}
+            process.join()
+            result = results[target]
+            if "error" in result:
+                print(f"  {result['error']}")
+            else:
+                print(f"  {result['rows_per_sec']} rows/sec, peak RSS {result['peak_rss_mb']} MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "rows": args.rows, "columns": args.columns, "paragraphs": args.paragraphs,
+            "placeholders": args.placeholders, "tables": args.tables,
+            "nested_tables": not args.no_nested_tables, "split_ratio": args.split_ratio,
+            "seed": args.seed, "workers": args.workers,
+        },
+        "results": results,
+    }
+
+
+def compare(old_path, new_path):
+    """Prints rows/sec and peak RSS of two result files side by side."""
+    old = json.loads(Path(old_path).read_text(encoding='utf-8'))
+    new = json.loads(Path(new_path).read_text(encoding='utf-8'))
+    print(f"{'target':<10} {'old rows/s':>12} {'new rows/s':>12} {'speedup':>8} {'old MB':>8} {'new MB':>8}")
+    for target in TARGETS:
+        before = old["results"].get(target, {})
+        after = new["results"].get(target, {})
+        if not before.get("rows_per_sec") or not after.get("rows_per_sec"):
+            continue
+        speedup = after["rows_per_sec"] / before["rows_per_sec"]
+        print(f"{target:<10} {before['rows_per_sec']:>12} {after['rows_per_sec']:>12} {speedup:>7.2f}x "
+              f"{before.get('peak_rss_mb')!s:>8} {after.get('peak_rss_mb')!s:>8}")
+    if old.get("parameters") != new.get("parameters"):
+        print("Note: the runs used different parameters.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the report generators on synthetic data.")
+    parser.add_argument("--rows", type=int, default=200, help="Workbook rows (default: 200)")
+    parser.add_argument("--columns", type=int, default=20, help="Workbook columns (default: 20)")
+    parser.add_argument("--paragraphs", type=int, default=50, help="Template body paragraphs (default: 50)")
+    parser.add_argument("--placeholders", type=int, default=40, help="Placeholders in the template (default: 40)")
+    parser.add_argument("--tables", type=int, default=2, help="Tables in the template (default: 2)")
+    parser.add_argument("--no-nested-tables", action="store_true", help="Do not nest a table in each table")
+    parser.add_argument("--split-ratio", type=float, default=0.25, help="Share of placeholders split across runs (default: 0.25)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data (default: 0)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes of the engine run (default: 1)")
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS), help="Targets to run (default: all)")
+    parser.add_argument("--timeout", type=int, default=3600, help="Seconds to wait for one target (default: 3600)")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/bench_<time>_<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    report = run(args)
+    if args.output:
+        output = Path(args.output)
+    else:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = REPO_DIR / "benchmarks" / "results" / f"bench_{stamp}_{report['commit'] or 'nogit'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n", encoding='utf-8')
+    print(f"Results saved to {output}")
+    return 1 if any("error" in result for result in report["results"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import random
+from datetime import datetime, timedelta
+
+import pandas as pd
+from docx import Document
+
+FILLER = ("The quick brown fox jumps over the lazy dog while the report generator "
+          "fills in the details of this paragraph.")
+
+
+def column_name(position):
+    """Name of the synthetic column at a 0-based position."""
+    return f"field_{position + 1:02d}"
+
+
+def add_placeholder(paragraph, name, braces, split):
+    """Adds a placeholder to a paragraph, optionally split over three runs like Word often does."""
+    opening, closing = ("{{", "}}") if braces == "double" else ("{", "}")
+    if not split:
+        paragraph.add_run(f"{opening}{name}{closing}")
+        return
+    # Different formatting keeps Word (and python-docx) from merging the runs
+    middle = max(1, len(name) // 2)
+    paragraph.add_run(f"{opening}{name[:middle]}")
+    paragraph.add_run(name[middle:]).bold = True
+    paragraph.add_run(closing)
+
+
+def build_template(path, paragraphs=50, placeholders=40, columns=20, tables=2, table_rows=4,
+                   nested_tables=True, split_ratio=0.25, braces="double", seed=0):
+    """Writes a synthetic .docx template and returns its path.
+
+    placeholders are spread over the body paragraphs and the table cells
+    (every fourth one goes to a table when there are tables), a split_ratio
+    share of them is split across runs. With nested_tables the first cell of
+    each table holds another table. braces is "double" ({{name}}, Streamlit)
+    or "single" ({name}, ReportGenerator and the langflow component).
+    """
+    rng = random.Random(seed)
+    document = Document()
+    document.add_heading("Synthetic benchmark report", level=1)
+
+    names = [column_name(position % columns) for position in range(placeholders)]
+    body_names = []
+    table_names = []
+    for position, name in enumerate(names):
+        (table_names if tables and position % 4 == 3 else body_names).append(name)
+
+    body = [document.add_paragraph(FILLER + " ") for _ in range(max(1, paragraphs))]
+    for position, name in enumerate(body_names):
+        paragraph = body[position % len(body)]
+        add_placeholder(paragraph, name, braces, rng.random() < split_ratio)
+        paragraph.add_run(" ")
+
+    cells = []
+    for _ in range(tables):
+        table = document.add_table(rows=table_rows, cols=3)
+        if nested_tables:
+            nested = table.cell(0, 0).add_table(rows=2, cols=2)
+            cells.extend(cell for row in nested.rows for cell in row.cells)
+        cells.extend(cell for row in table.rows for cell in row.cells)
+        document.add_paragraph(FILLER)
+    for position, name in enumerate(table_names):
+        paragraph = cells[position % len(cells)].add_paragraph("Value: ")
+        add_placeholder(paragraph, name, braces, rng.random() < split_ratio)
+
+    document.save(path)
+    return path
+
+
+def build_workbook(path, rows=100, columns=20, seed=0):
+    """Writes a synthetic intake workbook with rows x columns values and an empty 'processed' column."""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    data = {}
+    for position in range(columns):
+        kind = position % 4
+        if kind == 0:
+            values = [f"Text {rng.randint(0, 10 ** 6)} " + "x" * rng.randint(0, 40) for _ in range(rows)]
+        elif kind == 1:
+            values = [rng.randint(0, 10 ** 6) for _ in range(rows)]
+        elif kind == 2:
+            values = [round(rng.uniform(0, 10 ** 4), 2) for _ in range(rows)]
+        else:
+            values = [start + timedelta(days=rng.randint(0, 3650)) for _ in range(rows)]
+        data[column_name(position)] = values
+    df = pd.DataFrame(data)
+    df['processed'] = None
+    df.to_excel(path, index=False)
+    return path
@@ -0,0 +1,98 @@
+import json
+import os
+import time
+from pathlib import Path
+
+
+class CheckpointJournal:
+    """Append-only journal of the rows a run has completed, one JSON line per row.
+
+    Each line holds the row index, the report filename and the row's render key
+    (RenderCache.key of the template and values), so a row is only taken as
+    done when the workbook row and template are still the same. Lines are
+    written in batches of flush_every rows (or after flush_seconds) and synced
+    to disk, so a crash loses at most the last batch. A torn last line from a
+    crash is ignored when the journal is read again. Rows of a fan-out run are
+    keyed by (row index, processed column), one entry per template.
+    """
+
+    def __init__(self, path, flush_every=25, flush_seconds=2.0):
+        self.path = Path(path)
+        self.flush_every = max(1, int(flush_every))
+        self.flush_seconds = flush_seconds
+        self.entries = self.read(self.path)  # {row key: (filename, key)}
+        self._pending = []
+        self._file = None
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def read(path):
+        """Returns {row key: (filename, key)} from a journal file, later lines win."""
+        entries = {}
+        try:
+            with open(path, 'rb') as journal_file:
+                for line in journal_file:
+                    try:
+                        entry = json.loads(line)
+                        row = int(entry['row'])
+                        if 'column' in entry:
+                            row = (row, entry['column'])
+                        entries[row] = (entry['file'], entry['key'])
+                    except (ValueError, KeyError, TypeError):
+                        continue  # Torn or damaged line
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def completed(self, row, key):
+        """Returns the report filename of a journaled row if its key still matches, else None."""
+        entry = self.entries.get(row)
+        if entry is not None and entry[1] == key:
+            return entry[0]
+        return None
+
+    def record(self, row, filename, key):
+        """Adds a completed row; it is written with the next batch."""
+        self.entries[row] = (filename, key)
+        entry = {"row": int(row[0]), "column": row[1]} if isinstance(row, tuple) else {"row": int(row)}
+        entry.update(file=filename, key=key)
+        self._pending.append(json.dumps(entry) + "\n")
+        if len(self._pending) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Writes the pending lines and syncs them to disk."""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a+b')
+            # Start on a new line if the previous run died in the middle of one
+            if self._file.tell() > 0:
+                self._file.seek(-1, os.SEEK_END)
+                if self._file.read(1) != b"\n":
+                    self._file.write(b"\n")
+        self._file.write("".join(self._pending).encode('utf-8'))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Deletes the journal, once its rows are marked in the workbook."""
+        self._pending = []
+        self.close()
+        self.entries = {}
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,617 @@
+import io
+import itertools
+import os
+import re
+import shutil
+import zipfile
+from collections import deque
+import pandas as pd
+import openpyxl
+from datetime import datetime
+from pathlib import Path
+from lxml import etree
+from xml.sax.saxutils import escape
+
+# Dates in reports are formatted without the time
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def apply_format_spec(value, spec):
+    """Formats one value with a strftime pattern (dates) or a format() spec (everything else)."""
+    if isinstance(value, datetime):
+        return value.strftime(spec)
+    try:
+        return format(value, spec)
+    except (TypeError, ValueError):
+        # e.g. a number format on a text cell, fall back to the plain value
+        return str(value)
+
+
+def format_column(series, spec=None, date_format=DATE_FORMAT):
+    """Formats a whole column as report text.
+
+    Missing values become empty strings and dates are formatted with date_format
+    (or spec). spec is a strftime pattern for date columns and a format() spec
+    such as ',.2f' for other columns.
+    """
+    missing = series.isna()
+    if pd.api.types.is_datetime64_any_dtype(series):
+        text = series.dt.strftime(spec or date_format)
+    elif spec is not None:
+        text = series.map(lambda value: apply_format_spec(value, spec), na_action='ignore')
+    elif series.dtype == object:
+        # Mixed columns can hold datetime cells next to text
+        text = series.map(
+            lambda value: value.strftime(date_format) if isinstance(value, datetime) else str(value),
+            na_action='ignore',
+        )
+    else:
+        text = series.astype(str)
+    return text.astype(object).where(~missing, '')
+
+
+def format_columns(df, formats=None, date_format=DATE_FORMAT):
+    """Formats every column of a DataFrame once, before the render loop.
+
+    formats is an optional {column name: spec} mapping, see format_column.
+    Returns a DataFrame of strings with the same index and columns; iterate it
+    with itertuples(index=False, name=None) to get plain tuples of ready strings.
+    """
+    formats = formats or {}
+    return pd.DataFrame(
+        {position: format_column(df.iloc[:, position], formats.get(column), date_format)
+         for position, column in enumerate(df.columns)},
+        index=df.index,
+    ).set_axis(df.columns, axis=1)
+
+
+def clean_column_name(column):
+    """Strips the {braces} some intake sheets put around the column headers."""
+    return str(column).strip('{}')
+
+
+class StreamingIntakeReader:
+    """Streams an intake workbook with openpyxl in read-only mode.
+
+    Iterating yields DataFrames of at most chunk_size unprocessed rows (empty
+    'processed' cell), indexed like pd.read_excel would index them. Headers are
+    read once; total_rows and skipped_rows are filled in while iterating.
+    expected_rows is the row count the sheet declares (known once iteration
+    starts, None if the sheet does not declare it), e.g. for progress bars.
+    With several processed_columns (one per template of a fan-out run) a row
+    is only skipped once all of them are filled; missing ones are added empty.
+    With skip_processed=False every row is yielded.
+
+    Cells keep the values openpyxl reads (object columns, no dtype inference),
+    so a value formats the same whichever chunk its row lands in; pandas would
+    turn a whole-number column into floats in the chunks that have a blank.
+    """
+
+    def __init__(self, source, chunk_size=1000, sheet_name=None, processed_columns=('processed',),
+                 skip_processed=True):
+        self.source = source
+        self.chunk_size = max(1, int(chunk_size))
+        self.sheet_name = sheet_name
+        self.processed_columns = list(processed_columns)
+        self.skip_processed = skip_processed
+        self.columns = None
+        self.has_processed_column = False
+        self.total_rows = 0
+        self.skipped_rows = 0
+        self.expected_rows = None
+
+    def __iter__(self):
+        workbook = openpyxl.load_workbook(self.source, read_only=True, data_only=True)
+        try:
+            worksheet = workbook[self.sheet_name] if self.sheet_name else workbook.worksheets[0]
+            if worksheet.max_row:
+                self.expected_rows = max(0, worksheet.max_row - 1)
+            rows = worksheet.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            # Like pd.read_excel, drop trailing empty header cells
+            header = list(header)
+            while header and header[-1] is None:
+                header.pop()
+            self.columns = [clean_column_name(column) for column in header]
+            self.has_processed_column = 'processed' in self.columns
+            # Positions of the tracking columns; a missing one means the row is not processed
+            processed_positions = [self.columns.index(column) if column in self.columns else None
+                                   for column in self.processed_columns]
+            width = len(self.columns)
+
+            chunk = []
+            chunk_index = []
+            blank_rows = []  # Blank rows only count once a later row has data, as in pd.read_excel
+            position = 0
+            for values in rows:
+                values = list(values[:width]) + [None] * (width - len(values))
+                if all(value is None for value in values):
+                    blank_rows.append(position)
+                    position += 1
+                    continue
+                for blank_position in blank_rows:
+                    self.total_rows += 1
+                    chunk_index.append(blank_position)
+                    chunk.append([None] * width)
+                blank_rows = []
+
+                self.total_rows += 1
+                if self.skip_processed and all(
+                        column_position is not None and values[column_position] is not None
+                        and str(values[column_position]) != '' for column_position in processed_positions):
+                    self.skipped_rows += 1
+                else:
+                    chunk_index.append(position)
+                    chunk.append(values)
+                position += 1
+
+                if len(chunk) >= self.chunk_size:
+                    yield self._frame(chunk, chunk_index)
+                    chunk = []
+                    chunk_index = []
+            if chunk:
+                yield self._frame(chunk, chunk_index)
+        finally:
+            workbook.close()
+
+    def _frame(self, chunk, chunk_index):
+        df = pd.DataFrame(chunk, columns=self.columns, index=chunk_index, dtype=object)
+        for column in self.processed_columns:
+            if column not in self.columns:
+                df[column] = ''
+            df[column] = df[column].fillna('').astype(str)
+        return df
+
+
+def read_intake(source, sheet_name=None):
+    """Reads a whole intake workbook into a DataFrame, with the cell values StreamingIntakeReader yields.
+
+    Use it instead of pd.read_excel where rows are rendered, so a workbook
+    loaded at once formats exactly like the same workbook streamed in chunks.
+    The 'processed' column is added when missing.
+    """
+    reader = StreamingIntakeReader(source, chunk_size=10000, sheet_name=sheet_name, skip_processed=False)
+    chunks = list(reader)
+    if chunks:
+        return pd.concat(chunks)
+    columns = list(reader.columns or [])
+    if 'processed' not in columns:
+        columns.append('processed')
+    return pd.DataFrame(columns=columns, dtype=object)
+
+
+# SpreadsheetML namespaces used when patching a workbook in place
+SHEET_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PACKAGE_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+CELL_REF_PATTERN = re.compile(r'([A-Z]+)(\d+)')
+
+
+def column_letter(number):
+    """Converts a 1-based column number to its letter (1 -> A, 27 -> AA)."""
+    letters = ''
+    while number:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def column_number(letters):
+    """Converts a column letter to its 1-based number (A -> 1, AA -> 27)."""
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+def first_sheet_part(package):
+    """Returns the zip member name of the first worksheet, the one pd.read_excel reads."""
+    workbook = etree.fromstring(package.read('xl/workbook.xml'))
+    relation_id = workbook.find(f'{{{SHEET_NS}}}sheets/{{{SHEET_NS}}}sheet').get(f'{{{REL_NS}}}id')
+    relations = etree.fromstring(package.read('xl/_rels/workbook.xml.rels'))
+    for relation in relations.iter(f'{{{PACKAGE_REL_NS}}}Relationship'):
+        if relation.get('Id') == relation_id:
+            target = relation.get('Target')
+            return target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+    raise ValueError("Workbook has no worksheet")
+
+
+def shared_strings(package, wanted):
+    """Reads the shared strings with the given indexes (only as far as needed)."""
+    strings = {}
+    if not wanted or 'xl/sharedStrings.xml' not in package.namelist():
+        return strings
+    last = max(wanted)
+    with package.open('xl/sharedStrings.xml') as source:
+        for position, (_, item) in enumerate(etree.iterparse(source, tag=f'{{{SHEET_NS}}}si')):
+            if position in wanted:
+                strings[position] = ''.join(item.itertext())
+            item.clear()
+            if position >= last:
+                break
+    return strings
+
+
+def cell_columns(row):
+    """Yields (column number, cell) for the cells of a <row>, following cell references."""
+    number = 0
+    for cell in row.iterfind(f'{{{SHEET_NS}}}c'):
+        match = CELL_REF_PATTERN.fullmatch(cell.get('r', ''))
+        number = column_number(match.group(1)) if match else number + 1
+        yield number, cell
+
+
+def header_texts(package, header_row):
+    """Returns {column number: header text} for the header row of a sheet."""
+    cells = list(cell_columns(header_row)) if header_row is not None else []
+    wanted = set()
+    for _, cell in cells:
+        value = cell.find(f'{{{SHEET_NS}}}v')
+        if cell.get('t') == 's' and value is not None:
+            wanted.add(int(value.text))
+    strings = shared_strings(package, wanted)
+
+    headers = {}
+    for number, cell in cells:
+        value = cell.find(f'{{{SHEET_NS}}}v')
+        inline = cell.find(f'{{{SHEET_NS}}}is')
+        if cell.get('t') == 'inlineStr':
+            headers[number] = ''.join(inline.itertext()) if inline is not None else ''
+        elif cell.get('t') == 's' and value is not None:
+            headers[number] = strings.get(int(value.text), '')
+        elif value is not None:
+            headers[number] = value.text or ''
+    return headers
+
+
+def read_header(source):
+    """Returns the column names of an intake workbook as StreamingIntakeReader reads them.
+
+    source is a path, bytes or a file object. Only the first row of the first
+    sheet and the shared strings it uses are parsed, so this takes
+    milliseconds however many rows the workbook has.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    with zipfile.ZipFile(source) as package:
+        header_row = None
+        with package.open(first_sheet_part(package)) as sheet:
+            for _, row in etree.iterparse(sheet, tag=f'{{{SHEET_NS}}}row'):
+                header_row = row
+                break
+        if header_row is not None and header_row.get('r', '1') != '1':
+            header_row = None  # The first row is empty, like an empty header in openpyxl
+        headers = header_texts(package, header_row)
+    # Like pd.read_excel, drop trailing empty header cells
+    columns = [headers.get(number) for number in range(1, max(headers, default=0) + 1)]
+    while columns and columns[-1] in (None, ''):
+        columns.pop()
+    return [clean_column_name(column) for column in columns]
+
+
+def set_inline_string(cell, text):
+    """Turns a cell into an inline string cell, keeping its style."""
+    for child in list(cell):
+        cell.remove(child)
+    cell.set('t', 'inlineStr')
+    inline = etree.SubElement(cell, f'{{{SHEET_NS}}}is')
+    etree.SubElement(inline, f'{{{SHEET_NS}}}t').text = text
+
+
+def find_or_insert(parent, tag, number, numbers):
+    """Returns the child with the given row or column number, inserting it in order if missing.
+
+    numbers is the ordered list of (number, element) pairs of the existing children.
+    """
+    for position, (existing, element) in enumerate(numbers):
+        if existing == number:
+            return element
+        if existing > number:
+            element_after = element
+            new_element = etree.Element(tag)
+            element_after.addprevious(new_element)
+            numbers.insert(position, (number, new_element))
+            return new_element
+    new_element = etree.SubElement(parent, tag)
+    numbers.append((number, new_element))
+    return new_element
+
+
+def set_processed_cell(row, row_number, processed_column, text):
+    """Sets the 'processed' cell of a <row> element, inserting the cell in column order."""
+    row.set('r', str(row_number))
+    cells = list(cell_columns(row))
+    cell = find_or_insert(row, f'{{{SHEET_NS}}}c', processed_column, cells)
+    cell.set('r', f'{column_letter(processed_column)}{row_number}')
+    set_inline_string(cell, text)
+    # Widen the optional span hint if the cell is outside it
+    spans = row.get('spans')
+    if spans and ':' in spans:
+        first, last = spans.split(':', 1)
+        if first.isdigit() and last.isdigit() and processed_column > int(last):
+            row.set('spans', f'{first}:{processed_column}')
+
+
+def cell_updates(updates):
+    """Groups updates by sheet row: {row number: {column name: text}}.
+
+    updates maps a DataFrame row index to the text of its 'processed' cell, or
+    a (row index, column name) pair to the text of that column's cell.
+    """
+    cells = {}
+    for key, text in updates.items():
+        index, column = key if isinstance(key, tuple) else (key, 'processed')
+        cells.setdefault(index + 2, {})[column] = text
+    return cells
+
+
+def processed_column_numbers(headers, names):
+    """Returns ({column name: column number}, {column number: header to add}).
+
+    Columns without a header cell are appended after the last one, in order.
+    """
+    numbers = {}
+    for number, text in sorted(headers.items()):
+        numbers.setdefault(clean_column_name(text), number)
+    found = {}
+    added = {}
+    next_number = max(headers, default=0) + 1
+    for name in names:
+        if name in numbers:
+            found[name] = numbers[name]
+        else:
+            found[name] = added_number = next_number
+            added[added_number] = name
+            next_number += 1
+    return found, added
+
+
+def pending_cells(package, header_row, updates):
+    """Returns ({row number: {column number: text}}, last column number) for the updates of a sheet.
+
+    The header cells of columns the sheet does not have yet are part of row 1.
+    """
+    cells = cell_updates(updates)
+    names = list(dict.fromkeys(name for row in cells.values() for name in row)) or ['processed']
+    numbers, added = processed_column_numbers(header_texts(package, header_row), names)
+    pending = {row_number: {numbers[name]: text for name, text in row.items()} for row_number, row in cells.items()}
+    if added:
+        pending.setdefault(1, {}).update(added)
+    return pending, max(numbers.values())
+
+
+def grown_dimension(ref, processed_column, last_row):
+    """Returns the used range ref grown to cover the 'processed' cells, or None if ref is not a range.
+
+    processed_column is the last column that gets a cell.
+    """
+    match = re.fullmatch(r'([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?', ref)
+    if not match:
+        return None
+    start = f'{match.group(1)}{match.group(2)}'
+    end_column = column_number(match.group(3) or match.group(1))
+    end_row = int(match.group(4) or match.group(2))
+    return f'{start}:{column_letter(max(end_column, processed_column))}{max(end_row, last_row)}'
+
+
+def patch_sheet(sheet_xml, package, updates):
+    """Returns the sheet XML with the 'processed' cells of the given rows set.
+
+    Parses the whole sheet; patch_sheet_stream does the same a row at a time.
+    """
+    root = etree.fromstring(sheet_xml)
+    sheet_data = root.find(f'{{{SHEET_NS}}}sheetData')
+    rows = [(int(row.get('r')), row) for row in sheet_data.iterfind(f'{{{SHEET_NS}}}row')]
+    row_lookup = dict(rows)
+
+    pending, last_column = pending_cells(package, row_lookup.get(1), updates)
+
+    last_row = 1
+    for row_number, cells in sorted(pending.items()):
+        last_row = max(last_row, row_number)
+        row = row_lookup.get(row_number)
+        if row is None:
+            row = find_or_insert(sheet_data, f'{{{SHEET_NS}}}row', row_number, rows)
+        for processed_column, text in sorted(cells.items()):
+            set_processed_cell(row, row_number, processed_column, text)
+
+    # Grow the used range if the cells are outside it
+    dimension = root.find(f'{{{SHEET_NS}}}dimension')
+    if dimension is not None:
+        ref = grown_dimension(dimension.get('ref', ''), last_column, last_row)
+        if ref is not None:
+            dimension.set('ref', ref)
+
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+
+# Bytes read from the sheet XML at a time by patch_sheet_stream
+STREAM_BLOCK_SIZE = 1024 * 1024
+SHEET_DATA_START = re.compile(rb'<((?:[\w.-]+:)?)sheetData\b[^>]*?(/?)>')
+WORKSHEET_START = re.compile(rb'<((?:[\w.-]+:)?)worksheet\b[^>]*>')
+DIMENSION_REF = re.compile(rb'(<(?:[\w.-]+:)?dimension\b[^>]*?\bref=")([^"]*)(")')
+ROW_NUMBER = re.compile(rb'\sr=["\'](\d+)["\']')
+
+
+def patch_sheet_stream(source, output, package, updates):
+    """Copies the sheet XML from source to output with the 'processed' cells of the given rows set.
+
+    Works a row at a time: rows without an update are copied as they are and
+    only updated rows are parsed, so memory does not grow with the sheet.
+    Returns False without writing anything if the sheet does not have the
+    usual layout (use patch_sheet then).
+    """
+    buffer = b''
+    at_end = False
+
+    def read_until(pattern_search):
+        # Reads more of the sheet until pattern_search(buffer) finds something or the sheet ends
+        nonlocal buffer, at_end
+        while True:
+            found = pattern_search()
+            if found is not None or at_end:
+                return found
+            block = source.read(STREAM_BLOCK_SIZE)
+            if not block:
+                at_end = True
+            buffer += block
+
+    def find(needle, start):
+        at = buffer.find(needle, start)
+        return None if at < 0 else at
+
+    sheet_data = read_until(lambda: SHEET_DATA_START.search(buffer))
+    root_tag = WORKSHEET_START.search(buffer)
+    if sheet_data is None or sheet_data.group(2) or root_tag is None:
+        return False
+    prefix_xml = buffer[:sheet_data.end()]
+    ns = sheet_data.group(1)
+    root_end = b'</' + root_tag.group(1) + b'worksheet>'
+    row_start = re.compile(b'<' + re.escape(ns) + rb'row\b|</' + re.escape(ns) + rb'sheetData>')
+    row_end = b'</' + ns + b'row>'
+    position = sheet_data.end()
+
+    def rows():
+        # Yields (text before the row, row XML) and finally (text before the end tag, None)
+        nonlocal buffer, position
+        while True:
+            match = read_until(lambda: row_start.search(buffer, position))
+            if match is None:
+                raise ValueError("Worksheet XML ends inside sheetData")
+            before = buffer[position:match.start()]
+            if match.group(0).startswith(b'</'):
+                position = match.start()
+                yield before, None
+                return
+            tag_end = read_until(lambda: find(b'>', match.end()))
+            if tag_end is not None and buffer[tag_end - 1:tag_end] == b'/':
+                end = tag_end + 1
+            else:
+                end = read_until(lambda: find(row_end, tag_end or match.end()))
+                if end is None:
+                    raise ValueError("Worksheet XML ends inside a row")
+                end += len(row_end)
+            row_xml = buffer[match.start():end]
+            position = end
+            yield before, row_xml
+            # Drop what has been handled so the buffer stays small
+            if position > STREAM_BLOCK_SIZE:
+                buffer = buffer[position:]
+                position = 0
+
+    def parse_row(row_xml):
+        wrapper = etree.fromstring(root_tag.group(0) + row_xml + root_end)
+        return wrapper, wrapper[0]
+
+    def serialize_row(wrapper):
+        xml = etree.tostring(wrapper)
+        return xml[xml.index(b'>') + 1:xml.rindex(b'</')]
+
+    row_iterator = rows()
+    first_before, first_row = next(row_iterator)
+    header_row = None
+    if first_row is not None:
+        number = ROW_NUMBER.search(first_row[:first_row.find(b'>') + 1])
+        if number is None or number.group(1) == b'1':
+            header_row = parse_row(first_row)[1]
+    pending, last_column = pending_cells(package, header_row, updates)
+    last_row = max(pending, default=1)
+    new_rows = deque(sorted(pending))  # Row numbers in order, rows missing from the sheet are added
+    prefix = ns.decode('ascii')
+
+    dimension = DIMENSION_REF.search(prefix_xml)
+    if dimension is not None:
+        ref = grown_dimension(dimension.group(2).decode('ascii'), last_column, last_row)
+        if ref is not None:
+            prefix_xml = prefix_xml[:dimension.start(2)] + ref.encode('ascii') + prefix_xml[dimension.end(2):]
+    output.write(prefix_xml)
+
+    def write_missing_rows(before_number):
+        # Rows that only get a 'processed' cell, e.g. blank rows between data rows
+        while new_rows and new_rows[0] < before_number:
+            row_number = new_rows.popleft()
+            if row_number in pending:
+                cells = ''.join(f'<{prefix}c r="{column_letter(column)}{row_number}" t="inlineStr">'
+                                f'<{prefix}is><{prefix}t>{escape(text)}</{prefix}t></{prefix}is></{prefix}c>'
+                                for column, text in sorted(pending.pop(row_number).items()))
+                output.write(f'<{prefix}row r="{row_number}">{cells}</{prefix}row>'.encode('utf-8'))
+
+    row_number = 0
+    for before, row_xml in itertools.chain([(first_before, first_row)], row_iterator):
+        output.write(before)
+        if row_xml is None:
+            write_missing_rows(float('inf'))
+            break
+        number = ROW_NUMBER.search(row_xml[:row_xml.find(b'>') + 1])
+        row_number = int(number.group(1)) if number else row_number + 1  # r is optional
+        write_missing_rows(row_number)
+        if new_rows and new_rows[0] == row_number:
+            new_rows.popleft()
+        if row_number in pending:
+            wrapper, row = parse_row(row_xml)
+            for processed_column, text in sorted(pending.pop(row_number).items()):
+                set_processed_cell(row, row_number, processed_column, text)
+            row_xml = serialize_row(wrapper)
+        output.write(row_xml)
+
+    # The end of sheetData and everything after it
+    output.write(buffer[position:])
+    while True:
+        block = source.read(STREAM_BLOCK_SIZE)
+        if not block:
+            break
+        output.write(block)
+    return True
+
+
+def patch_workbook(source, destination, updates):
+    """Writes a copy of a workbook with the 'processed' cells of the given rows set.
+
+    source and destination are paths or file objects. updates is {row index:
+    filename} with DataFrame row indexes (index 0 is the first row below the
+    header), or {(row index, column name): filename} to set other columns,
+    e.g. the processed column of each template of a fan-out run. Columns the
+    sheet does not have yet are added. Only the XML of the first worksheet is rewritten, a row at a time;
+    every other part, sheet, style and formula is copied unchanged.
+    """
+    with zipfile.ZipFile(source) as package:
+        sheet_part = first_sheet_part(package)
+        with zipfile.ZipFile(destination, 'w') as patched:
+            for info in package.infolist():
+                new_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+                new_info.compress_type = info.compress_type
+                new_info.external_attr = info.external_attr
+                with package.open(info) as member, patched.open(new_info, 'w', force_zip64=info.file_size > 1 << 30) as copy:
+                    if info.filename != sheet_part:
+                        shutil.copyfileobj(member, copy, STREAM_BLOCK_SIZE)
+                        continue
+                    # Rows are written piece by piece, compress them in large blocks
+                    buffered = io.BufferedWriter(copy, STREAM_BLOCK_SIZE)
+                    streamed = patch_sheet_stream(member, buffered, package, updates)
+                    buffered.flush()
+                    buffered.detach()
+                    if not streamed:
+                        copy.write(patch_sheet(package.read(info.filename), package, updates))
+
+
+def patch_processed_cells(workbook_bytes, updates):
+    """Sets the 'processed' cells of a workbook and returns the new workbook bytes (see patch_workbook)."""
+    output = io.BytesIO()
+    patch_workbook(io.BytesIO(workbook_bytes), output, updates)
+    return output.getvalue()
+
+
+def write_processed_cells(path, updates):
+    """Writes {row index: filename} into the 'processed' column of a workbook on disk.
+
+    updates can also set other columns, see patch_workbook.
+
+    The workbook is patched (see patch_workbook) into a temporary file that
+    then replaces it atomically, so running it again after a failure is safe.
+    """
+    path = Path(path)
+    temporary_path = path.with_name(f".{path.name}.tmp")
+    patch_workbook(path, temporary_path, updates)
+    os.replace(temporary_path, path)
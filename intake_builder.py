@@ -0,0 +1,235 @@
+"""Builds one intake workbook from the [placeholders] of many Word templates.
+
+    python intake_builder.py templates/*.docx bundle.zip -o intake.xlsx --workers 4
+
+Templates are scanned in a process pool: the story parts (body, headers,
+footers, foot- and endnotes) of each .docx are parsed once and the text of
+every paragraph is searched with one compiled pattern. Results are cached by
+the SHA-256 of the template, so rescanning a folder only parses the templates
+that changed. The workbook has the union of all placeholders as intake
+columns (plus 'processed') and a second sheet with the placeholder x template
+matrix.
+"""
+import argparse
+import glob
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+from lxml import etree
+
+from template_engine import W_P, paragraph_text_nodes, story_part_names
+
+# [variable] placeholders of the intake templates
+BRACKET_PATTERN = re.compile(r'\[\s*([^\]]+?)\s*\]')
+
+# Bump when the scan changes so cached results are not reused
+SCAN_FORMAT_VERSION = 1
+
+# Below this many templates to scan a process pool costs more than it saves
+POOL_MIN_TEMPLATES = 4
+
+
+def scan_template(template_bytes):
+    """Returns the unique [placeholders] of a .docx in document order."""
+    found = {}
+    with zipfile.ZipFile(io.BytesIO(template_bytes)) as package:
+        for name in story_part_names(package):
+            try:
+                root = etree.fromstring(package.read(name))
+            except KeyError:
+                continue
+            for paragraph in root.iter(W_P):
+                text = ''.join(node.text or '' for node in paragraph_text_nodes(paragraph))
+                if '[' in text:
+                    for match in BRACKET_PATTERN.finditer(text):
+                        found.setdefault(match.group(1), None)
+    return list(found)
+
+
+def scan_entry(template_bytes):
+    # Runs in a worker process; errors are returned so one bad file does not stop the batch
+    try:
+        return scan_template(template_bytes), None
+    except Exception as e:
+        return None, str(e)
+
+
+def expand_templates(files):
+    """Turns (name, bytes) uploads into (name, bytes) templates, unpacking .zip bundles.
+
+    Word lock files (~$...) and macOS metadata in bundles are skipped.
+    """
+    templates = []
+    for name, data in files:
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(data)) as bundle:
+                for info in bundle.infolist():
+                    member = Path(info.filename)
+                    if (info.is_dir() or member.suffix.lower() != '.docx' or member.name.startswith('~$')
+                            or '__MACOSX' in member.parts):
+                        continue
+                    templates.append((f"{name}/{info.filename}", bundle.read(info)))
+        elif not Path(name).name.startswith('~$'):
+            templates.append((name, data))
+    return templates
+
+
+class PlaceholderScanner:
+    """Scans templates for [placeholders], caching the results by template hash.
+
+    Keeps up to max_entries results in memory, least recently used first out;
+    with cache_path they are also saved as JSON between runs. Safe to share
+    between threads (e.g. through st.cache_resource).
+    """
+
+    def __init__(self, workers=None, max_entries=1024, cache_path=None):
+        self.workers = max(1, int(workers or min(4, os.cpu_count() or 1)))
+        self.max_entries = max_entries
+        self.cache_path = Path(cache_path) if cache_path else None
+        self._results = OrderedDict()  # {key: [placeholders]}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if self.cache_path is not None and self.cache_path.exists():
+            try:
+                stored = json.loads(self.cache_path.read_text(encoding='utf-8'))
+                if stored.get('version') == SCAN_FORMAT_VERSION:
+                    self._results.update(stored.get('results', {}))
+            except (ValueError, OSError):
+                pass  # A damaged cache is simply rebuilt
+
+    @staticmethod
+    def key(template_bytes):
+        return hashlib.sha256(template_bytes).hexdigest()
+
+    def scan(self, templates):
+        """Scans (name, bytes) templates and returns {name: [placeholders]} and {name: error}.
+
+        Only templates that are not cached yet are parsed, in a process pool
+        when there are enough of them.
+        """
+        results = {}
+        errors = {}
+        to_scan = OrderedDict()  # {key: [names]}, identical files are scanned once
+        blobs = {}
+        with self._lock:
+            for name, data in templates:
+                key = self.key(data)
+                if key in self._results:
+                    self._results.move_to_end(key)
+                    self.hits += 1
+                    results[name] = list(self._results[key])
+                else:
+                    to_scan.setdefault(key, []).append(name)
+                    blobs[key] = data
+            self.misses += len(to_scan)
+
+        keys = list(to_scan)
+        if len(keys) >= POOL_MIN_TEMPLATES and self.workers > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(keys))) as executor:
+                scanned = list(executor.map(scan_entry, [blobs[key] for key in keys]))
+        else:
+            scanned = [scan_entry(blobs[key]) for key in keys]
+
+        with self._lock:
+            for key, (placeholders, error) in zip(keys, scanned):
+                for name in to_scan[key]:
+                    if error is not None:
+                        errors[name] = error
+                    else:
+                        results[name] = list(placeholders)
+                if error is None:
+                    self._results[key] = placeholders
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        if keys:
+            self.save()
+        # Keep the order the templates were given in
+        ordered = {name: results[name] for name, _ in templates if name in results}
+        return ordered, errors
+
+    def save(self):
+        if self.cache_path is None:
+            return
+        with self._lock:
+            payload = json.dumps({"version": SCAN_FORMAT_VERSION, "results": self._results})
+        temporary_path = self.cache_path.with_name(f".{self.cache_path.name}.{os.getpid()}.tmp")
+        temporary_path.write_text(payload, encoding='utf-8')
+        os.replace(temporary_path, self.cache_path)
+
+
+def placeholder_matrix(results):
+    """DataFrame with one row per placeholder, one column per template ('x' where used) and a count."""
+    placeholders = sorted({name for found in results.values() for name in found})
+    matrix = pd.DataFrame('', index=pd.Index(placeholders, name='placeholder'), columns=list(results))
+    for template_name, found in results.items():
+        matrix.loc[found, template_name] = 'x'
+    matrix.insert(0, 'templates', (matrix == 'x').sum(axis=1))
+    return matrix
+
+
+def build_intake_workbook(results):
+    """Returns the bytes of an intake workbook for {template name: [placeholders]}.
+
+    The first sheet (the one report generation reads) has the union of the
+    placeholders as columns plus 'processed'; the 'Placeholders' sheet shows
+    which template uses which placeholder.
+    """
+    matrix = placeholder_matrix(results)
+    columns = list(matrix.index)
+    if 'processed' not in columns:
+        columns.append('processed')
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        pd.DataFrame(columns=columns).to_excel(writer, sheet_name='Intake', index=False)
+        matrix.reset_index().to_excel(writer, sheet_name='Placeholders', index=False)
+    return output.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build one intake workbook from the [placeholders] of many Word templates.")
+    parser.add_argument("templates", nargs="+", help="Template files, .zip bundles of templates or glob patterns")
+    parser.add_argument("-o", "--output", default="intake_template.xlsx", help="Workbook to write (default: intake_template.xlsx)")
+    parser.add_argument("--workers", type=int, default=None, help="Processes used to scan the templates (default: up to 4)")
+    parser.add_argument("--cache", default=".intake_scan_cache.json", help="File where scan results are kept between runs (default: .intake_scan_cache.json)")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for pattern in args.templates:
+        paths.extend(sorted(glob.glob(pattern, recursive=True)) or [pattern])
+    try:
+        files = [(path, Path(path).read_bytes()) for path in dict.fromkeys(paths)]
+        templates = expand_templates(files)
+    except (OSError, zipfile.BadZipFile) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    if not templates:
+        print("Error: no .docx templates found", file=sys.stderr)
+        return 2
+
+    scanner = PlaceholderScanner(workers=args.workers, cache_path=args.cache)
+    results, errors = scanner.scan(templates)
+    for name, error in errors.items():
+        print(f"[ERROR] Could not scan {name}: {error}")
+    for name, found in results.items():
+        print(f"{name}: {len(found)} placeholders")
+    if results:
+        Path(args.output).write_bytes(build_intake_workbook(results))
+        total = len({name for found in results.values() for name in found})
+        print(f"Saved {args.output} with {total} placeholders from {len(results)} templates "
+              f"(scanned {scanner.misses}, cached {scanner.hits}).")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,11 @@
+import io
+import os
 import pandas as pd
 from docx import Document
-import os
 from pathlib import Path
-from datetime import datetime
+from report_generator import ReportGenerator
+from intake import read_intake, format_columns
+from template_engine import SINGLE_BRACE_PATTERN, load_compiled_template
 
 # Component for loading Excel data
 def load_excel_data_component(excel_file):
@@ -10,7 +13,8 @@ def load_excel_data_component(excel_file):
     if not file_path.exists():
         raise FileNotFoundError(f"Excel file not found at {file_path}")
     
-    df = pd.read_excel(file_path)
+    # Same cell values as report_generator.py, whether a workbook is streamed or loaded at once
+    df = read_intake(file_path)
     df.columns = [col.strip('{}') for col in df.columns]
     if 'processed' not in df.columns:
         df['processed'] = ''
@@ -23,46 +27,31 @@ def load_template_component(template_file):
     if not template_path.exists():
         raise FileNotFoundError(f"Template file not found at {template_path}")
     
-    return Document(template_path)
+    # Parsed once into a compiled template, {column} placeholders with exact column names
+    return load_compiled_template(template_path, pattern=SINGLE_BRACE_PATTERN, ignore_case=False)
 
 # Component for replacing fields in the document
-def replace_fields_component(document, data_row):
-    for paragraph in document.paragraphs:
-        for key, value in data_row.items():
-            str_value = str(value) if pd.notna(value) else ""
-            placeholder = f"{{{key}}}"
-            if placeholder in paragraph.text:
-                paragraph.text = paragraph.text.replace(placeholder, str_value)
-    
-    for table in document.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for key, value in data_row.items():
-                    str_value = str(value) if pd.notna(value) else ""
-                    placeholder = f"{{{key}}}"
-                    if placeholder in cell.text:
-                        cell.text = cell.text.replace(placeholder, str_value)
-    
-    return document
+def replace_fields_component(template, data_row):
+    # Renders one row of load_excel_data_component with a template of load_template_component,
+    # values formatted as in generate_reports_component; returns the report as a python-docx Document
+    formatted = format_columns(pd.DataFrame([dict(data_row)])).iloc[0]
+    report_bytes = template.render({str(key): value for key, value in formatted.items()})
+    return Document(io.BytesIO(report_bytes))
 
 # Component for generating reports
 def generate_reports_component(df, excel_file, template_file):
-    template = load_template_component(template_file)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Reports are rendered one at a time by the compiled template engine of report_generator.py
+    generator = ReportGenerator(input_dir="Inputs", output_dir="Outputs", journal=False)
     processed_count = 0
     
-    for index, row in df.iterrows():
-        if pd.notna(row['processed']) and row['processed'] != '':
-            print(f"Skipping row {index + 1} because 'processed' column is not empty ('{row['processed']}').")
-            continue
-        
-        current_template_doc = load_template_component(template_file)
-        report_doc = replace_fields_component(current_template_doc, row)
-        output_filename = f"report_{timestamp}_{index + 1}.docx"
+    already_processed = df['processed'].notna() & (df['processed'] != '')
+    for index, processed in df.loc[already_processed, 'processed'].items():
+        print(f"Skipping row {index + 1} because 'processed' column is not empty ('{processed}').")
+    
+    for index, output_filename, report_bytes in generator.iter_reports(df, template_file):
         output_path = Path(os.path.abspath("Outputs")) / output_filename
         
-        report_doc.save(output_path)
+        output_path.write_bytes(report_bytes)
         print(f"Generated report file: {output_path}")
         processed_count += 1
         
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+from collections import deque
+from datetime import datetime
+
+
+class ThrottledLogSink:
+    """Log and progress output for the report generation loop.
+
+    The areas are Streamlit elements or anything with the same code(), info()
+    and progress() methods, such as a background ReportJob. Log lines and progress updates are collected and pushed to the page at most
+    once per interval seconds, so UI traffic grows with run time instead of with
+    rows squared. The page shows the last max_lines lines; the full log is
+    appended to a temporary file (path) that can be offered as a download.
+    """
+
+    def __init__(self, log_area, status_area=None, progress_bar=None, interval=0.5, max_lines=200, path=None):
+        self.log_area = log_area
+        self.status_area = status_area
+        self.progress_bar = progress_bar
+        self.interval = interval
+        self.recent = deque(maxlen=max_lines)
+        if path is None:
+            handle, self.path = tempfile.mkstemp(prefix="report_log_", suffix=".txt")
+            self._file = os.fdopen(handle, 'w', encoding='utf-8')
+        else:
+            self.path = str(path)
+            self._file = open(self.path, 'w', encoding='utf-8')
+        self.line_count = 0
+        self._last_flush = 0.0
+        self._log_dirty = False
+        self._progress = None
+        self._shown_progress = None
+        self._status = None
+        self._shown_status = None
+
+    def log(self, message):
+        """Adds a timestamped line to the log."""
+        line = f"{datetime.now().strftime('%H:%M:%S')} - {message}"
+        self.recent.append(line)
+        self._file.write(line + "\n")
+        self.line_count += 1
+        self._log_dirty = True
+        self._maybe_flush()
+
+    def progress(self, percent, status=None):
+        """Records the current progress (0-100) and an optional status message."""
+        self._progress = percent
+        if status is not None:
+            self._status = status
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """Pushes pending log lines and progress to the page now."""
+        self._last_flush = time.monotonic()
+        if self._log_dirty:
+            hidden = self.line_count - len(self.recent)
+            header = [f"... {hidden} earlier lines are in the full log"] if hidden > 0 else []
+            self.log_area.code("\n".join(header + list(self.recent)), language="")
+            self._log_dirty = False
+        if self.progress_bar is not None and self._progress is not None and self._progress != self._shown_progress:
+            self.progress_bar.progress(self._progress)
+            self._shown_progress = self._progress
+        if self.status_area is not None and self._status is not None and self._status != self._shown_status:
+            self.status_area.info(self._status)
+            self._shown_status = self._status
+
+    def close(self):
+        """Flushes the page and finishes the full log file."""
+        self.flush()
+        if not self._file.closed:
+            self._file.close()
+
+    def read_full_log(self):
+        """Returns the complete log as bytes for a download button."""
+        if not self._file.closed:
+            self._file.flush()
+        with open(self.path, 'rb') as log_file:
+            return log_file.read()
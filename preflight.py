@@ -0,0 +1,111 @@
+import re
+
+from template_engine import build_column_index
+
+# Names that only differ in these characters (and in case) are near misses
+LOOSE_NAME_PATTERN = re.compile(r'[\s_]+')
+
+
+def is_tracking_column(column):
+    # 'processed' and the processed_<template> columns of fan-out runs
+    return str(column) == 'processed' or str(column).startswith('processed_')
+
+
+def loose_name(name):
+    return LOOSE_NAME_PATTERN.sub('', str(name)).lower()
+
+
+class PreflightError(ValueError):
+    """Raised when the pre-flight check finds the workbook cannot fill the template."""
+
+    def __init__(self, report, message):
+        super().__init__(message)
+        self.report = report
+
+
+class PreflightReport:
+    """Compatibility of a compiled template with the columns of an intake workbook.
+
+    Built from the template's placeholder inventory and the header row only
+    (see intake.read_header), so it takes milliseconds however many rows the
+    workbook has and runs before any row is read or rendered.
+    """
+
+    def __init__(self, template, columns):
+        columns = list(columns)
+        self.placeholders = template.placeholders
+        column_index, self.collisions = build_column_index(columns, template.normalize)
+        bound, self.missing_placeholders = template.bind_columns(column_index)
+        self.matched = len(bound)
+
+        # Columns no placeholder uses; losing columns of a collision are listed there instead
+        used = set(bound.values())
+        self.unused_columns = [str(column) for position, column in enumerate(columns)
+                               if position not in used and column_index.get(template.normalize(column)) == position
+                               and not is_tracking_column(column)]
+
+        # Missing placeholders that only differ from a column in case, spaces or underscores
+        loose_columns = {}
+        for column in columns:
+            loose_columns.setdefault(loose_name(column), str(column))
+        self.suggestions = {name: loose_columns[loose_name(name)] for name in self.missing_placeholders
+                            if loose_name(name) in loose_columns}
+
+        # Placeholders written in several ways that still fill from one column
+        spellings = {}
+        for name, original in template.slots:
+            spellings.setdefault(name, {}).setdefault(original, None)
+        self.placeholder_variants = {name: list(texts) for name, texts in spellings.items() if len(texts) > 1}
+
+        self.split_placeholders = list(template.split_placeholders)
+
+    @property
+    def blocking(self):
+        """True when the template has placeholders and none of them matches a column."""
+        return bool(self.placeholders) and self.matched == 0
+
+    def check(self, strict=False):
+        """Raises PreflightError when the workbook cannot fill the template (with strict, any missing column)."""
+        if self.blocking:
+            raise PreflightError(self, f"Pre-flight check failed: none of the {len(self.placeholders)} placeholders "
+                                       f"of the template matches a column of the workbook")
+        if strict and self.missing_placeholders:
+            raise PreflightError(self, f"Pre-flight check failed: placeholders without a matching column: "
+                                       f"{', '.join(self.missing_placeholders)}")
+
+    def messages(self):
+        """Returns the findings as (level, text) with level 'error', 'warning' or 'info'."""
+        messages = []
+        if self.blocking:
+            messages.append(("error", f"None of the {len(self.placeholders)} placeholders of the template matches a "
+                                      f"column; every report would keep its placeholders."))
+        if self.missing_placeholders:
+            messages.append(("warning", f"Placeholders without a matching column (left unchanged): "
+                                        f"{', '.join(self.missing_placeholders)}"))
+        for name, column in self.suggestions.items():
+            messages.append(("warning", f"Placeholder '{name}' has no column, but column '{column}' only differs "
+                                        f"in case, spaces or underscores."))
+        for name, columns in self.collisions.items():
+            messages.append(("warning", f"Columns {', '.join(repr(str(column)) for column in columns)} all match "
+                                        f"'{name}', using '{columns[0]}'."))
+        for name, texts in self.placeholder_variants.items():
+            messages.append(("info", f"Placeholder '{name}' is written in several ways: {', '.join(texts)}"))
+        if self.split_placeholders:
+            messages.append(("info", f"Placeholders split across runs by Word (filled in with the formatting of "
+                                     f"their first run): {', '.join(self.split_placeholders)}"))
+        if self.unused_columns:
+            messages.append(("info", f"Columns not used by the template: {', '.join(self.unused_columns)}"))
+        return messages
+
+    def to_dict(self):
+        return {
+            "placeholders": len(self.placeholders),
+            "matched": self.matched,
+            "blocking": self.blocking,
+            "missing_placeholders": self.missing_placeholders,
+            "suggestions": self.suggestions,
+            "unused_columns": self.unused_columns,
+            "collisions": self.collisions,
+            "placeholder_variants": self.placeholder_variants,
+            "split_placeholders": self.split_placeholders,
+        }
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+
+class RenderCache:
+    """On-disk cache of rendered reports, keyed by the template and the row values.
+
+    The key is a SHA-256 of the template bytes plus the row's normalized values,
+    so identical rows (duplicates, re-submissions, re-runs after a crash) reuse
+    the stored report instead of rendering it again. Entries are evicted least
+    recently used first once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Current size of the cache, kept up to date by put() and evict()
+        self.total_bytes = sum(path.stat().st_size for path in self.directory.glob('*.docx'))
+
+    @staticmethod
+    def key(template_hash, values):
+        """Returns the cache key of a row: {placeholder: formatted value} for a template hash."""
+        digest = hashlib.sha256(template_hash.encode('utf-8'))
+        digest.update(json.dumps(values, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return self.directory / f"{key}.docx"
+
+    def get_path(self, key):
+        """Returns the path of a cached report (marking it recently used) or None."""
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def get(self, key):
+        """Returns the bytes of a cached report or None."""
+        path = self.get_path(key)
+        return path.read_bytes() if path is not None else None
+
+    def put(self, key, data):
+        """Stores report bytes under a key."""
+        self._store(key, lambda temporary_path: temporary_path.write_bytes(data))
+
+    def put_file(self, key, source_path):
+        """Stores a report file that was already written to disk."""
+        self._store(key, lambda temporary_path: shutil.copyfile(source_path, temporary_path))
+
+    def _store(self, key, write):
+        path = self.path(key)
+        if path.exists():
+            return
+        # Write to a temporary name first so a crash never leaves a partial entry
+        temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        write(temporary_path)
+        os.replace(temporary_path, path)
+        self.total_bytes += path.stat().st_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for path in self.directory.glob('*.docx'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= size
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import zipfile
+
+
+class ReportArchive:
+    """ZIP of generated reports, written to a temporary file while the reports are rendered.
+
+    Only the filenames are kept in memory. The .docx members are stored without
+    compression because a .docx is already a deflated zip.
+    """
+
+    def __init__(self, directory=None, path=None):
+        if path is None:
+            handle, self.path = tempfile.mkstemp(prefix="reports_", suffix=".zip", dir=directory)
+            self._file = os.fdopen(handle, 'w+b')
+        else:
+            self.path = str(path)
+            self._file = open(self.path, 'w+b')
+        self._zip = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_STORED)
+        self.names = []
+
+    @classmethod
+    def open_existing(cls, path):
+        """Returns a (closed) archive for a finished ZIP file, e.g. one written by a background job."""
+        archive = cls.__new__(cls)
+        archive.path = str(path)
+        archive._file = None
+        archive._zip = None
+        with zipfile.ZipFile(archive.path) as existing:
+            archive.names = existing.namelist()
+        return archive
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def closed(self):
+        return self._zip is None
+
+    def add(self, filename, data):
+        """Appends one report to the archive."""
+        self._zip.writestr(filename, data, compress_type=zipfile.ZIP_STORED)
+        self.names.append(filename)
+
+    def close(self):
+        """Writes the central directory, after which the archive can be downloaded."""
+        if self._zip is not None:
+            self._zip.close()
+            self._file.close()
+            self._zip = None
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def open(self):
+        """Opens the finished ZIP file for reading."""
+        self.close()
+        return open(self.path, 'rb')
+
+    def read_all(self):
+        """Returns the bytes of the whole finished ZIP file."""
+        with self.open() as archive_file:
+            return archive_file.read()
+
+    def read(self, filename):
+        """Returns the bytes of a single report from the finished archive."""
+        self.close()
+        with zipfile.ZipFile(self.path) as archive:
+            return archive.read(filename)
+
+    def read_many(self, filenames):
+        """Yields (filename, bytes) for several reports, opening the archive once."""
+        self.close()
+        with zipfile.ZipFile(self.path) as archive:
+            for filename in filenames:
+                yield filename, archive.read(filename)
+
+    def delete(self):
+        """Closes the archive and removes the temporary file."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,23 +1,533 @@
 import pandas as pd
-from docx import Document
 import os
+import sys
+import glob
+import json
+import time
+import argparse
+import contextlib
+import io
+import itertools
+import shutil
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
+from template_engine import SINGLE_BRACE_PATTERN, build_column_index
+from intake import format_columns, StreamingIntakeReader, write_processed_cells, read_header, read_intake
+from preflight import PreflightReport, PreflightError
+from render_cache import RenderCache
+from checkpoint_journal import CheckpointJournal
+from template_library import TemplateLibrary
+from stage_timer import StageTimer, profiled
+
+# Compiled templates of a worker process by content hash, set once by init_render_worker
+_worker_templates = {}
+# Routed templates a worker compiled itself, least recently used first out (see worker_template)
+_worker_pool = OrderedDict()
+_worker_settings = {"pool_size": 16, "library": None}
+
+# Column whose value names the template of a row (see TemplateRouter)
+TEMPLATE_COLUMN = 'template'
+
+def init_render_worker(templates, pool_size=16, template_cache_dir=None):
+    _worker_templates.clear()
+    for template in templates:
+        _worker_templates[template.sha256] = template
+    _worker_pool.clear()
+    _worker_settings["pool_size"] = max(1, pool_size)
+    # Shares the parent's template cache directory, so routed templates are loaded from the store instead of parsed
+    _worker_settings["library"] = TemplateLibrary(max_entries=1, store_dir=template_cache_dir)
+
+def worker_template(template_key, source=None):
+    """The compiled template of a worker process by content hash.
+
+    Templates the worker was not started with (routed rows) are compiled from
+    source, their path or bytes, on first use and kept in a pool of at most
+    pool_size templates.
+    """
+    template = _worker_templates.get(template_key)
+    if template is not None:
+        return template
+    template = _worker_pool.get(template_key)
+    if template is None:
+        if source is None:
+            raise KeyError(f"template {template_key[:12]} is not loaded in this worker")
+        library = _worker_settings["library"] or TemplateLibrary(max_entries=1)
+        if isinstance(source, bytes):
+            template = library.get(source, pattern=SINGLE_BRACE_PATTERN, ignore_case=False)
+        else:
+            template = library.get_file(source, pattern=SINGLE_BRACE_PATTERN, ignore_case=False)
+        _worker_pool[template_key] = template
+        while len(_worker_pool) > _worker_settings["pool_size"]:
+            _worker_pool.popitem(last=False)
+    _worker_pool.move_to_end(template_key)
+    return template
+
+def route_name(value):
+    """What a template column value is matched on: the file name without .docx, in lower case."""
+    name = Path(str(value).strip()).name
+    if name.lower().endswith('.docx'):
+        name = name[:-len('.docx')]
+    return name.lower()
+
+def route_column_position(columns, route_column=TEMPLATE_COLUMN):
+    """Position of the template column in columns (matched case-insensitively), None without one."""
+    if not route_column:
+        return None
+    for position, column in enumerate(columns):
+        if str(column).strip().lower() == route_column.lower():
+            return position
+    return None
+
+def processed_column(name):
+    """Column that tracks the reports of template name in a fan-out run."""
+    return f"processed_{name}"
+
+def template_name(template_file):
+    """Name of a template in a fan-out run: its file name without the extension."""
+    return Path(template_file).stem
+
+def row_label(row_key):
+    # "row 3" for a row index, "row 3 (processed_letter)" for a fan-out row key
+    if isinstance(row_key, tuple):
+        return f"row {row_key[0] + 1} ({row_key[1]})"
+    return f"row {row_key + 1}"
+
+def processed_cell(row_key):
+    """(row index, column) of the processed cell of a row key, e.g. for df.loc."""
+    return row_key if isinstance(row_key, tuple) else (row_key, 'processed')
+
+def processed_mask(df, column):
+    """True for the rows of df whose processed column is filled (False everywhere if df lacks it)."""
+    if column not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df[column].notna() & (df[column].astype(str) != '')
+
+def render_rows(template, output_dir, rows, timer=None):
+    """Renders (index, filename, values) rows to output_dir, yielding (index, filename, error)."""
+    timer = timer or StageTimer()
+    for index, output_filename, values in rows:
+        try:
+            with timer.time("render"):
+                report_bytes = template.render(values)
+            with timer.time("write_report"):
+                (Path(output_dir) / output_filename).write_bytes(report_bytes)
+            yield index, output_filename, None
+        except Exception as e:
+            yield index, output_filename, str(e)
+
+def render_chunk(output_dir, rows, template_key, source=None):
+    # Runs in a worker process with the templates loaded by init_render_worker
+    timer = StageTimer()
+    results = list(render_rows(worker_template(template_key, source), output_dir, rows, timer))
+    return results, timer.samples()
+
+def render_report_chunk(rows, template_key, source=None):
+    # Runs in a worker process, returns the report bytes instead of writing files
+    template = worker_template(template_key, source)
+    results = []
+    for index, output_filename, values in rows:
+        try:
+            results.append((index, output_filename, template.render(values), None))
+        except Exception as e:
+            results.append((index, output_filename, None, str(e)))
+    return results
+
+class ReportStream:
+    """Reports of a workbook, rendered one row at a time while iterating.
+
+    Iterating yields (row key, filename, report bytes) for every row whose
+    'processed' cell is empty, where the row key is the DataFrame row index
+    (as used by write_processed_cells). source is a DataFrame, a workbook path,
+    workbook bytes or a file object; workbooks are streamed chunk_size rows at
+    a time and values are formatted one chunk at a time, so memory does not
+    grow with the number of rows. With an executor from
+    ReportGenerator.create_executor at most lookahead tasks of a few rows are
+    rendered ahead of the consumer. A row that fails to render is passed to
+    on_error(row key, filename, error) and left out.
+
+    Call start() to read the header (columns, missing_placeholders,
+    collisions) before rendering; total_rows and skipped_rows are complete
+    once the stream is exhausted.
+    """
+
+    def __init__(self, source, template, chunk_size=1000, column_formats=None, report_prefix="report",
+                 timestamp=None, executor=None, lookahead=4, timer=None, on_error=None):
+        self.source = source
+        self.template = template
+        self.chunk_size = max(1, int(chunk_size))
+        self.column_formats = column_formats or {}
+        self.report_prefix = report_prefix
+        self.timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.executor = executor
+        self.lookahead = max(1, int(lookahead))
+        self.timer = timer or StageTimer()
+        self.on_error = on_error or (lambda index, filename, error: print(f"[ERROR] Failed to generate report for {row_label(index)}: {error}"))
+        self.processed_columns = ['processed']
+        self.columns = None
+        self.bound_columns = None
+        self.missing_placeholders = []
+        self.collisions = {}
+        self.expected_rows = None
+        self.total_rows = 0
+        self.skipped_rows = 0
+        self.failed = 0
+        self._reader = None
+        self._chunks = None
+        self._first = None
+
+    def _read_chunks(self):
+        if isinstance(self.source, pd.DataFrame):
+            df = self.source
+            already_processed = pd.Series(True, index=df.index)
+            for column in self.processed_columns:
+                already_processed &= processed_mask(df, column)
+            self.expected_rows = self.total_rows = len(df)
+            self.skipped_rows = int(already_processed.sum())
+            pending = df[~already_processed]
+            for start in range(0, len(pending), self.chunk_size):
+                yield pending.iloc[start:start + self.chunk_size]
+            return
+        source = io.BytesIO(self.source) if isinstance(self.source, bytes) else self.source
+        self._reader = StreamingIntakeReader(source, chunk_size=self.chunk_size,
+                                             processed_columns=self.processed_columns)
+        chunks = iter(self._reader)
+        while True:
+            with self.timer.time("load_workbook"):
+                chunk = next(chunks, None)
+            self.expected_rows = self._reader.expected_rows
+            self.total_rows = self._reader.total_rows
+            self.skipped_rows = self._reader.skipped_rows
+            if chunk is None:
+                return
+            yield chunk
+
+    def start(self):
+        """Reads the header and first chunk and binds the placeholders to the columns."""
+        if self._chunks is None:
+            self._chunks = self._read_chunks()
+            self._first = next(self._chunks, None)
+            if self._first is not None:
+                columns = list(self._first.columns)
+            elif isinstance(self.source, pd.DataFrame):
+                columns = list(self.source.columns)
+            else:
+                columns = list(self._reader.columns or [])
+            self.columns = columns
+            self._bind_columns(columns)
+        return self
+
+    def _bind_columns(self, columns):
+        column_index, self.collisions = build_column_index(columns, self.template.normalize)
+        self.bound_columns, self.missing_placeholders = self.template.bind_columns(column_index)
+
+    def _formatted_chunks(self):
+        # Yields (chunk, formatted chunk), every value is formatted once
+        self.start()
+        chunk, self._first = self._first, None
+        while chunk is not None:
+            with self.timer.time("format_values"):
+                formatted = format_columns(chunk, self.column_formats)
+            yield chunk, formatted
+            chunk = next(self._chunks, None)
+
+    def template_for(self, row_key):
+        """The compiled template a row key is rendered with."""
+        return self.template
+
+    def template_source(self, template):
+        """Path or bytes worker processes compile template from, None if they were started with it."""
+        return None
+
+    def report_filename(self, index, row):
+        """Filename of the report of a row, given its row index and formatted values."""
+        return f"{self.report_prefix}_{self.timestamp}_{index + 1}.docx"
+
+    def batches(self):
+        """Yields the rows to render one chunk at a time, as lists of (row key, filename, values)."""
+        for _, formatted in self._formatted_chunks():
+            yield [(index, self.report_filename(index, row),
+                    {name: row[position] for name, position in self.bound_columns.items()})
+                   for index, row in zip(formatted.index, formatted.itertuples(index=False, name=None))]
+
+    def __iter__(self):
+        if self.executor is not None:
+            yield from self._render_parallel()
+            return
+        for rows in self.batches():
+            for index, output_filename, values in rows:
+                try:
+                    with self.timer.time("render"):
+                        report_bytes = self.template_for(index).render(values)
+                except Exception as e:
+                    self.failed += 1
+                    self.on_error(index, output_filename, str(e))
+                    continue
+                yield index, output_filename, report_bytes
+
+    def _render_parallel(self):
+        # Small tasks keep the lookahead (and the reports held in memory) small
+        task_size = 8
+        pending = deque()
+
+        def tasks():
+            # Each task renders rows of one template
+            for rows in self.batches():
+                for template, group in itertools.groupby(rows, key=lambda row: self.template_for(row[0])):
+                    group = list(group)
+                    source = self.template_source(template)
+                    for start in range(0, len(group), task_size):
+                        yield group[start:start + task_size], template.sha256, source
+
+        try:
+            for task, template_key, source in tasks():
+                pending.append(self.executor.submit(render_report_chunk, task, template_key, source))
+                while len(pending) >= self.lookahead:
+                    yield from self._task_results(pending.popleft())
+            while pending:
+                yield from self._task_results(pending.popleft())
+        finally:
+            # The consumer stopped early, drop the tasks that have not started
+            for future in pending:
+                future.cancel()
+
+    def _task_results(self, future):
+        for index, output_filename, report_bytes, error in future.result():
+            if error is not None:
+                self.failed += 1
+                self.on_error(index, output_filename, error)
+                continue
+            yield index, output_filename, report_bytes
+
+class FanOutStream(ReportStream):
+    """Reports of several templates for every row of one workbook.
+
+    templates is {name: CompiledTemplate}. Each chunk of rows is read and
+    formatted once and then rendered with every template whose processed
+    column (processed_column(name)) is still empty, one template after the
+    other. Row keys are (row index, processed column) pairs, as accepted by
+    write_processed_cells, and reports are named
+    {report_prefix}_{name}_{timestamp}_{row}.docx. bound_columns,
+    missing_placeholders and collisions are dictionaries by template name.
+    """
+
+    def __init__(self, source, templates, **options):
+        super().__init__(source, None, **options)
+        self.templates = dict(templates)
+        self.processed_columns = [processed_column(name) for name in self.templates]
+        self._templates_by_column = dict(zip(self.processed_columns, self.templates.values()))
+
+    def _bind_columns(self, columns):
+        self.bound_columns = {}
+        self.missing_placeholders = {}
+        self.collisions = {}
+        for name, template in self.templates.items():
+            column_index, self.collisions[name] = build_column_index(columns, template.normalize)
+            self.bound_columns[name], self.missing_placeholders[name] = template.bind_columns(column_index)
+
+    def template_for(self, row_key):
+        return self._templates_by_column[row_key[1]]
+
+    def batches(self):
+        """Yields the rows to render one chunk at a time, grouped by template, as lists of (row key, filename, values)."""
+        for chunk, formatted in self._formatted_chunks():
+            rows = list(formatted.itertuples(index=False, name=None))
+            batch = []
+            for name, column in zip(self.templates, self.processed_columns):
+                bound_columns = self.bound_columns[name].items()
+                pending = ~processed_mask(chunk, column)
+                batch.extend(((index, column), f"{self.report_prefix}_{name}_{self.timestamp}_{index + 1}.docx",
+                              {placeholder: row[position] for placeholder, position in bound_columns})
+                             for index, row, todo in zip(formatted.index, rows, pending) if todo)
+            yield batch
+
+class TemplateRouter:
+    """Resolves the values of a workbook's template column to compiled templates.
+
+    files are (file name, path or bytes) pairs, e.g. the .docx files of the
+    input directory or of an uploaded bundle. A row names its template by
+    file name, with or without .docx and in any case. compile turns a path
+    or bytes into a CompiledTemplate, normally through a TemplateLibrary,
+    whose bounded LRU pool keeps only the templates in use compiled. sources
+    maps the hash of each template resolved so far to its path or bytes, for
+    worker processes that were not started with it.
+    """
+
+    def __init__(self, files, compile):
+        self.compile = compile
+        self.files = {}  # {route name: (template name, path or bytes)}
+        self.ambiguous = set()
+        for file_name, source in files:
+            key = route_name(file_name)
+            if key in self.files:
+                self.ambiguous.add(key)
+            self.files.setdefault(key, (template_name(file_name), source))
+        self.sources = {}
+
+    @classmethod
+    def from_directory(cls, directory, compile):
+        """Router for the .docx templates of a directory (Word lock files are skipped)."""
+        paths = sorted(path for path in Path(directory).glob('*.docx') if not path.name.startswith('~$'))
+        return cls([(path.name, path) for path in paths], compile)
+
+    def resolve(self, value):
+        """Returns (template name, compiled template) for a template column value.
+
+        Raises ValueError when no template, or more than one, has that name.
+        """
+        key = route_name(value)
+        if key in self.ambiguous:
+            raise ValueError(f"several templates are named '{value}'")
+        if key not in self.files:
+            raise ValueError(f"no template named '{value}'")
+        name, source = self.files[key]
+        template = self.compile(source)
+        self.sources[template.sha256] = source
+        return name, template
+
+class RoutedStream(ReportStream):
+    """Reports of a workbook whose rows name their template in a template column.
+
+    router is a TemplateRouter. Rows with an empty template cell use
+    template (the default template, may be None, reported as default_name).
+    The rows of each chunk are grouped by template, so each template is
+    bound once and every worker task renders with one template. Reports of
+    routed rows are named {report_prefix}_{name}_{timestamp}_{row}.docx; the
+    row keys and the 'processed' column are those of ReportStream.
+
+    Each template is checked against the header (PreflightReport) when a row
+    first uses it; preflight, missing_placeholders and collisions are
+    dictionaries by template name, routed_rows counts the rows of each.
+    Rows whose template is unknown or fails the check go to on_error.
+    """
+
+    def __init__(self, source, template, router, route_column=TEMPLATE_COLUMN, default_name="default",
+                 strict=False, **options):
+        super().__init__(source, template, **options)
+        self.router = router
+        self.route_column = route_column
+        self.default_name = default_name
+        self.strict = strict
+        self.route_position = None
+        self.preflight = {}
+        self.routed_rows = {}
+        self._bindings = {}  # {template name: (bound columns, error of the pre-flight check)}
+        self._row_templates = {}
+
+    def _bind_columns(self, columns):
+        # Templates are bound when a row first uses them
+        self.route_position = route_column_position(columns, self.route_column)
+        self.bound_columns = {}
+        self.missing_placeholders = {}
+        self.collisions = {}
+
+    def _bind_template(self, name, template):
+        if name not in self._bindings:
+            column_index, self.collisions[name] = build_column_index(self.columns, template.normalize)
+            self.bound_columns[name], self.missing_placeholders[name] = template.bind_columns(column_index)
+            route_column = self.columns[self.route_position] if self.route_position is not None else None
+            report = PreflightReport(template, [column for column in self.columns if column != route_column])
+            self.preflight[name] = report
+            try:
+                report.check(self.strict)
+                self._bindings[name] = (self.bound_columns[name], None)
+            except PreflightError as e:
+                self._bindings[name] = (None, f"{e} ({name})")
+        return self._bindings[name]
+
+    def _resolve(self, route):
+        # (name, template, bound columns, error) of a template column value
+        try:
+            if route.strip():
+                name, template = self.router.resolve(route)
+            elif self.template is not None:
+                name, template = None, self.template
+            else:
+                raise ValueError(f"the '{self.route_column}' cell is empty and there is no default template")
+        except ValueError as e:
+            return None, None, None, str(e)
+        bound_columns, error = self._bind_template(name or self.default_name, template)
+        return name, template, bound_columns, error
+
+    def template_for(self, row_key):
+        return self._row_templates[row_key]
+
+    def template_source(self, template):
+        return self.router.sources.get(template.sha256)
+
+    def batches(self):
+        """Yields the rows to render one chunk at a time, grouped by template, as lists of (row key, filename, values)."""
+        for _, formatted in self._formatted_chunks():
+            rows = formatted.itertuples(index=False, name=None)
+            if self.route_position is not None:
+                routes = formatted.iloc[:, self.route_position]
+            else:
+                routes = itertools.repeat('')
+            resolved = {}  # {template column value: _resolve result}, once per chunk
+            groups = {}  # {template name: rows}, in the order the chunk first uses them
+            self._row_templates = {}
+            for index, route, row in zip(formatted.index, routes, rows):
+                if route not in resolved:
+                    resolved[route] = self._resolve(route)
+                name, template, bound_columns, error = resolved[route]
+                if name is None:
+                    output_filename = f"{self.report_prefix}_{self.timestamp}_{index + 1}.docx"
+                else:
+                    output_filename = f"{self.report_prefix}_{name}_{self.timestamp}_{index + 1}.docx"
+                if error is not None:
+                    self.failed += 1
+                    self.on_error(index, output_filename, error)
+                    continue
+                name = name or self.default_name
+                self.routed_rows[name] = self.routed_rows.get(name, 0) + 1
+                self._row_templates[index] = template
+                groups.setdefault(name, []).append(
+                    (index, output_filename, {placeholder: row[position] for placeholder, position in bound_columns.items()}))
+            yield [row for group in groups.values() for row in group]
 
 class ReportGenerator:
-    def __init__(self, input_dir="Inputs", output_dir="Outputs"):
+    def __init__(self, input_dir="Inputs", output_dir="Outputs", workers=1, column_formats=None, chunk_size=1000,
+                 cache_dir=None, cache_max_bytes=512 * 1024 * 1024, template_cache_dir=None, journal=True,
+                 strict=False, template_dir=None, template_pool_size=16, route_column=TEMPLATE_COLUMN):
         self.input_dir = Path(os.path.abspath(input_dir))
         self.output_dir = Path(os.path.abspath(output_dir))
+        # Where the templates named in a workbook's template column are looked up (see TemplateRouter)
+        self.template_dir = Path(os.path.abspath(template_dir)) if template_dir else self.input_dir
+        # None or '' turns routing off, the column is then an ordinary column
+        self.route_column = route_column or None
+        self.workers = max(1, int(workers or 1))
+        # Rows held in memory at a time when the workbook is streamed (generate_reports with df=None)
+        self.chunk_size = max(1, int(chunk_size))
+        # Optional {column: format spec} applied when values are formatted, see intake.format_column
+        self.column_formats = column_formats or {}
         
         self.input_dir.mkdir(exist_ok=True)
         self.output_dir.mkdir(exist_ok=True)
 
+        # Compiled templates by content hash, at most template_pool_size in memory, persisted to template_cache_dir if given
+        self.template_library = TemplateLibrary(max_entries=max(1, int(template_pool_size)), store_dir=template_cache_dir)
+
+        # Optional content-addressed cache of rendered reports (see render_cache.py)
+        self.render_cache = RenderCache(cache_dir, cache_max_bytes) if cache_dir else None
+
+        # Wall and CPU time per stage, replace it with a new StageTimer to time runs separately
+        self.timer = StageTimer()
+
+        # Record completed rows in a checkpoint journal next to the reports, so interrupted runs resume
+        self.journal = journal
+
+        # Refuse to render when a placeholder has no column, not only when none has (see preflight.py)
+        self.strict = strict
+
     def load_excel_data(self, excel_file):
         file_path = self.input_dir / excel_file
         if not file_path.exists():
             raise FileNotFoundError(f"Excel file not found at {file_path}")
         
-        df = pd.read_excel(file_path)
+        with self.timer.time("load_workbook"):
+            # The cell values the streamed path reads, so both render the same text
+            df = read_intake(file_path)
         df.columns = [col.strip('{}') for col in df.columns]
         if 'processed' not in df.columns:
             df['processed'] = ''
@@ -25,76 +535,549 @@ class ReportGenerator:
         df['processed'] = df['processed'].astype(str) 
         return df
 
-    def load_template(self, template_file):
+    def load_compiled_template(self, template_file):
         template_path = self.input_dir / template_file
         if not template_path.exists():
             raise FileNotFoundError(f"Template file not found at {template_path}")
-        
-        return Document(template_path)
-
-    def replace_fields(self, document, data_row):
-        for paragraph in document.paragraphs:
-            for key, value in data_row.items():
-                str_value = str(value) if pd.notna(value) else ""
-                placeholder = f"{{{key}}}"
-                if placeholder in paragraph.text:
-                    paragraph.text = paragraph.text.replace(placeholder, str_value)
-        
-        for table in document.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for key, value in data_row.items():
-                        str_value = str(value) if pd.notna(value) else ""
-                        placeholder = f"{{{key}}}"
-                        if placeholder in cell.text:
-                            cell.text = cell.text.replace(placeholder, str_value)
-        
-        return document
 
-    def generate_reports(self, df, excel_file, template_file):
-        template = self.load_template(template_file)
+        # Placeholders are {column} with exact column names
+        return self.template_library.get_file(template_path, pattern=SINGLE_BRACE_PATTERN, ignore_case=False)
+
+    def load_fan_out_templates(self, template_files):
+        """Compiles the templates of a fan-out run, returning {name: template} (see template_name)."""
+        templates = {}
+        for template_file in template_files:
+            name = template_name(template_file)
+            if name in templates:
+                raise ValueError(f"The templates of a run need different file names, '{name}' is used twice")
+            templates[name] = self.load_compiled_template(template_file)
+        return templates
+
+    def load_templates(self, template_file):
+        """Compiles one template file, or {name: template} for a list of them (fan-out).
+
+        Returns None for no template, when the rows name their own (see template_router).
+        """
+        if template_file is None:
+            return None
+        if isinstance(template_file, (list, tuple)):
+            return self.load_fan_out_templates(template_file)
+        return self.load_compiled_template(template_file)
+
+    def compile_template(self, source):
+        """Compiles a template path or bytes through the template library."""
+        if isinstance(source, bytes):
+            return self.template_library.get(source, pattern=SINGLE_BRACE_PATTERN, ignore_case=False)
+        return self.template_library.get_file(source, pattern=SINGLE_BRACE_PATTERN, ignore_case=False)
+
+    def workbook_columns(self, source):
+        """Header of a workbook file name (in input_dir), path, bytes or file object, or a DataFrame's columns."""
+        if isinstance(source, pd.DataFrame):
+            return list(source.columns)
+        if isinstance(source, (str, Path)):
+            return read_header(self.input_dir / source)
+        if isinstance(source, bytes):
+            return read_header(source)
+        position = source.tell()
+        try:
+            return read_header(source)
+        finally:
+            source.seek(position)
+
+    def template_router(self, columns, template=None):
+        """TemplateRouter for the templates of template_dir when columns has the template column.
+
+        Returns None without one, and for fan-out runs ({name: template}),
+        which render every template for each row instead.
+        """
+        if isinstance(template, dict) or route_column_position(columns, self.route_column) is None:
+            return None
+        return TemplateRouter.from_directory(self.template_dir, self.compile_template)
+
+    def open_stream(self, source, template, router=None, default_name="default", **options):
+        """Returns a ReportStream for a compiled template or a FanOutStream for {name: template}.
+
+        With a router it returns a RoutedStream, template is then the default
+        template of the rows that do not name one (may be None).
+        """
+        options.update(chunk_size=self.chunk_size, column_formats=self.column_formats, timer=self.timer)
+        if router is not None:
+            return RoutedStream(source, template, router, route_column=self.route_column,
+                                default_name=default_name, strict=self.strict, **options)
+        if template is None:
+            raise ValueError(f"No template given and the workbook has no '{self.route_column}' column naming one")
+        stream_class = FanOutStream if isinstance(template, dict) else ReportStream
+        return stream_class(source, template, **options)
+
+    def preflight(self, source, template, columns=None):
+        """Checks a template against the header row of a workbook before anything is rendered.
+
+        source is a workbook file name (in input_dir), path, bytes or a
+        DataFrame (or pass its columns if they were read already); template
+        a compiled template, or {name: template} for a fan-out run. Prints the
+        findings and returns the PreflightReport ({name: PreflightReport} for
+        a fan-out run).
+        """
+        with self.timer.time("preflight"):
+            if columns is None:
+                columns = self.workbook_columns(source)
+            if isinstance(template, dict):
+                reports = {name: PreflightReport(compiled, columns) for name, compiled in template.items()}
+            else:
+                reports = {None: PreflightReport(template, columns)}
+        self.print_preflight(reports)
+        return reports if isinstance(template, dict) else reports[None]
+
+    def print_preflight(self, reports):
+        """Prints the findings of {name: PreflightReport}, prefixed with the name unless it is None."""
+        for name, report in reports.items():
+            for level, message in report.messages():
+                print(f"{PREFLIGHT_LABELS[level]}: {f'[{name}] ' if name else ''}{message}")
+
+    def iter_reports(self, source, template, report_prefix="report", executor=None, lookahead=None, on_error=None):
+        """Streams the reports of a workbook, see ReportStream.
+
+        source is a workbook file name (in input_dir) or path, workbook bytes,
+        a file object or a DataFrame from load_excel_data. template is a
+        template file name or path, template bytes or a CompiledTemplate.
+        Returns a ReportStream; iterate it to get (row key, filename, bytes)
+        one report at a time, e.g. to write them to a ZIP or a response. A
+        list of template files (or {name: CompiledTemplate}) returns a
+        FanOutStream that renders every template for each row. A workbook
+        with a template column returns a RoutedStream, template (may be None)
+        is then the default of the rows that leave it empty.
+        """
+        if isinstance(source, (str, Path)):
+            source = self.input_dir / source
+            if not source.exists():
+                raise FileNotFoundError(f"Excel file not found at {source}")
+        if isinstance(template, bytes):
+            template = self.compile_template(template)
+        elif isinstance(template, (str, Path, list, tuple)):
+            with self.timer.time("compile_template"):
+                template = self.load_templates(template)
+        router = self.template_router(self.workbook_columns(source), template)
+        return self.open_stream(source, template, router=router, report_prefix=report_prefix, executor=executor,
+                                lookahead=lookahead or self.workers * 2, on_error=on_error)
+
+    def journal_path(self, excel_file):
+        """Checkpoint journal of a workbook, kept in the output directory."""
+        return self.output_dir / f"{Path(excel_file).stem}.journal.jsonl"
+
+    def create_executor(self, template):
+        """Starts the process pool used for parallel rendering, each worker gets the template once.
+
+        template is a compiled template, or a list of them for a fan-out run.
+        Templates of routed rows are compiled by the workers on first use and
+        kept in a pool as large as the template library's.
+        """
+        templates = list(template) if isinstance(template, (list, tuple)) else [template]
+        templates = [template for template in templates if template is not None]
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_render_worker,
+                                   initargs=(templates, self.template_library.max_entries,
+                                             self.template_library.store_dir))
+
+    def render_parallel(self, executor, rows, template, source=None):
+        """Renders rows in a process pool, yielding results in row order.
+
+        source is the path or bytes of a template the workers were not started with.
+        """
+        # Several chunks per worker keep the pool busy without sending one task per row
+        chunk_size = max(1, min(64, len(rows) // (self.workers * 4)))
+        chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+        for results, samples in executor.map(render_chunk, [self.output_dir] * len(chunks), chunks,
+                                             [template.sha256] * len(chunks), [source] * len(chunks)):
+            self.timer.merge(samples)
+            yield from results
+
+    def render(self, template, rows, executor=None, source=None):
+        """Renders rows serially or in the process pool, yielding (index, filename, error)."""
+        if executor is not None and len(rows) > 1:
+            return self.render_parallel(executor, rows, template, source)
+        return render_rows(template, self.output_dir, rows, self.timer)
+
+    def copy_cached_report(self, index, output_filename, cached_path):
+        # The copy gets the row's own report name, the cache only names files by key
+        try:
+            shutil.copyfile(cached_path, self.output_dir / output_filename)
+            return index, output_filename, None
+        except Exception as e:
+            return index, output_filename, str(e)
+
+    def render_with_cache(self, template, rows, executor=None, source=None):
+        """Renders rows through the render cache, yielding (index, filename, error).
+
+        Every report keeps the filename of its row. Cached reports are copied,
+        identical rows in the same batch are rendered once and copied from the
+        first one.
+        """
+        to_render = []
+        cache_keys = {}  # {filename: cache key} of the rows rendered in this batch
+        rendered = {}  # {cache key: filename of the row that renders it}
+        duplicates = []
+        for index, output_filename, values in rows:
+            with self.timer.time("cache_lookup"):
+                cache_key = RenderCache.key(template.sha256, values)
+                cached_path = None if cache_key in rendered else self.render_cache.get_path(cache_key)
+            if cache_key in rendered:
+                duplicates.append((index, output_filename, cache_key))
+                continue
+            if cached_path is not None:
+                with self.timer.time("copy_cached_report"):
+                    result = self.copy_cached_report(index, output_filename, cached_path)
+                yield result
+                continue
+            cache_keys[output_filename] = cache_key
+            rendered[cache_key] = output_filename
+            to_render.append((index, output_filename, values))
+
+        failed = set()
+        for index, output_filename, error in self.render(template, to_render, executor, source):
+            if error is None:
+                with self.timer.time("cache_store"):
+                    self.render_cache.put_file(cache_keys[output_filename], self.output_dir / output_filename)
+            else:
+                failed.add(cache_keys[output_filename])
+            yield index, output_filename, error
+
+        for index, output_filename, cache_key in duplicates:
+            if cache_key in failed:
+                yield index, output_filename, "the report of an identical row failed"
+                continue
+            with self.timer.time("copy_cached_report"):
+                yield self.copy_cached_report(index, output_filename, self.output_dir / rendered[cache_key])
+
+    def generate(self, df, excel_file, template_file, executor=None, report_prefix="report"):
+        """Generates reports for the rows of df whose 'processed' column is empty.
+
+        Pass df=None to stream the workbook in chunks of chunk_size rows
+        (StreamingIntakeReader) instead of loading it with load_excel_data.
+        An executor from create_executor can be passed to reuse one process pool
+        for several workbooks with the same template. Reports are named
+        {report_prefix}_{timestamp}_{row}.docx. Returns a dict with the counts
+        of the run.
+
+        Completed rows are recorded in a checkpoint journal (see journal_path).
+        Rows journaled by an earlier run that did not update the workbook are
+        not rendered again; they keep their report and are marked in the
+        workbook with the rows of this run, after which the journal is removed.
+
+        The template is checked against the header row first (see preflight);
+        PreflightError is raised before any row is read when the workbook
+        cannot fill it.
+
+        template_file can also be a list of templates (fan-out): the workbook
+        is read, and each row formatted, once for all of them. Each template
+        has its own processed column (processed_column) and its reports are
+        named {report_prefix}_{name}_{timestamp}_{row}.docx.
+
+        When the workbook has a template column (route_column), each row is
+        rendered with the template of template_dir it names, and template_file
+        (may be None) is the default for rows that leave it empty; see
+        RoutedStream. Those reports are named
+        {report_prefix}_{name}_{timestamp}_{row}.docx as well.
+        """
+        # Parse the template once, each row only fills in the placeholder slots
+        with self.timer.time("compile_template"):
+            template = self.load_templates(template_file)
+        templates = template if isinstance(template, dict) else {None: template}
+
+        if df is None and not (self.input_dir / excel_file).exists():
+            raise FileNotFoundError(f"Excel file not found at {self.input_dir / excel_file}")
+        columns = self.workbook_columns(excel_file if df is None else df)
+        router = self.template_router(columns, template)
+        if router is not None:
+            # Each template is checked when a row first uses it, a failing one only fails its rows
+            print(f"Rows are routed by their '{columns[route_column_position(columns, self.route_column)]}' column "
+                  f"to the templates of {self.template_dir}.")
+            preflight = None
+        else:
+            # Only the header row and the placeholder inventory, so bad inputs fail before the batch starts
+            preflight = self.preflight(excel_file if df is None else df, template, columns)
+            preflights = preflight if isinstance(template, dict) else {None: preflight}
+            for name, report in preflights.items():
+                try:
+                    report.check(self.strict)
+                except PreflightError as e:
+                    if name is not None:
+                        raise PreflightError(report, f"{e} ({name})") from None
+                    raise
         
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         processed_count = 0 # Keep track of newly processed reports
+        failed_count = 0
+        resumed_count = 0
+        journal = CheckpointJournal(self.journal_path(excel_file)) if self.journal else None
+        if journal is not None and len(journal):
+            print(f"Resuming from checkpoint journal {journal.path} ({len(journal)} rows).")
+        updates = {} # {row key: output filename}, see write_processed_cells
         
-        for index, row in df.iterrows():
+        if df is None:
+            source = self.input_dir / excel_file
+        elif isinstance(template, dict):
+            already_processed = pd.Series(True, index=df.index)
+            for name in template:
+                already_processed &= processed_mask(df, processed_column(name))
+            for index in df.index[already_processed]:
+                print(f"Skipping row {index + 1} because the processed columns of all templates are filled.")
+            source = df
+        else:
             # More robust check for already processed rows (handles NaN and empty strings)
-            if pd.notna(row['processed']) and row['processed'] != '': 
-                print(f"Skipping row {index + 1} because 'processed' column is not empty ('{row['processed']}').")
-                continue
-            
-            # Create a fresh template instance for each report to avoid cumulative changes
-            current_template_doc = self.load_template(template_file) 
-            report_doc = self.replace_fields(current_template_doc, row)
-            output_filename = f"report_{timestamp}_{index + 1}.docx"
-            output_path = self.output_dir / output_filename
-            
-            report_doc.save(output_path)
-            print(f"Generated report file: {output_path}") # Console output includes filename
-            processed_count += 1
-            
-            try:
-                # Update 'processed' column with the generated filename
-                df.loc[index, 'processed'] = output_filename 
-                # print(f"DEBUG: Set df.loc[{index}, 'processed'] = {output_filename}") # Optional debug print
-            except Exception as e: # Catch potential errors during DataFrame update
-                 print(f"Error updating DataFrame in memory for row {index + 1}: {e}")
+            already_processed = df['processed'].notna() & (df['processed'] != '')
+            for index, processed in df.loc[already_processed, 'processed'].items():
+                print(f"Skipping row {index + 1} because 'processed' column is not empty ('{processed}').")
+            source = df
+        # The same bounded intake as iter_reports: read and format a chunk at a time
+        stream = self.open_stream(source, template, router=router,
+                                  default_name=template_name(template_file) if isinstance(template_file, (str, Path)) else "default",
+                                  report_prefix=report_prefix, timestamp=timestamp)
+        stream.start()
+        reported = set()  # Routed templates whose pre-flight findings were printed
 
-        
+        own_executor = executor is None and self.workers > 1
+        if own_executor:
+            executor = self.create_executor(list(templates.values()))
+        try:
+            for batch in stream.batches():
+                if router is not None:
+                    self.print_preflight({name: report for name, report in stream.preflight.items() if name not in reported})
+                    reported.update(stream.preflight)
+                rows = []
+                row_keys = {}
+                for index, output_filename, values in batch:
+                    if journal is not None:
+                        row_keys[index] = RenderCache.key(stream.template_for(index).sha256, values)
+                        journaled = journal.completed(index, row_keys[index])
+                        if journaled is not None and (self.output_dir / journaled).exists():
+                            # Rendered by an interrupted run, only the workbook still needs the mark
+                            updates[index] = journaled
+                            resumed_count += 1
+                            if df is not None:
+                                df.loc[processed_cell(index)] = journaled
+                            continue
+                    rows.append((index, output_filename, values))
+
+                # Rows come grouped by template, each group is rendered with its template
+                results = itertools.chain.from_iterable(
+                    self.render_with_cache(row_template, list(group), executor, stream.template_source(row_template))
+                    if self.render_cache is not None
+                    else self.render(row_template, list(group), executor, stream.template_source(row_template))
+                    for row_template, group in itertools.groupby(rows, key=lambda row: stream.template_for(row[0])))
+
+                for index, output_filename, error in results:
+                    if error is not None:
+                        print(f"[ERROR] Failed to generate report for {row_label(index)}: {error}")
+                        failed_count += 1
+                        continue
+
+                    output_path = self.output_dir / output_filename
+                    print(f"Generated report file: {output_path}") # Console output includes filename
+                    processed_count += 1
+                    updates[index] = output_filename
+                    if journal is not None:
+                        journal.record(index, output_filename, row_keys[index])
+                    
+                    if df is not None:
+                        try:
+                            # Update 'processed' column with the generated filename
+                            df.loc[processed_cell(index)] = output_filename 
+                            # print(f"DEBUG: Set df.loc[{index}, 'processed'] = {output_filename}") # Optional debug print
+                        except Exception as e: # Catch potential errors during DataFrame update
+                             print(f"Error updating DataFrame in memory for {row_label(index)}: {e}")
+        finally:
+            if own_executor:
+                executor.shutdown()
+            if journal is not None:
+                journal.close()
+
+        # Rows of a routed stream whose template is unknown or failed its check
+        failed_count += stream.failed
+        total_rows = stream.total_rows
+        skipped_count = stream.skipped_rows
+        if df is None and skipped_count:
+            print(f"Skipped {skipped_count} rows because 'processed' column is not empty.")
+
+        save_error = None
         try:
             # Attempt to save all changes back to the Excel file
-            df.to_excel(self.input_dir / excel_file, index=False)
+            # Only the new 'processed' cells are patched, the rest of the workbook is left untouched
+            if updates:
+                with self.timer.time("write_back"):
+                    write_processed_cells(self.input_dir / excel_file, updates)
             print(f"Successfully attempted to save updates to {excel_file}") 
+            if journal is not None:
+                # The workbook now holds every mark of the journal
+                journal.remove()
         except PermissionError:
             # Explicit message if saving fails due to permissions
+            save_error = "permission denied"
             print(f"\n[ERROR] Permission denied: Could not save updates to {excel_file}. Please ensure the file is closed and not open in another program, then run the script again.")
         except Exception as e:
             # Catch other potential saving errors
+            save_error = str(e)
             print(f"\n[ERROR] Failed to save updates to {excel_file}: {e}")
+        if save_error is not None and journal is not None and len(journal):
+            print(f"The completed rows are kept in {journal.path}; the next run or --reconcile marks them in the workbook.")
 
+        if router is not None:
+            preflight = stream.preflight
+        result = {
+            "processed": processed_count,
+            "failed": failed_count,
+            "resumed": resumed_count,
+            "skipped": skipped_count,
+            "total_rows": total_rows,
+            "missing_placeholders": stream.missing_placeholders,
+            "preflight": ({name: report.to_dict() for name, report in preflight.items()}
+                          if isinstance(preflight, dict) else preflight.to_dict()),
+            "save_error": save_error,
+        }
+        if router is not None:
+            result["templates"] = stream.routed_rows
+        return result
+
+    def generate_reports(self, df, excel_file, template_file):
+        """Generates the reports of one workbook and returns a summary message."""
+        result = self.generate(df, excel_file, template_file)
             
         # Return message reflects newly generated reports
-        return f"Processed {processed_count} new reports. Total rows in Excel: {len(df)}."
+        message = f"Processed {result['processed']} new reports. Total rows in Excel: {result['total_rows']}."
+        if result['failed']:
+            message += f" Failed: {result['failed']}."
+        if result['resumed']:
+            message += f" Resumed from the checkpoint journal: {result['resumed']}."
+        if self.render_cache is not None:
+            message += f" Render cache hits: {self.render_cache.hits}."
+        return message
+
+    def plan(self, excel_file, template_file):
+        """Checks a workbook/template pair without rendering (dry run), returning the counts it would process.
+
+        With a list of templates, pending counts the rows that still miss the report of any of them.
+        For a workbook with a template column, templates counts the pending rows of each template.
+        error is set when the job would fail: a template fails the pre-flight check (with strict,
+        any missing column), or rows name no known template.
+        """
+        template = self.load_templates(template_file)
+        excel_path = self.input_dir / excel_file
+        if not excel_path.exists():
+            raise FileNotFoundError(f"Excel file not found at {excel_path}")
+        columns = self.workbook_columns(excel_file)
+        router = self.template_router(columns, template)
+        if router is not None:
+            return self.plan_routes(excel_path, template, router, columns,
+                                    template_name(template_file) if isinstance(template_file, (str, Path)) else "default")
+        preflight = self.preflight(excel_file, template, columns)
+        errors = []
+        for name, report in (preflight.items() if isinstance(template, dict) else [(None, preflight)]):
+            try:
+                report.check(self.strict)
+            except PreflightError as e:
+                errors.append(f"{e} ({name})" if name is not None else str(e))
+        if isinstance(template, dict):
+            processed_columns = [processed_column(name) for name in template]
+            missing = {name: report.missing_placeholders for name, report in preflight.items()}
+            preflight = {name: report.to_dict() for name, report in preflight.items()}
+        else:
+            processed_columns = ['processed']
+            missing = preflight.missing_placeholders
+            preflight = preflight.to_dict()
+        reader = StreamingIntakeReader(excel_path, chunk_size=self.chunk_size, processed_columns=processed_columns)
+        pending_rows = sum(len(chunk) for chunk in reader)
+        plan = {
+            "pending": pending_rows,
+            "skipped": reader.skipped_rows,
+            "total_rows": reader.total_rows,
+            "missing_placeholders": missing,
+            "preflight": preflight,
+        }
+        if errors:
+            plan["error"] = "; ".join(errors)
+        return plan
+
+    def plan_routes(self, excel_path, template, router, columns, default_name):
+        # plan() of a workbook with a template column: the pending rows per template, each template checked once
+        position = route_column_position(columns, self.route_column)
+        reader = StreamingIntakeReader(excel_path, chunk_size=self.chunk_size)
+        routes = {}  # {template column value: pending rows}
+        for chunk in reader:
+            values = chunk.iloc[:, position].fillna('').astype(str).str.strip()
+            for route, count in values.value_counts(sort=False).items():
+                routes[route] = routes.get(route, 0) + int(count)
+
+        preflight_columns = [column for column in columns if column != columns[position]]
+        counts = {}
+        reports = {}
+        unrouted = {}  # {template column value: rows} of the rows that would fail
+        errors = []
+        for route, count in routes.items():
+            try:
+                if route:
+                    name, routed_template = router.resolve(route)
+                elif template is not None:
+                    name, routed_template = default_name, template
+                else:
+                    raise ValueError(f"the '{self.route_column}' cell is empty and there is no default template")
+            except ValueError as e:
+                errors.append(f"{count} rows: {e}")
+                unrouted[route] = count
+                continue
+            counts[name] = counts.get(name, 0) + count
+            if name not in reports:
+                reports[name] = PreflightReport(routed_template, preflight_columns)
+                self.print_preflight({name: reports[name]})
+                # As in RoutedStream, a template that fails the check fails its rows
+                try:
+                    reports[name].check(self.strict)
+                except PreflightError as e:
+                    errors.append(f"{e} ({name})")
+        for name, count in counts.items():
+            print(f"Template {name}: {count} rows")
+        plan = {
+            "pending": sum(routes.values()),
+            "skipped": reader.skipped_rows,
+            "total_rows": reader.total_rows,
+            "templates": counts,
+            "unrouted": unrouted,
+            "missing_placeholders": {name: report.missing_placeholders for name, report in reports.items()},
+            "preflight": {name: report.to_dict() for name, report in reports.items()},
+        }
+        if errors:
+            plan["error"] = "; ".join(errors)
+        return plan
+
+    def reconcile(self, excel_file, template_file):
+        """Marks the rows of the checkpoint journal in the workbook without rendering anything.
+
+        Only journaled rows that are still unprocessed, whose values and
+        template still match and whose report still exists are marked. The
+        journal is removed once the workbook is saved. Returns the counts.
+        """
+        journal = CheckpointJournal(self.journal_path(excel_file))
+        if not len(journal):
+            print(f"No checkpoint journal to reconcile at {journal.path}")
+            return {"reconciled": 0, "journaled": 0}
+        template = self.load_templates(template_file)
+        excel_path = self.input_dir / excel_file
+        if not excel_path.exists():
+            raise FileNotFoundError(f"Excel file not found at {excel_path}")
+
+        updates = {}
+        router = self.template_router(self.workbook_columns(excel_path), template)
+        stream = self.open_stream(excel_path, template, router=router, on_error=lambda index, filename, error: None)
+        for batch in stream.batches():
+            for index, _, values in batch:
+                key = RenderCache.key(stream.template_for(index).sha256, values)
+                journaled = journal.completed(index, key)
+                if journaled is not None and (self.output_dir / journaled).exists():
+                    updates[index] = journaled
+
+        journaled_rows = len(journal)
+        if updates:
+            write_processed_cells(excel_path, updates)
+        journal.remove()
+        print(f"Marked {len(updates)} of {journaled_rows} journaled rows in {excel_file}.")
+        return {"reconciled": len(updates), "journaled": journaled_rows}
 
 def get_file_selection(directory, extension):
     files = [f for f in os.listdir(directory) if f.endswith(extension)]
@@ -114,10 +1097,267 @@ def get_file_selection(directory, extension):
         except ValueError:
             print("Please enter a number.")
 
-def main():
+# How the pre-flight findings are printed
+PREFLIGHT_LABELS = {"error": "Error", "warning": "Warning", "info": "Note"}
+
+# Exit codes of the command line
+EXIT_OK = 0
+EXIT_FAILED = 1  # At least one job failed, had rows that failed or could not save the workbook
+EXIT_USAGE = 2  # Bad arguments or no matching input files (argparse also exits with 2)
+
+def expand_paths(patterns, base_dir):
+    """Expands paths and glob patterns to existing files, trying relative patterns in base_dir as well."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches and not os.path.isabs(pattern):
+            matches = sorted(glob.glob(str(Path(base_dir) / pattern), recursive=True))
+        for match in matches:
+            # Skip the lock files Excel and Word leave next to open documents
+            if Path(match).is_file() and not Path(match).name.startswith('~$'):
+                paths.append(Path(match).resolve())
+    return list(dict.fromkeys(paths))
+
+def load_manifest(path):
+    """Reads the jobs of a manifest file.
+
+    A JSON manifest is a list (or {"jobs": [...]}) of objects with "excel",
+    "template" and optionally "output_dir"; a .csv manifest has those columns.
+    Relative paths are resolved against the manifest's directory and "excel"
+    may be a glob pattern. In a JSON manifest "template" can be a list of
+    templates that are all rendered for every row (fan-out). "template" can
+    be left out for workbooks whose rows name their template.
+    """
+    path = Path(path)
+    if path.suffix.lower() == '.csv':
+        entries = pd.read_csv(path, dtype=str, keep_default_na=False).to_dict('records')
+    else:
+        entries = json.loads(path.read_text(encoding='utf-8'))
+        if isinstance(entries, dict):
+            entries = entries.get('jobs', [])
+    base_dir = path.resolve().parent
+
+    jobs = []
+    for number, entry in enumerate(entries, 1):
+        if not entry.get('excel'):
+            raise ValueError(f"Manifest entry {number} needs 'excel'")
+        if not entry.get('template'):
+            template_path = None  # Every row names its template
+        elif isinstance(entry['template'], list):
+            template_path = [(base_dir / template).resolve() for template in entry['template']]
+        else:
+            template_path = (base_dir / entry['template']).resolve()
+        output_dir = (base_dir / entry['output_dir']).resolve() if entry.get('output_dir') else None
+        excel_paths = expand_paths([str(base_dir / entry['excel'])], base_dir)
+        if not excel_paths:
+            raise ValueError(f"Manifest entry {number}: no workbook matches '{entry['excel']}'")
+        for excel_path in excel_paths:
+            jobs.append({"excel": excel_path, "template": template_path, "output_dir": output_dir})
+    return jobs
+
+def build_jobs(args, input_dir):
+    """Returns the workbook/template jobs given by --manifest and --excel/--template."""
+    jobs = []
+    if args.manifest:
+        jobs.extend(load_manifest(args.manifest))
+    if args.excel:
+        # Without --template every row has to name its template (see TemplateRouter)
+        templates = []
+        for pattern in args.template or []:
+            matches = expand_paths([pattern], input_dir)
+            if len(matches) != 1:
+                raise ValueError(f"--template must match exactly one file, '{pattern}' matches {len(matches)}")
+            templates.append(matches[0])
+        # Several --template options render every template for each row
+        template = templates if len(templates) > 1 else (templates[0] if templates else None)
+        excel_paths = expand_paths(args.excel, input_dir)
+        if not excel_paths:
+            raise ValueError(f"No workbook matches {', '.join(args.excel)}")
+        jobs.extend({"excel": excel_path, "template": template, "output_dir": None} for excel_path in excel_paths)
+    return jobs
+
+def run_batch(generator, jobs, stream=False, dry_run=False, reconcile=False):
+    """Runs jobs one after another with one generator and returns a summary dict.
+
+    Compiled templates stay in the generator's template library for the whole
+    batch, and the process pool is kept while consecutive jobs use the same
+    templates. A failing job is recorded and the batch continues. With
+    reconcile the jobs only mark the rows of their checkpoint journals.
+    """
+    started = datetime.now()
+    default_output_dir = generator.output_dir
+    batch_timer = generator.timer
+    results = []
+    executor = None
+    executor_template = None
+    try:
+        for job in jobs:
+            output_dir = Path(job['output_dir']) if job.get('output_dir') else default_output_dir
+            fan_out = isinstance(job['template'], (list, tuple))
+            template_paths = list(job['template']) if fan_out else [job['template']] if job['template'] else []
+            result = {"excel": str(job['excel']),
+                      "template": ([str(path) for path in template_paths] if fan_out
+                                   else str(job['template']) if job['template'] else None),
+                      "output_dir": str(output_dir)}
+            job_started = time.perf_counter()
+            generator.timer = StageTimer()  # Stage timings of this job alone
+            template_names = ', '.join(Path(path).name for path in template_paths) or "the templates its rows name"
+            print(f"\n=== {Path(job['excel']).name} with {template_names} ===")
+            try:
+                if dry_run:
+                    result.update(generator.plan(job['excel'], job['template']))
+                    print(f"Would process {result['pending']} of {result['total_rows']} rows into {output_dir}")
+                    if result.get("error"):
+                        print(f"Error: {result['error']}")
+                        result["status"] = "failed"
+                    else:
+                        result["status"] = "planned"
+                elif reconcile:
+                    generator.output_dir = output_dir
+                    result.update(generator.reconcile(job['excel'], job['template']))
+                    result["status"] = "reconciled"
+                else:
+                    output_dir.mkdir(parents=True, exist_ok=True)
+                    generator.output_dir = output_dir
+                    if generator.workers > 1:
+                        templates = [generator.load_compiled_template(path) for path in template_paths]
+                        template_keys = [template.sha256 for template in templates]
+                        if template_keys != executor_template:
+                            if executor is not None:
+                                executor.shutdown()
+                            executor = generator.create_executor(templates)
+                            executor_template = template_keys
+                    df = None if stream else generator.load_excel_data(job['excel'])
+                    # Jobs can share an output directory, the workbook name keeps their reports apart
+                    report_prefix = f"report_{Path(job['excel']).stem}"
+                    result.update(generator.generate(df, job['excel'], job['template'], executor=executor,
+                                                     report_prefix=report_prefix))
+                    result["status"] = "failed" if result["failed"] or result["save_error"] else "ok"
+            except Exception as e:
+                print(f"Error: {str(e)}")
+                result.update(status="failed", error=str(e))
+                if isinstance(e, PreflightError):
+                    result["preflight"] = e.report.to_dict()
+            result["seconds"] = round(time.perf_counter() - job_started, 3)
+            result["timings"] = generator.timer.summary()
+            batch_timer.merge(generator.timer.samples())
+            results.append(result)
+    finally:
+        generator.output_dir = default_output_dir
+        generator.timer = batch_timer
+        if executor is not None:
+            executor.shutdown()
+
+    failed_jobs = sum(1 for result in results if result["status"] == "failed")
+    summary = {
+        "started": started.isoformat(timespec='seconds'),
+        "finished": datetime.now().isoformat(timespec='seconds'),
+        "dry_run": dry_run,
+        "exit_code": EXIT_FAILED if failed_jobs else EXIT_OK,
+        "totals": {
+            "jobs": len(results),
+            "failed_jobs": failed_jobs,
+            "processed": sum(result.get("processed", 0) for result in results),
+            "failed_rows": sum(result.get("failed", 0) for result in results),
+            "resumed": sum(result.get("resumed", 0) for result in results),
+            "pending": sum(result.get("pending", 0) for result in results),
+        },
+        "template_cache": {"hits": generator.template_library.hits, "misses": generator.template_library.misses},
+        "jobs": results,
+    }
+    if generator.render_cache is not None:
+        summary["render_cache"] = {"hits": generator.render_cache.hits, "misses": generator.render_cache.misses}
+    return summary
+
+def write_run_report(path, timer, started, jobs=None):
+    """Writes the stage timings of a run (all jobs together) as JSON."""
+    report = {
+        "started": started.isoformat(timespec='seconds'),
+        "finished": datetime.now().isoformat(timespec='seconds'),
+        "command": sys.argv,
+        "timings": timer.summary(),
+    }
+    if jobs is not None:
+        report["jobs"] = [{"excel": job["excel"], "status": job["status"], "seconds": job["seconds"],
+                           "timings": job.get("timings", {})} for job in jobs]
+    Path(path).write_text(json.dumps(report, indent=2) + "\n", encoding='utf-8')
+    print(f"Run report saved to {path}")
+
+def print_timings(timer):
+    lines = timer.format_lines()
+    if lines:
+        print("\nStage timings:")
+        for line in lines:
+            print(f"  {line}")
+
+def write_summary(summary, destination):
+    """Writes the JSON summary to a file, or to standard output for '-'."""
+    text = json.dumps(summary, indent=2)
+    if destination == '-':
+        print(text)
+    elif destination:
+        Path(destination).write_text(text + "\n", encoding='utf-8')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Word reports from Excel data. Without --excel or --manifest the files are selected interactively.")
+    parser.add_argument("--excel", action="append", metavar="PATH", help="Workbook path or glob pattern to process without prompts (repeatable)")
+    parser.add_argument("--template", action="append", metavar="PATH", help="Word template for the --excel workbooks; repeat it to render several templates for every row, each tracked in its own processed_<template> column. Optional when the rows name their template")
+    parser.add_argument("--manifest", metavar="PATH", help="JSON or CSV file listing excel/template/output_dir jobs")
+    parser.add_argument("--input-dir", default="Inputs", help="Directory of the interactive selection, also searched for relative paths (default: Inputs)")
+    parser.add_argument("--output-dir", default="Outputs", help="Where reports are saved unless a manifest job sets output_dir (default: Outputs)")
+    parser.add_argument("--dry-run", action="store_true", help="Check the jobs and count the rows they would process without generating anything")
+    parser.add_argument("--reconcile", action="store_true", help="Only mark the rows of the jobs' checkpoint journals in their workbooks, without rendering")
+    parser.add_argument("--strict", action="store_true", help="Do not render a job when the pre-flight check finds placeholders without a matching column")
+    parser.add_argument("--no-journal", action="store_true", help="Do not keep a checkpoint journal of completed rows next to the reports")
+    parser.add_argument("--summary", metavar="PATH", help="Write a JSON summary of the batch to PATH ('-' for standard output, progress then goes to standard error)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of processes used to render reports (default: 1)")
+    parser.add_argument("--stream", action="store_true", help="Stream the workbook in read-only mode and only keep unprocessed rows in memory")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows held in memory at a time with --stream (default: 1000)")
+    parser.add_argument("--cache-dir", help="Reuse reports of identical rows from this render cache directory")
+    parser.add_argument("--cache-size-mb", type=int, default=512, help="Size limit of the render cache in MB (default: 512)")
+    parser.add_argument("--template-cache-dir", default=".template_cache", help="Where compiled templates are kept between runs (default: .template_cache)")
+    parser.add_argument("--template-dir", help="Where the templates named in a workbook's template column are looked up (default: --input-dir)")
+    parser.add_argument("--route-column", default=TEMPLATE_COLUMN, help="Column whose value names the template of a row, '' to turn routing off (default: template)")
+    parser.add_argument("--template-pool-size", type=int, default=16, help="Compiled templates kept in memory, per process (default: 16)")
+    parser.add_argument("--run-report", metavar="PATH", help="Write the per-stage wall/CPU timings of the run as JSON to PATH")
+    parser.add_argument("--profile", metavar="PATH", help="Profile the run with cProfile and save the pstats dump to PATH (worker processes are not included)")
+    args = parser.parse_args(argv)
+    started = datetime.now()
+
+    try:
+        generator = ReportGenerator(input_dir=args.input_dir, output_dir=args.output_dir, workers=args.workers,
+                                    chunk_size=args.chunk_size, cache_dir=args.cache_dir,
+                                    cache_max_bytes=args.cache_size_mb * 1024 * 1024,
+                                    template_cache_dir=args.template_cache_dir, journal=not args.no_journal,
+                                    strict=args.strict, template_dir=args.template_dir,
+                                    template_pool_size=args.template_pool_size, route_column=args.route_column)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return EXIT_USAGE
+
+    if args.excel or args.manifest:
+        # Headless batch mode, no prompts
+        try:
+            jobs = build_jobs(args, generator.input_dir)
+        except Exception as e:
+            print(f"Error: {str(e)}", file=sys.stderr)
+            return EXIT_USAGE
+        progress_output = sys.stderr if args.summary == '-' else sys.stdout
+        with contextlib.redirect_stdout(progress_output):
+            with profiled(args.profile):
+                summary = run_batch(generator, jobs, stream=args.stream, dry_run=args.dry_run,
+                                    reconcile=args.reconcile)
+            totals = summary["totals"]
+            print(f"\nBatch finished: {totals['jobs']} jobs, {totals['processed']} reports, {totals['failed_jobs']} failed jobs.")
+            print_timings(generator.timer)
+            if args.run_report:
+                write_run_report(args.run_report, generator.timer, started, summary["jobs"])
+            if args.profile:
+                print(f"Profile saved to {args.profile} (view it with: python -m pstats {args.profile})")
+        write_summary(summary, args.summary)
+        return summary["exit_code"]
+
     try:
-        generator = ReportGenerator()
-        
         print("Select an Excel file for data:")
         excel_file = get_file_selection(generator.input_dir, '.xlsx')
         if not excel_file:
@@ -133,14 +1373,22 @@ def main():
         confirm = input("Proceed with these files? (y/n): ").lower()
         
         if confirm == 'y':
-            df = generator.load_excel_data(excel_file)
-            result = generator.generate_reports(df, excel_file, template_file)
+            with profiled(args.profile):
+                df = None if args.stream else generator.load_excel_data(excel_file)
+                result = generator.generate_reports(df, excel_file, template_file)
             print(result)
+            print_timings(generator.timer)
+            if args.run_report:
+                write_run_report(args.run_report, generator.timer, started)
+            if args.profile:
+                print(f"Profile saved to {args.profile} (view it with: python -m pstats {args.profile})")
         else:
             print("Operation cancelled.")
             
     except Exception as e:
         print(f"Error: {str(e)}")
+        return EXIT_FAILED
+    return EXIT_OK
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
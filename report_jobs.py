@@ -0,0 +1,367 @@
+import io
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from report_archive import ReportArchive
+from report_generator import (ReportStream, FanOutStream, RoutedStream, TemplateRouter, route_column_position,
+                              row_label, template_name)
+from log_sink import ThrottledLogSink
+from intake import patch_workbook, read_header
+from preflight import PreflightReport
+from stage_timer import StageTimer, profiled
+
+# Names of the outputs each job keeps in the artifact store (the job id is the artifact session)
+REPORT_ZIP_ARTIFACT = "reports.zip"
+UPDATED_EXCEL_ARTIFACT = "updated_workbook.xlsx"
+LOG_ARTIFACT = "processing_log.txt"
+PROFILE_ARTIFACT = "profile.pstats"
+JOB_STATUS_FILE = "job.json"
+
+JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+ACTIVE_STATES = ("queued", "running")
+
+
+class ReportJob:
+    """State of one background generation job.
+
+    The state dict is written to JOB_STATUS_FILE in the job's directory on every
+    update, so progress survives a page reload. The job also acts as the log
+    area, status area and progress bar of a ThrottledLogSink, which keeps the
+    number of writes bounded no matter how many rows are rendered.
+    """
+
+    def __init__(self, job_id, directory):
+        self.id = job_id
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self.state = {
+            "id": job_id,
+            "state": "queued",
+            "created": time.time(),
+            "updated": time.time(),
+            "progress": 0,
+            "status_text": "Waiting to start...",
+            "log_tail": "",
+            "warnings": [],
+            "total_rows": 0,
+            "processed_count": 0,
+            "skipped_count": 0,
+            "zip_filename": None,
+            "updated_excel_filename": None,
+            "message": None,
+            "error": None,
+            "timings": {},
+            "profile": False,
+        }
+        self._save()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        """Asks the job to stop after the current row."""
+        self._cancel.set()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.state)
+
+    def update(self, **changes):
+        with self._lock:
+            self.state.update(changes)
+            self.state["updated"] = time.time()
+            self._save()
+
+    def _save(self):
+        # Caller holds the lock (or owns the job); write atomically so readers never see half a file
+        path = self.directory / JOB_STATUS_FILE
+        temporary_path = path.with_name(f".{path.name}.tmp")
+        temporary_path.write_text(json.dumps(self.state), encoding='utf-8')
+        os.replace(temporary_path, path)
+
+    # ThrottledLogSink output targets
+    def code(self, text, language=None):
+        self.update(log_tail=text)
+
+    def info(self, text):
+        self.update(status_text=text)
+
+    def progress(self, percent):
+        self.update(progress=percent)
+
+
+def load_job_status(directory):
+    """Returns the persisted state of a job or None if there is none."""
+    try:
+        return json.loads((Path(directory) / JOB_STATUS_FILE).read_text(encoding='utf-8'))
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+class JobManager:
+    """Runs generation jobs on a small thread pool, independent of any browser session.
+
+    Jobs are looked up by id, so a page that was reloaded or reconnected can
+    attach to a job that is still running. Shared through st.cache_resource.
+    """
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, directory, target, *args):
+        """Starts target(job, *args) in the background and returns the job."""
+        job = ReportJob(job_id, directory)
+        with self._lock:
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job, target, args)
+        return job
+
+    def _run(self, job, target, args):
+        job.update(state="running", status_text="Starting report generation process...")
+        try:
+            target(job, *args)
+        except Exception as e:
+            job.update(state="failed", error=str(e))
+
+    def status(self, job_id, directory):
+        """Returns the state of a job, from memory or from its persisted status file."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        state = load_job_status(directory)
+        if state is not None and state["state"] in ACTIVE_STATES:
+            # The process that ran the job is gone (e.g. the server was restarted)
+            state["state"] = "interrupted"
+        return state
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job is not None
+
+    def forget(self, job_id):
+        """Drops a finished job from memory; its status file stays on disk."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.snapshot()["state"] not in ACTIVE_STATES:
+                del self._jobs[job_id]
+
+
+def run_generation_job(job, artifact_store, template_library, excel_bytes, excel_name, template_bytes, profile=False):
+    """Generates the reports of a workbook into the artifact store, reporting progress to the job.
+
+    Cancelling keeps the reports rendered so far: the ZIP is finished and the
+    workbook is updated for exactly those rows. With profile set the run is
+    profiled with cProfile and the pstats dump is stored as PROFILE_ARTIFACT,
+    unless another job is being profiled at the same time.
+    """
+    artifact_store.touch_job(job.id)
+    profile_path = artifact_store.path(job.id, PROFILE_ARTIFACT) if profile else None
+    with profiled(profile_path) as profiler:
+        final_state = generate_job_outputs(job, artifact_store, template_library, excel_bytes, excel_name,
+                                           template_bytes)
+    if profiler is not None:
+        artifact_store.register(job.id, PROFILE_ARTIFACT)
+        final_state["profile"] = True
+    elif profile:
+        # Only one run is profiled at a time
+        final_state["warnings"] = job.snapshot()["warnings"] + ["Not profiled: another job was being profiled"]
+    job.update(**final_state)
+
+
+def generate_job_outputs(job, artifact_store, template_library, excel_bytes, excel_name, template_bytes):
+    # Does the work of run_generation_job and returns the final state of the job
+    log_sink = ThrottledLogSink(job, status_area=job, progress_bar=job,
+                                path=artifact_store.path(job.id, LOG_ARTIFACT))
+    add_log = log_sink.log
+    timer = StageTimer()
+    report_archive = None
+    try:
+        # Compile the templates once (or reuse them from an earlier run), each row only fills in the placeholder slots
+        add_log("Loading Word template")
+        log_sink.progress(0, "Loading Word template...")
+        # Several (filename, bytes) templates are all rendered for each row (fan-out), unless the
+        # workbook has a template column: then each row is rendered with the template it names
+        named_templates = template_bytes if isinstance(template_bytes, list) else [(None, template_bytes)]
+        routed = (route_column_position(read_header(excel_bytes)) is not None
+                  and all(template_filename for template_filename, _ in named_templates))
+        if routed:
+            router = TemplateRouter(named_templates, template_library.get)
+            add_log(f"Rows are routed by their template column to: {', '.join(name for name, _ in router.files.values())}")
+            # A single template is also the default of the rows that do not name one
+            named_templates = named_templates[:1] if len(named_templates) == 1 else []
+        if len(named_templates) == 1:
+            named_templates = [(None, named_templates[0][1])]
+        templates = {}
+        for template_filename, data in named_templates:
+            name = template_name(template_filename) if template_filename is not None else None
+            if name in templates:
+                raise ValueError(f"The templates of a run need different file names, '{name}' is used twice")
+            template_misses = template_library.misses
+            with timer.time("compile_template"):
+                templates[name] = template = template_library.get(data)
+            label = f"{name}: " if name is not None else ""
+            if template_library.misses == template_misses:
+                add_log(f"{label}Reusing compiled template {template.sha256[:12]}")
+            add_log(f"{label}Template placeholders: {', '.join(template.placeholders)}")
+
+        # The workbook is streamed and formatted a chunk at a time, reports are rendered one by one
+        add_log(f"Loading Excel file: {excel_name}")
+        log_sink.progress(0, "Loading Excel data...")
+        timestamp_run = datetime.now().strftime("%Y%m%d_%H%M%S")
+        on_error = lambda index, filename, error: add_log(f"{row_label(index).capitalize()}: Error: {error}")
+        if routed:
+            default_name = template_name(template_bytes[0][0]) if templates else "default"
+            report_stream = RoutedStream(excel_bytes, templates.get(None), router, default_name=default_name,
+                                         timestamp=timestamp_run, timer=timer, on_error=on_error)
+        elif None in templates:
+            report_stream = ReportStream(excel_bytes, templates[None], timestamp=timestamp_run, timer=timer,
+                                         on_error=on_error)
+        else:
+            report_stream = FanOutStream(excel_bytes, templates, timestamp=timestamp_run, timer=timer,
+                                         on_error=on_error)
+        report_stream.start()
+        expected_rows = report_stream.expected_rows or 0
+        job.update(total_rows=expected_rows)
+        add_log(f"Found {expected_rows} rows in Excel file")
+        add_log(f"Columns: {', '.join(map(str, report_stream.columns))}")
+
+        # Placeholders were matched to columns once for the whole run
+        warnings = []
+
+        def log_preflight(name, report):
+            for level, message in report.messages():
+                if name is not None:
+                    message = f"{name}: {message}"
+                add_log(f"{level.capitalize()}: {message}")
+                if level != "info":
+                    warnings.append(message)
+
+        if routed:
+            # Routed templates are checked when a row first uses them
+            logged = set()
+
+            def log_routed_preflight():
+                for name, report in list(report_stream.preflight.items()):
+                    if name not in logged:
+                        logged.add(name)
+                        log_preflight(name, report)
+                        job.update(warnings=warnings)
+        else:
+            for name, template in templates.items():
+                log_preflight(name, PreflightReport(template, report_stream.columns))
+        job.update(warnings=warnings)
+
+        add_log(f"Starting report generation with timestamp: {timestamp_run}")
+
+        # Reports are written into the ZIP on disk as they are rendered
+        report_archive = ReportArchive(path=artifact_store.path(job.id, REPORT_ZIP_ARTIFACT))
+
+        processed_updates = {}  # {row key: filename} written back to the workbook
+        processed_count = 0
+
+        for row_key, output_filename, report_bytes in report_stream:
+            index = row_key[0] if isinstance(row_key, tuple) else row_key
+            if routed and len(logged) < len(report_stream.preflight):
+                log_routed_preflight()
+            if job.cancel_requested:
+                add_log(f"Cancelled before row {index + 1}, keeping the {processed_count} reports already generated")
+                break
+
+            # Update status with current row
+            progress_percent = min(99, int((index / expected_rows) * 100)) if expected_rows else 0
+            log_sink.progress(progress_percent, f"Processing row {index + 1} of {expected_rows} ({progress_percent}%)...")
+
+            # Store the generated report
+            add_log(f"{row_label(row_key).capitalize()}: Generated report '{output_filename}'")
+            with timer.time("add_to_zip"):
+                report_archive.add(output_filename, report_bytes)
+
+            # Remember the new 'processed' value of the row
+            processed_updates[row_key] = output_filename
+            processed_count += 1
+            if processed_count % 50 == 0:
+                job.update(processed_count=processed_count, skipped_count=report_stream.skipped_rows)
+
+        if routed:
+            log_routed_preflight()
+            for name, count in report_stream.routed_rows.items():
+                add_log(f"Template {name}: {count} rows")
+
+        # After a cancel the reader has not counted the rows it did not get to
+        skipped_count = report_stream.skipped_rows
+        total_rows = max(report_stream.total_rows, expected_rows)
+        if skipped_count:
+            add_log(f"Skipped {skipped_count} rows already marked as processed")
+        cancelled = job.cancel_requested
+        log_sink.flush()
+        job.update(processed_count=processed_count, skipped_count=skipped_count, total_rows=total_rows)
+
+        if cancelled:
+            status_message = f"Cancelled. Generated {processed_count} reports before stopping (out of {total_rows} rows)."
+        elif processed_count > 0:
+            status_message = f"Generated {processed_count} reports. Skipped {skipped_count} previously processed rows (out of {total_rows} total)."
+        elif report_stream.failed:
+            status_message = f"No new reports generated. All {report_stream.failed} rows to process failed, see the log."
+        else:
+            status_message = f"No new reports generated. All {total_rows} rows were already marked as processed or the file was empty."
+        add_log(status_message)
+
+        # Finish the zip file (the reports were added while rendering)
+        with timer.time("finish_zip"):
+            report_archive.close()
+        zip_filename = None
+        if report_archive.names:
+            artifact_store.register(job.id, REPORT_ZIP_ARTIFACT)
+            zip_filename = f"generated_reports_{timestamp_run}.zip"
+            add_log(f"ZIP file created: {zip_filename} ({report_archive.size()} bytes)")
+        else:
+            artifact_store.delete(job.id, REPORT_ZIP_ARTIFACT)
+
+        # Save the updated workbook, only the 'processed' cells of rendered rows are patched
+        add_log("Updating Excel file with processing status")
+        log_sink.progress(100, "Saving updated Excel file...")
+        with timer.time("write_back"):
+            patch_workbook(io.BytesIO(excel_bytes), artifact_store.path(job.id, UPDATED_EXCEL_ARTIFACT), processed_updates)
+            artifact_store.register(job.id, UPDATED_EXCEL_ARTIFACT)
+
+        # Create a filename for the updated Excel file
+        filename_parts = excel_name.rsplit('.', 1)
+        base_name = filename_parts[0]
+        extension = filename_parts[1] if len(filename_parts) > 1 else 'xlsx'
+        updated_excel_filename = f"{base_name}_updated_{timestamp_run}.{extension}"
+        add_log(f"Updated Excel file created: {updated_excel_filename}")
+
+        # Where the time went, per stage
+        add_log("Stage timings:")
+        for line in timer.format_lines():
+            add_log(f"  {line}")
+        log_sink.close()
+        artifact_store.register(job.id, LOG_ARTIFACT)
+        return dict(state="cancelled" if cancelled else "completed", message=status_message,
+                    zip_filename=zip_filename, updated_excel_filename=updated_excel_filename,
+                    timings=timer.summary())
+
+    except Exception as e:
+        add_log(f"Error: {e}")
+        log_sink.close()
+        if report_archive is not None:
+            report_archive.close()
+        artifact_store.delete(job.id, REPORT_ZIP_ARTIFACT)
+        artifact_store.delete(job.id, UPDATED_EXCEL_ARTIFACT)
+        artifact_store.register(job.id, LOG_ARTIFACT)
+        return dict(state="failed", error=str(e), processed_count=0, skipped_count=0, timings=timer.summary())
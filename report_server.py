@@ -0,0 +1,422 @@
+"""Small HTTP service that renders reports for other systems.
+
+    python report_server.py --port 8765 --template-dir Inputs
+
+POST /render?template=<name> with the rows in the body (JSON, CSV or XLSX)
+streams back a ZIP of the reports while they are rendered; with
+format=docx a single row is returned as one .docx. GET /templates lists the
+templates and GET /health reports the load. Rendering uses the compiled
+template engine of ReportGenerator, with placeholders {column} (exact column
+names) or, with syntax=double, {{column}} like the Streamlit app.
+"""
+import argparse
+import io
+import json
+import re
+import sys
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from intake import clean_column_name
+from report_generator import ReportStream
+from template_engine import DOUBLE_BRACE_PATTERN, SINGLE_BRACE_PATTERN
+from template_library import TemplateLibrary
+
+DEFAULT_PORT = 8765
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_TYPE = "application/zip"
+
+# Placeholder syntaxes a request can choose with syntax=
+SYNTAXES = {
+    "single": (SINGLE_BRACE_PATTERN, False),  # {column}, exact names, as report_generator.py
+    "double": (DOUBLE_BRACE_PATTERN, True),  # {{column}}, case-insensitive, as the Streamlit app
+}
+
+# Characters kept in report filenames taken from a column
+FILENAME_UNSAFE = re.compile(r'[^\w.\- ]+')
+
+
+class RequestError(Exception):
+    """A request that cannot be served, answered with status and message."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ChunkedWriter:
+    """File-like object that sends what is written as HTTP/1.1 chunks.
+
+    Writes are buffered until flush(), so a report is sent as one chunk as soon
+    as it is complete. Writing blocks while the client does not read, which
+    holds the render loop back (backpressure) instead of buffering reports.
+    """
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+        self.buffer = bytearray()
+        self.sent = 0
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self.wfile.write(b"%X\r\n" % len(self.buffer) + bytes(self.buffer) + b"\r\n")
+            self.wfile.flush()
+            self.sent += len(self.buffer)
+            self.buffer.clear()
+
+    def close(self):
+        """Sends the rest of the buffer and the last (empty) chunk."""
+        self.flush()
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def read_rows(body, content_type):
+    """Returns the rows of a request body as a ReportStream source.
+
+    The body is an XLSX workbook (returned as bytes and streamed like
+    --stream of the command line), a CSV file (all values read as text) or
+    JSON: a list of objects or {"rows": [...]}, both returned as a
+    DataFrame. The stream skips rows with a filled 'processed' column, as in
+    the other entry points.
+    """
+    content_type = content_type.split(';')[0].strip().lower()
+    if content_type == XLSX_TYPE or (not content_type.startswith(("text/", "application/json")) and body[:2] == b"PK"):
+        return body
+
+    try:
+        if content_type in ("text/csv", "application/csv"):
+            df = pd.read_csv(io.BytesIO(body), dtype=str, keep_default_na=False)
+        else:
+            rows = json.loads(body.decode('utf-8'))
+            if isinstance(rows, dict):
+                rows = rows.get('rows')
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise ValueError('JSON rows must be a list of objects or {"rows": [...]}')
+            df = pd.DataFrame(rows)
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise RequestError(400, f"Could not read the rows: {e}")
+
+    df.columns = [clean_column_name(column) for column in df.columns]
+    return df
+
+
+def report_filename(value, row_number, used):
+    """Filename of a report from a column value (or the row number), unique within a response."""
+    stem = FILENAME_UNSAFE.sub('_', str(value or '')).strip(' ._') or f"report_{row_number}"
+    filename = f"{stem}.docx"
+    counter = 1
+    while filename in used:
+        counter += 1
+        filename = f"{stem}_{counter}.docx"
+    used.add(filename)
+    return filename
+
+
+class RequestReportStream(ReportStream):
+    """ReportStream of a request, naming each report after its filename_column value or row number."""
+
+    def __init__(self, source, template, name_column=None, **options):
+        super().__init__(source, template, **options)
+        self.name_column = name_column
+        self.name_position = None
+        self._used_filenames = set()
+
+    def _bind_columns(self, columns):
+        super()._bind_columns(columns)
+        if self.name_column in columns:
+            self.name_position = columns.index(self.name_column)
+
+    def report_filename(self, index, row):
+        value = row[self.name_position] if self.name_position is not None else None
+        return report_filename(value, index + 1, self._used_filenames)
+
+
+class ReportServer(ThreadingHTTPServer):
+    """Threaded HTTP server with a shared template library and a limit on concurrent renders.
+
+    Each connection gets a thread and is kept alive between requests. At most
+    max_concurrent requests render at a time; further requests wait up to
+    queue_timeout seconds for a slot and are then answered with 503 and
+    Retry-After, so a burst cannot pile up unbounded work.
+    """
+
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, address, template_dir="Inputs", max_concurrent=2, queue_timeout=10.0,
+                 max_body_bytes=100 * 1024 * 1024, chunk_size=1000, idle_timeout=30.0, template_cache_dir=None):
+        self.template_dir = Path(template_dir).resolve()
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.queue_timeout = queue_timeout
+        self.max_body_bytes = max_body_bytes
+        self.chunk_size = max(1, int(chunk_size))
+        self.idle_timeout = idle_timeout
+        self.template_library = TemplateLibrary(store_dir=template_cache_dir)
+        self.render_slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self.active_renders = 0
+        self.rejected = 0
+        super().__init__(address, ReportRequestHandler)
+
+    def template_names(self):
+        return sorted(path.name for path in self.template_dir.glob('*.docx') if not path.name.startswith('~$'))
+
+    def template_path(self, name):
+        """Resolves a template name inside the template directory."""
+        if not name:
+            raise RequestError(400, "The 'template' parameter is required")
+        path = (self.template_dir / name).resolve()
+        if path.parent != self.template_dir or not path.is_file():
+            raise RequestError(404, f"Template not found: {name}")
+        return path
+
+    def load_template(self, name, syntax):
+        pattern, ignore_case = SYNTAXES[syntax]
+        try:
+            return self.template_library.get_file(self.template_path(name), pattern=pattern, ignore_case=ignore_case)
+        except RequestError:
+            raise
+        except Exception as e:
+            raise RequestError(422, f"Could not read the template: {e}")
+
+    def warm(self, syntaxes=("single",)):
+        """Compiles every template of the template directory, so first requests skip parsing."""
+        for name in self.template_names():
+            for syntax in syntaxes:
+                try:
+                    self.load_template(name, syntax)
+                except RequestError as e:
+                    print(f"Warning: {e}", file=sys.stderr)
+
+    def acquire_render_slot(self):
+        if not self.render_slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.active_renders += 1
+        return True
+
+    def release_render_slot(self):
+        with self._lock:
+            self.active_renders -= 1
+        self.render_slots.release()
+
+    def health(self):
+        with self._lock:
+            return {
+                "status": "ok",
+                "active_renders": self.active_renders,
+                "max_concurrent": self.max_concurrent,
+                "rejected": self.rejected,
+                "template_cache": {"hits": self.template_library.hits, "misses": self.template_library.misses},
+            }
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, and chunked responses for the streamed ZIP
+    server_version = "ReportServer/1.0"
+
+    def setup(self):
+        # Idle keep-alive connections (and clients that stop reading) are closed after this many seconds
+        self.timeout = self.server.idle_timeout
+        super().setup()
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self.send_json(200, self.server.health())
+        elif path == "/templates":
+            self.send_json(200, {"templates": self.server.template_names()})
+        else:
+            self.send_json(404, {"error": f"Not found: {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/render":
+            self.close_connection = True
+            self.send_json(404, {"error": f"Not found: {url.path}"})
+            return
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        try:
+            length = self.body_length()
+        except RequestError as e:
+            # The body is not read, so the connection cannot be reused
+            self.close_connection = True
+            self.send_json(e.status, {"error": str(e)})
+            return
+
+        if not self.server.acquire_render_slot():
+            self.close_connection = True
+            self.send_json(503, {"error": "The server is busy, try again later"},
+                           {"Retry-After": str(max(1, int(self.server.queue_timeout)))})
+            return
+        try:
+            body = self.rfile.read(length)
+            self.render(query, body)
+        except RequestError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            self.log_message("Client disconnected while reports were sent")
+            self.close_connection = True
+        finally:
+            self.server.release_render_slot()
+
+    def body_length(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            raise RequestError(411, "Send the rows with a Content-Length")
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            raise RequestError(411, "Content-Length is required")
+        if length > self.server.max_body_bytes:
+            raise RequestError(413, f"The request body is larger than {self.server.max_body_bytes} bytes")
+        return length
+
+    def render(self, query, body):
+        output_format = query.get('format', 'zip')
+        syntax = query.get('syntax', 'single')
+        if output_format not in ("zip", "docx"):
+            raise RequestError(400, "format must be 'zip' or 'docx'")
+        if syntax not in SYNTAXES:
+            raise RequestError(400, f"syntax must be one of: {', '.join(SYNTAXES)}")
+
+        template = self.server.load_template(query.get('template'), syntax)
+        source = read_rows(body, self.headers.get('Content-Type', ''))
+        errors = []
+        name_column = query.get('filename_column')
+        stream = RequestReportStream(source, template, name_column=name_column, chunk_size=self.server.chunk_size,
+                                     on_error=lambda index, filename, error: errors.append(f"Row {index + 1}: {error}"))
+        try:
+            stream.start()
+        except Exception as e:
+            raise RequestError(400, f"Could not read the rows: {e}")
+        # Until the stream is exhausted the counts cover the first chunk, which is enough to tell it has rows
+        if stream.total_rows == stream.skipped_rows:
+            raise RequestError(400, "No rows to render")
+        if name_column and name_column not in stream.columns:
+            raise RequestError(400, f"Unknown filename_column: {name_column}")
+
+        headers = {"X-Template-Sha256": template.sha256}
+        if stream.missing_placeholders:
+            headers["X-Missing-Placeholders"] = ", ".join(stream.missing_placeholders)
+        if output_format == "docx":
+            self.send_single_report(stream, errors, headers)
+        else:
+            self.stream_zip(stream, errors, headers)
+
+    def send_single_report(self, stream, errors, headers):
+        reports = []
+        for report in stream:
+            reports.append(report)
+            if len(reports) > 1:
+                break
+        if len(reports) + len(errors) != 1:
+            raise RequestError(400, "format=docx needs exactly one row")
+        if errors:
+            raise RequestError(500, f"Failed to render the report: {errors[0]}")
+        _, filename, data = reports[0]
+        self.send_response(200)
+        self.send_header("Content-Type", DOCX_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream_zip(self, stream, errors, headers):
+        """Sends the ZIP as it is written, one chunk per rendered report.
+
+        The status is sent before the first row renders, so rows that fail are
+        listed in errors.txt at the end of the ZIP. If the stream breaks off,
+        the connection is closed without the last chunk and the client sees an
+        incomplete response.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", ZIP_TYPE)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Content-Disposition", 'attachment; filename="reports.zip"')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.flush()
+
+        output = ChunkedWriter(self.wfile)
+        count = 0
+        try:
+            # .docx files are already compressed, store them as they are
+            with zipfile.ZipFile(output, 'w', zipfile.ZIP_STORED) as archive:
+                for _, filename, data in stream:
+                    archive.writestr(filename, data)
+                    output.flush()
+                    count += 1
+                if errors:
+                    archive.writestr("errors.txt", "\n".join(errors) + "\n")
+            output.close()
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except Exception as e:
+            self.log_message("Stopped streaming after %d reports: %s", count, e)
+            self.close_connection = True
+            return
+        self.log_message("Streamed %d reports (%d bytes, %d failed rows)", count, output.sent, len(errors))
+
+    def send_json(self, status, payload, headers=None):
+        data = (json.dumps(payload) + "\n").encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve report rendering over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--template-dir", default="Inputs", help="Directory of the templates requests can use (default: Inputs)")
+    parser.add_argument("--max-concurrent", type=int, default=2, help="Requests rendering at the same time (default: 2)")
+    parser.add_argument("--queue-timeout", type=float, default=10.0, help="Seconds a request waits for a render slot before 503 (default: 10)")
+    parser.add_argument("--max-body-mb", type=int, default=100, help="Largest accepted request body in MB (default: 100)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Rows formatted at a time (default: 1000)")
+    parser.add_argument("--idle-timeout", type=float, default=30.0, help="Seconds before an idle connection is closed (default: 30)")
+    parser.add_argument("--template-cache-dir", default=".template_cache", help="Where compiled templates are kept between runs (default: .template_cache)")
+    parser.add_argument("--no-warm", action="store_true", help="Do not compile the templates of --template-dir at startup")
+    args = parser.parse_args(argv)
+
+    server = ReportServer((args.host, args.port), template_dir=args.template_dir, max_concurrent=args.max_concurrent,
+                          queue_timeout=args.queue_timeout, max_body_bytes=args.max_body_mb * 1024 * 1024,
+                          chunk_size=args.chunk_size, idle_timeout=args.idle_timeout,
+                          template_cache_dir=args.template_cache_dir)
+    if not args.no_warm:
+        server.warm()
+    host, port = server.server_address[:2]
+    print(f"Serving reports on http://{host}:{port} with templates from {server.template_dir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping.")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
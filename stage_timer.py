@@ -0,0 +1,116 @@
+import contextlib
+import cProfile
+import sys
+import threading
+import time
+from array import array
+
+
+class StageTimer:
+    """Wall-clock and CPU time of the stages of a generation run.
+
+    Every timed block adds one sample to its stage, so per-row stages
+    (render, write_report, ...) get a distribution with p50/p95/max. CPU time
+    is the time of the calling thread, which keeps it meaningful for runs in
+    background threads. Samples are kept in compact arrays and can be passed
+    between processes with samples() and merge().
+    """
+
+    def __init__(self):
+        self._samples = {}  # {stage: (wall seconds array, CPU seconds array)}
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - wall_start, time.thread_time() - cpu_start)
+
+    def add(self, stage, wall, cpu):
+        if stage not in self._samples:
+            self._samples[stage] = (array('d'), array('d'))
+        walls, cpus = self._samples[stage]
+        walls.append(wall)
+        cpus.append(cpu)
+
+    def samples(self):
+        """Returns the raw samples, e.g. to send them from a worker process."""
+        return self._samples
+
+    def merge(self, samples):
+        """Adds samples from samples() of another timer."""
+        for stage, (walls, cpus) in samples.items():
+            if stage not in self._samples:
+                self._samples[stage] = (array('d'), array('d'))
+            self._samples[stage][0].extend(walls)
+            self._samples[stage][1].extend(cpus)
+
+    def summary(self):
+        """Returns {stage: statistics in milliseconds} in the order the stages first ran."""
+        stages = {}
+        for stage, (walls, cpus) in self._samples.items():
+            ordered = sorted(walls)
+            stages[stage] = {
+                "count": len(ordered),
+                "wall_total_ms": round(sum(ordered) * 1000, 3),
+                "cpu_total_ms": round(sum(cpus) * 1000, 3),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+                "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        return stages
+
+    def format_lines(self):
+        """One readable line per stage, for logs and the console."""
+        lines = []
+        for stage, stats in self.summary().items():
+            line = f"{stage}: {stats['wall_total_ms']:.1f} ms wall, {stats['cpu_total_ms']:.1f} ms CPU"
+            if stats['count'] > 1:
+                line += (f" over {stats['count']} calls (p50 {stats['p50_ms']:.2f} ms,"
+                         f" p95 {stats['p95_ms']:.2f} ms, max {stats['max_ms']:.2f} ms)")
+            lines.append(line)
+        return lines
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of sorted samples."""
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+# cProfile allows one active profiler per process on Python 3.12+, so profiled blocks take turns
+_profile_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def profiled(path):
+    """Runs the block under cProfile and dumps the pstats to path; does nothing when path is None.
+
+    Only the calling thread is profiled (worker processes are not). While
+    another block is being profiled (e.g. a second background job) the block
+    runs unprofiled with a warning and None is yielded instead of the profiler.
+    """
+    if not path:
+        yield None
+        return
+    if not _profile_lock.acquire(blocking=False):
+        print(f"Warning: another run is being profiled, {path} is not written", file=sys.stderr)
+        yield None
+        return
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:  # A profiler outside this module is active
+            print(f"Warning: cannot profile the run ({e}), {path} is not written", file=sys.stderr)
+            yield None
+            return
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            profiler.dump_stats(str(path))
+    finally:
+        _profile_lock.release()
@@ -1,111 +1,202 @@
 import streamlit as st
-import pandas as pd
-from docx import Document
 import io
-import zipfile
 from datetime import datetime
 import os
 import re
-
-# Function to replace fields in the document (adapted from report_generator.py)
-def replace_fields(document, data_row):
-    """Replaces placeholders in paragraphs and tables of a docx document."""
-    # Process paragraphs
-    for paragraph in document.paragraphs:
-        paragraph_text = paragraph.text
-        
-        # Try to find placeholders in the paragraph text
-        # This regex will match {{variable}} with or without spaces inside the braces
-        placeholders = re.findall(r'\{\{\s*([^}]+)\s*\}\}', paragraph_text)
-        
-        if placeholders:
-            # Make a copy of the original text
-            new_text = paragraph_text
-            
-            for placeholder in placeholders:
-                # Clean up the placeholder name
-                clean_placeholder = placeholder.strip()
-                
-                # Check if the placeholder exists in the data_row
-                for key, value in data_row.items():
-                    str_key = str(key).strip()
-                    # Check if the key matches the placeholder (case-insensitive)
-                    if str_key.lower() == clean_placeholder.lower():
-                        if pd.notna(value):
-                            if isinstance(value, datetime):
-                                str_value = value.strftime('%Y-%m-%d')  # Format date without time
-                            else:
-                                str_value = str(value)
-                        else:
-                            str_value = ""
-                        
-                        # Replace in the paragraph text
-                        full_placeholder = f"{{{{{placeholder}}}}}"
-                        new_text = new_text.replace(full_placeholder, str_value)
-            
-            # Set the paragraph text to the new text
-            if new_text != paragraph_text:
-                # Clear the paragraph
-                p = paragraph._p
-                p.clear_content()
-                
-                # Add a new run with the new text
-                paragraph.add_run(new_text)
-
-    # Process tables
-    for table in document.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    paragraph_text = paragraph.text
-                    
-                    # Try to find placeholders in the paragraph text
-                    placeholders = re.findall(r'\{\{\s*([^}]+)\s*\}\}', paragraph_text)
-                    
-                    if placeholders:
-                        # Make a copy of the original text
-                        new_text = paragraph_text
-                        
-                        for placeholder in placeholders:
-                            # Clean up the placeholder name
-                            clean_placeholder = placeholder.strip()
-                            
-                            # Check if the placeholder exists in the data_row
-                            for key, value in data_row.items():
-                                str_key = str(key).strip()
-                                
-                                # Check if the key matches the placeholder (case-insensitive)
-                                if str_key.lower() == clean_placeholder.lower():
-                                    str_value = str(value) if pd.notna(value) else ""
-                                    
-                                    # Replace in the paragraph text
-                                    full_placeholder = f"{{{{{placeholder}}}}}"
-                                    new_text = new_text.replace(full_placeholder, str_value)
-                        
-                        # Set the paragraph text to the new text
-                        if new_text != paragraph_text:
-                            # Clear the paragraph
-                            p = paragraph._p
-                            p.clear_content()
-                            
-                            # Add a new run with the new text
-                            paragraph.add_run(new_text)
-    
-    return document
-
-# Function to reset the app state
-def reset_app():
-    """Reset the app state by clearing all session state variables."""
-    # Clear generated reports
-    st.session_state.generated_reports = {}
-    st.session_state.generated_zip_bytes = None
+import math
+import time
+import functools
+import uuid
+from template_library import TemplateLibrary
+from report_archive import ReportArchive
+from artifact_store import ArtifactStore
+from intake import read_header
+from preflight import PreflightReport
+from intake_builder import PlaceholderScanner, expand_templates, placeholder_matrix, build_intake_workbook
+from report_generator import route_column_position
+from report_jobs import (JobManager, run_generation_job, JOB_ID_PATTERN, ACTIVE_STATES,
+                         REPORT_ZIP_ARTIFACT, UPDATED_EXCEL_ARTIFACT, LOG_ARTIFACT, PROFILE_ARTIFACT)
+
+# Number of individual report download buttons shown per page
+REPORTS_PER_PAGE = 20
+
+# Streamlit 1.52+ accepts a callable as download data and only builds the payload when the button is clicked
+DEFERRED_DOWNLOADS = tuple(int(part) for part in re.findall(r'\d+', st.__version__)[:2]) >= (1, 52)
+
+# Compiled templates shared across reruns and sessions, keyed by the template's SHA-256
+@st.cache_resource
+def get_template_library():
+    """Returns the process-wide library of compiled templates."""
+    # Also the pool of the templates rows name in a template column, so it is kept bounded
+    return TemplateLibrary(max_entries=int(os.environ.get("REPORT_TEMPLATE_POOL_SIZE", 16)))
+
+# Placeholders of the intake tab's templates, scanned once per template content
+@st.cache_resource
+def get_placeholder_scanner():
+    """Returns the process-wide placeholder scanner of the intake tab, cached by template hash."""
+    return PlaceholderScanner(workers=os.environ.get("REPORT_SCAN_WORKERS"))
+
+# Generated outputs of all jobs live on disk, bounded by these budgets (environment variables)
+@st.cache_resource
+def get_artifact_store():
+    """Returns the process-wide store of job outputs."""
+    return ArtifactStore(
+        root=os.environ.get("REPORT_ARTIFACT_DIR"),
+        # The REPORT_SESSION_* names of earlier versions are still read
+        job_budget=int(os.environ.get("REPORT_JOB_BUDGET_MB", os.environ.get("REPORT_SESSION_BUDGET_MB", "512"))) * 1024 * 1024,
+        global_budget=int(os.environ.get("REPORT_GLOBAL_BUDGET_MB", "4096")) * 1024 * 1024,
+        job_ttl=int(os.environ.get("REPORT_JOB_TTL_MINUTES", os.environ.get("REPORT_SESSION_TTL_MINUTES", "360"))) * 60,
+    )
+
+# Report generation runs in background threads that outlive reruns and reconnects
+@st.cache_resource
+def get_job_manager():
+    """Returns the process-wide manager of background generation jobs."""
+    return JobManager(max_workers=int(os.environ.get("REPORT_JOB_WORKERS", "2")))
+
+# Functions to keep the current job id in the page URL, so a reload re-attaches to the job
+def get_job_query_param():
+    if hasattr(st, 'query_params'):
+        return st.query_params.get("job")
+    return st.experimental_get_query_params().get("job", [None])[0]
+
+def set_job_query_param(job_id):
+    if hasattr(st, 'query_params'):
+        if job_id is None:
+            st.query_params.pop("job", None)
+        else:
+            st.query_params["job"] = job_id
+    else:
+        st.experimental_set_query_params(**({"job": job_id} if job_id else {}))
+
+# Function to find the job of this browser session
+def get_current_job_id():
+    """Returns the id of the current job, taking it from the URL after a reload."""
+    if st.session_state.get('job_id') is None:
+        job_id = get_job_query_param()
+        if job_id and JOB_ID_PATTERN.fullmatch(job_id):
+            st.session_state.job_id = job_id
+    return st.session_state.get('job_id')
+
+# Function to read the state of a job
+def get_job_status(job_id):
+    """Returns the state dict of a job or None if it is unknown."""
+    return get_job_manager().status(job_id, get_artifact_store().root / job_id)
+
+# Function to clear the results of the last job from the session
+def clear_report_state():
+    """Forgets the outputs of the last job (the files stay with the job)."""
+    st.session_state.loaded_job_id = None
+    st.session_state.generated_reports = []
+    st.session_state.report_archive = None
     st.session_state.generated_zip_filename = None
     st.session_state.processed_count = 0
     st.session_state.skipped_count = 0
     st.session_state.total_rows = 0
-    st.session_state.excel_data = None
-    st.session_state.updated_excel_bytes = None
+    st.session_state.updated_excel_artifact = None
     st.session_state.updated_excel_filename = None
+    st.session_state.log_artifact = None
+    st.session_state.profile_artifact = None
+
+# Function to remove the current job and its outputs
+def discard_job():
+    """Cancels the current job if it still runs and deletes its outputs."""
+    job_id = st.session_state.get('job_id')
+    if job_id is not None:
+        job_manager = get_job_manager()
+        job_manager.cancel(job_id)
+        status = get_job_status(job_id)
+        if status is None or status['state'] not in ACTIVE_STATES:
+            job_manager.forget(job_id)
+            get_artifact_store().clear_job(job_id)
+        # A job that is still running finishes its current row and stops; the TTL cleanup removes its files
+    st.session_state.job_id = None
+    set_job_query_param(None)
+    clear_report_state()
+
+# Function to take over the results of a finished job
+def load_job_results(job_id, status):
+    """Copies the outcome of a finished job into session state (once per job)."""
+    if st.session_state.get('loaded_job_id') == job_id:
+        return
+    clear_report_state()
+    st.session_state.loaded_job_id = job_id
+    artifact_store = get_artifact_store()
+    zip_path = artifact_store.get_path(job_id, REPORT_ZIP_ARTIFACT)
+    if zip_path is not None:
+        st.session_state.report_archive = ReportArchive.open_existing(zip_path)
+        st.session_state.generated_reports = list(st.session_state.report_archive.names)
+        st.session_state.generated_zip_filename = status['zip_filename']
+    st.session_state.processed_count = status['processed_count']
+    st.session_state.skipped_count = status['skipped_count']
+    st.session_state.total_rows = status['total_rows']
+    if status['updated_excel_filename']:
+        st.session_state.updated_excel_artifact = UPDATED_EXCEL_ARTIFACT
+        st.session_state.updated_excel_filename = status['updated_excel_filename']
+    st.session_state.log_artifact = LOG_ARTIFACT
+    if status.get('profile'):
+        st.session_state.profile_artifact = PROFILE_ARTIFACT
+
+# Function to show the progress of a running job
+def show_job_progress(job_id):
+    """Shows progress, log and a cancel button; reruns the page once the job is done."""
+    status = get_job_status(job_id)
+    if status is None or status['state'] not in ACTIVE_STATES:
+        st.rerun()
+    st.info(status['status_text'])
+    st.progress(status['progress'])
+    if st.button("Cancel Generation", key="cancel_job"):
+        get_job_manager().cancel(job_id)
+        st.info("Cancelling... reports that are already generated will be kept.")
+    st.subheader("Processing Log")
+    st.code(status['log_tail'], language="")
+
+# Seconds between progress updates of a running job
+JOB_POLL_INTERVAL = 1.0
+
+# Streamlit 1.37+ can refresh just the progress panel; older versions rerun the whole page
+if hasattr(st, 'fragment'):
+    show_job_progress = st.fragment(run_every=JOB_POLL_INTERVAL)(show_job_progress)
+
+# Function to check the uploaded files before generation
+def show_preflight(excel_bytes, templates):
+    """Shows how the placeholders of each (name, bytes) template match the workbook's header row.
+
+    Returns the PreflightReports, or None when the files cannot be read.
+    When the workbook has a template column, returns no reports: each
+    template is then checked while generating and only fails its own rows.
+    """
+    try:
+        columns = read_header(excel_bytes)
+        position = route_column_position(columns)
+        if position is not None:
+            st.info(f"Each row is rendered with the template named in its '{columns[position]}' column "
+                    f"({len(templates)} template(s) uploaded)."
+                    + (" Rows with an empty cell use the uploaded template." if len(templates) == 1 else ""))
+            return []
+        reports = [(name, PreflightReport(get_template_library().get(template_bytes), columns))
+                   for name, template_bytes in templates]
+    except Exception as e:
+        st.error(f"Could not check the uploaded files: {e}")
+        return None
+    for name, report in reports:
+        messages = report.messages()
+        problems = any(level != "info" for level, _ in messages)
+        title = (f"Pre-flight check{f' ({name})' if len(reports) > 1 else ''}: "
+                 f"{report.matched} of {len(report.placeholders)} placeholders match a column"
+                 + (" ⚠️" if problems else ""))
+        with st.expander(title, expanded=problems):
+            if not messages:
+                st.success("Every placeholder matches a column and every column is used.")
+            for level, message in messages:
+                getattr(st, level)(message)
+    return [report for _, report in reports]
+
+# Function to reset the app state
+def reset_app():
+    """Reset the app state by clearing all session state variables."""
+    # Stop the current job and remove its outputs from the artifact store
+    discard_job()
     
     # Rerun the app to refresh the UI
     st.rerun()  # Use st.rerun() instead of st.experimental_rerun()
@@ -134,13 +225,25 @@ with tab1:
     with col1:
         uploaded_excel = st.file_uploader("1. Upload Excel Intake File (.xlsx)", type="xlsx", key="uploaded_excel")
     with col2:
-        uploaded_template = st.file_uploader("2. Upload Word Template File (.docx)", type="docx", key="uploaded_template")
+        # Several templates render several reports per row, each tracked in its own processed_<template> column,
+        # unless the workbook has a template column naming the template (or bundled template) of each row
+        uploaded_template = st.file_uploader("2. Upload Word Template File(s) (.docx or .zip bundle)",
+                                             type=["docx", "zip"], accept_multiple_files=True,
+                                             key="uploaded_template")
+
+    # Outputs are kept in the artifact store under the job id, session state only holds their names
+    artifact_store = get_artifact_store()
+    artifact_store.cleanup_expired()
 
     # State for generated reports and zip file
+    if 'job_id' not in st.session_state:
+        st.session_state.job_id = None  # Background job of this session, also kept in the URL
+    if 'loaded_job_id' not in st.session_state:
+        st.session_state.loaded_job_id = None  # Job whose results are in session state
     if 'generated_reports' not in st.session_state:
-        st.session_state.generated_reports = {}  # {filename: bytes}
-    if 'generated_zip_bytes' not in st.session_state:
-        st.session_state.generated_zip_bytes = None
+        st.session_state.generated_reports = []  # filenames, the bytes live in report_archive
+    if 'report_archive' not in st.session_state:
+        st.session_state.report_archive = None  # ReportArchive stored as REPORT_ZIP_ARTIFACT
     if 'generated_zip_filename' not in st.session_state:
         st.session_state.generated_zip_filename = None
     if 'processed_count' not in st.session_state:
@@ -149,180 +252,106 @@ with tab1:
         st.session_state.skipped_count = 0
     if 'total_rows' not in st.session_state:
         st.session_state.total_rows = 0
-    if 'excel_data' not in st.session_state:
-        st.session_state.excel_data = None
-    if 'updated_excel_bytes' not in st.session_state:
-        st.session_state.updated_excel_bytes = None
+    if 'updated_excel_artifact' not in st.session_state:
+        st.session_state.updated_excel_artifact = None
     if 'updated_excel_filename' not in st.session_state:
         st.session_state.updated_excel_filename = None
-
-
-    if uploaded_excel is not None and uploaded_template is not None:
-        if st.button("Generate Reports"):
-            # Reset state
-            st.session_state.generated_reports = {}
-            st.session_state.generated_zip_bytes = None
-            st.session_state.generated_zip_filename = None
-            st.session_state.processed_count = 0
-            st.session_state.skipped_count = 0
-            st.session_state.total_rows = 0
-            st.session_state.excel_data = None
-            st.session_state.updated_excel_bytes = None
-            st.session_state.updated_excel_filename = None
-
-            # Create a status area that will be updated during processing
-            status_area = st.empty()
-            status_area.info("Starting report generation process...")
-            
-            # Create a log area for detailed messages
-            log_container = st.container()
-            with log_container:
-                st.subheader("Processing Log")
-                log_area = st.empty()
-                log_messages = []
-                
-                def add_log(message):
-                    log_messages.append(f"{datetime.now().strftime('%H:%M:%S')} - {message}")
-                    log_area.code("\n".join(log_messages), language="")
-
-            try:
-                # Load Excel data
-                add_log(f"Loading Excel file: {uploaded_excel.name}")
-                status_area.info("Loading Excel data...")
-                excel_bytes = io.BytesIO(uploaded_excel.getvalue())
-                df = pd.read_excel(excel_bytes)
-                st.session_state.total_rows = len(df)
-                add_log(f"Found {len(df)} rows in Excel file")
-
-                # Get the original filename
-                original_filename = uploaded_excel.name
-
-                # Clean column names
-                add_log("Cleaning column names")
-                df.columns = [str(col).strip('{}') for col in df.columns]
-                add_log(f"Columns: {', '.join(df.columns.tolist())}")
-
-                # Check for 'processed' column, add if missing
-                if 'processed' not in df.columns:
-                    add_log("Adding 'processed' column (not found in Excel)")
-                    df['processed'] = ''
-                else:
-                    add_log("Found existing 'processed' column")
-                    
-                # Ensure 'processed' is string type to handle various empty values consistently
-                df['processed'] = df['processed'].fillna('').astype(str)
-
-                # Store the original excel data in session state
-                st.session_state.excel_data = df.copy()
-
-                # Load template bytes once
-                add_log(f"Loading Word template: {uploaded_template.name}")
-                status_area.info("Loading Word template...")
-                template_bytes = io.BytesIO(uploaded_template.getvalue())
-
-                # Generate individual reports and store them
-                timestamp_run = datetime.now().strftime("%Y%m%d_%H%M%S")
-                add_log(f"Starting report generation with timestamp: {timestamp_run}")
-                
-                # Create a progress bar
-                progress_bar = st.progress(0)
-                
-                for index, row in df.iterrows():
-                    # Update status with current row
-                    progress_percent = int((index / len(df)) * 100)
-                    progress_bar.progress(progress_percent)
-                    status_area.info(f"Processing row {index + 1} of {len(df)} ({progress_percent}%)...")
-                    
-                    # Check if row should be processed
-                    if row['processed'] != '':
-                        add_log(f"Row {index + 1}: Skipped (already processed as '{row['processed']}')")
-                        st.session_state.skipped_count += 1
-                        continue  # Skip if 'processed' column is not empty
-
-                    # Show what data we're processing
-                    row_data = row.to_dict()
-                    sample_data = {k: v for i, (k, v) in enumerate(row_data.items()) if i < 3}  # Show first 3 fields
-                    add_log(f"Row {index + 1}: Processing data {sample_data}...")
-                    
-                    # Load a fresh template instance for each report
-                    template_bytes.seek(0)  # Reset stream position
-                    document = Document(template_bytes)
-                    add_log(f"Row {index + 1}: Replacing fields in template")
-                    report_doc = replace_fields(document, row.to_dict())
-
-                    # Save the generated document to a temporary byte stream
-                    doc_buffer = io.BytesIO()
-                    report_doc.save(doc_buffer)
-                    doc_buffer.seek(0)
-
-                    # Store the generated report
-                    output_filename = f"report_{timestamp_run}_{index + 1}.docx"
-                    add_log(f"Row {index + 1}: Generated report '{output_filename}'")
-                    st.session_state.generated_reports[output_filename] = doc_buffer.getvalue()
-
-                    # Update the 'processed' column in the DataFrame
-                    st.session_state.excel_data.loc[index, 'processed'] = output_filename
-                    st.session_state.processed_count += 1
-
-                # Complete the progress bar
-                progress_bar.progress(100)
-                
-                if st.session_state.processed_count > 0:
-                    status_message = f"Generated {st.session_state.processed_count} reports. Skipped {st.session_state.skipped_count} previously processed rows (out of {st.session_state.total_rows} total)."
-                    status_area.success(status_message)
-                    add_log(status_message)
-                else:
-                    status_message = f"No new reports generated. All {st.session_state.total_rows} rows were already marked as processed or the file was empty."
-                    status_area.warning(status_message)
-                    add_log(status_message)
-
-                # Create zip file (after individual reports are generated)
-                if st.session_state.generated_reports:
-                    add_log("Creating ZIP file with all generated reports")
-                    status_area.info("Creating ZIP file...")
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                        for filename, report_bytes in st.session_state.generated_reports.items():
-                            zip_file.writestr(filename, report_bytes)
-                    st.session_state.generated_zip_bytes = zip_buffer.getvalue()
-                    st.session_state.generated_zip_filename = f"generated_reports_{timestamp_run}.zip"
-                    add_log(f"ZIP file created: {st.session_state.generated_zip_filename}")
-
-                # Save the updated DataFrame to a new Excel file
-                add_log("Updating Excel file with processing status")
-                status_area.info("Saving updated Excel file...")
-                excel_bytes_output = io.BytesIO()
-                st.session_state.excel_data.to_excel(excel_bytes_output, index=False)
-                excel_bytes_output.seek(0)
-                st.session_state.updated_excel_bytes = excel_bytes_output.getvalue()
-                
-                # Create a filename for the updated Excel file
-                filename_parts = original_filename.rsplit('.', 1)
-                base_name = filename_parts[0]
-                extension = filename_parts[1] if len(filename_parts) > 1 else 'xlsx'
-                st.session_state.updated_excel_filename = f"{base_name}_updated_{timestamp_run}.{extension}"
-                add_log(f"Updated Excel file created: {st.session_state.updated_excel_filename}")
-                
-                # Final status update
-                status_area.success("Processing complete! You can download the generated files below.")
-
-            except Exception as e:
-                st.error(f"An error occurred during report generation: {e}")
-                # Reset state
-                st.session_state.generated_reports = {}
-                st.session_state.generated_zip_bytes = None
-                st.session_state.generated_zip_filename = None
-                st.session_state.processed_count = 0
-                st.session_state.skipped_count = 0
-                st.session_state.total_rows = 0
-                st.session_state.excel_data = None
-                st.session_state.updated_excel_bytes = None
-                st.session_state.updated_excel_filename = None
-
-    # Display individual download buttons
-    if st.session_state.generated_reports:
+    if 'log_artifact' not in st.session_state:
+        st.session_state.log_artifact = None  # Full processing log of the last run
+    if 'profile_artifact' not in st.session_state:
+        st.session_state.profile_artifact = None  # cProfile dump of the last run, if requested
+
+    job_id = get_current_job_id()
+    job_status = get_job_status(job_id) if job_id else None
+    job_active = job_status is not None and job_status['state'] in ACTIVE_STATES
+
+    if uploaded_excel is not None and uploaded_template and not job_active:
+        try:
+            templates = expand_templates([(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_template])
+        except Exception as e:
+            st.error(f"Could not read the uploaded templates: {e}")
+            templates = []
+        # Checked against the header row only, before any row is rendered
+        preflight = show_preflight(uploaded_excel.getvalue(), templates) if templates else None
+        profile_run = st.checkbox("Profile the run (cProfile dump for performance tickets)", key="profile_run")
+        if st.button("Generate Reports", disabled=preflight is None or any(report.blocking for report in preflight)):
+            # Drop the previous job and its outputs
+            discard_job()
+
+            # Generation runs in the background, the page only polls the job's progress
+            job_id = uuid.uuid4().hex
+            get_job_manager().submit(job_id, artifact_store.job_dir(job_id), run_generation_job,
+                                     artifact_store, get_template_library(), uploaded_excel.getvalue(),
+                                     uploaded_excel.name, templates, profile_run)
+            st.session_state.job_id = job_id
+            set_job_query_param(job_id)
+            job_status = get_job_status(job_id)
+            job_active = True
+
+    if job_id and job_status is None:
+        st.warning("The report generation job was not found, its files may have been removed. Please generate the reports again.")
+        st.session_state.job_id = None
+        set_job_query_param(None)
+        job_id = None
+    elif job_active:
+        artifact_store.touch_job(job_id)
+        show_job_progress(job_id)
+    elif job_status is not None:
+        artifact_store.touch_job(job_id)
+        load_job_results(job_id, job_status)
+        for warning in job_status['warnings']:
+            st.warning(warning)
+        if job_status['state'] == "completed":
+            if job_status['processed_count'] > 0:
+                st.success(job_status['message'])
+            else:
+                st.warning(job_status['message'])
+            st.success("Processing complete! You can download the generated files below.")
+        elif job_status['state'] == "cancelled":
+            st.warning(job_status['message'])
+        elif job_status['state'] == "interrupted":
+            st.error("Report generation was interrupted (the server was restarted). Please generate the reports again.")
+        else:
+            st.error(f"An error occurred during report generation: {job_status['error']}")
+        st.subheader("Processing Log")
+        st.code(job_status['log_tail'], language="")
+
+    # Outputs can be evicted from the artifact store when the storage budget runs out
+    reports_available = (st.session_state.report_archive is not None and
+                         artifact_store.get_path(st.session_state.loaded_job_id, REPORT_ZIP_ARTIFACT) is not None)
+    if st.session_state.generated_reports and not reports_available:
+        st.info("The generated reports were removed to free server storage. Please generate them again.")
+
+    # Display individual download buttons, one page at a time
+    # Only the reports on the visible page are read and sent to the browser
+    if st.session_state.generated_reports and reports_available:
         st.subheader("Download Individual Reports:")
-        for filename, report_bytes in st.session_state.generated_reports.items():
+        report_filter = st.text_input("Filter reports by filename", key="report_filter")
+        if report_filter:
+            report_names = [name for name in st.session_state.generated_reports if report_filter.lower() in name.lower()]
+        else:
+            report_names = st.session_state.generated_reports
+
+        page_count = max(1, math.ceil(len(report_names) / REPORTS_PER_PAGE))
+        if st.session_state.get('report_page', 1) > page_count:
+            st.session_state.report_page = 1  # The filter left fewer pages
+        if page_count > 1:
+            page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, step=1, key="report_page")
+        else:
+            page = 1
+        first = (page - 1) * REPORTS_PER_PAGE
+        visible_names = report_names[first:first + REPORTS_PER_PAGE]
+        if report_names:
+            st.caption(f"Showing reports {first + 1}-{first + len(visible_names)} of {len(report_names)}")
+        else:
+            st.caption("No reports match the filter.")
+
+        if DEFERRED_DOWNLOADS:
+            report_archive = st.session_state.report_archive
+            page_reports = [(name, functools.partial(report_archive.read, name)) for name in visible_names]
+        else:
+            page_reports = st.session_state.report_archive.read_many(visible_names)
+        for filename, report_bytes in page_reports:
             st.download_button(
                 label=f"⬇️ Download {filename}",
                 data=report_bytes,
@@ -332,27 +361,60 @@ with tab1:
             )
 
     # Display Zip Download Button
-    if st.session_state.generated_zip_bytes:
+    if reports_available:
         st.subheader("Download All Reports as ZIP:")
+        if DEFERRED_DOWNLOADS:
+            zip_data = st.session_state.report_archive.read_all
+        else:
+            zip_data = st.session_state.report_archive.read_all()
         st.download_button(
             label=f"⬇️ Download All Reports ({len(st.session_state.generated_reports)} files) as ZIP",
-            data=st.session_state.generated_zip_bytes,
+            data=zip_data,
             file_name=st.session_state.generated_zip_filename,
             mime="application/zip",
             key="download_zip"
         )
 
     # Display Updated Excel Download Button
-    if st.session_state.updated_excel_bytes:
+    updated_excel_path = None
+    if st.session_state.updated_excel_artifact:
+        updated_excel_path = artifact_store.get_path(st.session_state.loaded_job_id, st.session_state.updated_excel_artifact)
+    if updated_excel_path is not None:
         st.subheader("Download Updated Excel File:")
         st.download_button(
             label=f"⬇️ Download Updated Excel File (with 'processed' column updated)",
-            data=st.session_state.updated_excel_bytes,
+            data=updated_excel_path.read_bytes if DEFERRED_DOWNLOADS else updated_excel_path.read_bytes(),
             file_name=st.session_state.updated_excel_filename,
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             key="download_excel"
         )
 
+    # Display Full Log Download Button
+    log_path = None
+    if st.session_state.log_artifact:
+        log_path = artifact_store.get_path(st.session_state.loaded_job_id, st.session_state.log_artifact)
+    if log_path is not None:
+        st.download_button(
+            label="⬇️ Download Full Processing Log",
+            data=log_path.read_bytes if DEFERRED_DOWNLOADS else log_path.read_bytes(),
+            file_name=f"processing_log_{st.session_state.loaded_job_id[:8]}.txt",
+            mime="text/plain",
+            key="download_log"
+        )
+
+    # Display Profile Download Button (only for runs started with profiling)
+    profile_path = None
+    if st.session_state.profile_artifact:
+        profile_path = artifact_store.get_path(st.session_state.loaded_job_id, st.session_state.profile_artifact)
+    if profile_path is not None:
+        st.download_button(
+            label="⬇️ Download Profile (pstats)",
+            data=profile_path.read_bytes if DEFERRED_DOWNLOADS else profile_path.read_bytes(),
+            file_name=f"profile_{st.session_state.loaded_job_id[:8]}.pstats",
+            mime="application/octet-stream",
+            key="download_profile"
+        )
+
     # Display message if all rows were skipped
     if st.session_state.total_rows > 0 and st.session_state.processed_count == 0 and st.session_state.skipped_count == st.session_state.total_rows:
         # Explicit message if all rows were skipped
@@ -364,49 +426,41 @@ with tab2:
     st.header("Create Intake Excel Template")
     st.info("This section allows you to create a blank Excel template based on the placeholders found in a Word document. It will create [variables] from info within brackets.")
 
-    uploaded_template_for_xls = st.file_uploader("Upload Word Template to Extract Placeholders (.docx)", type="docx", key="uploaded_template_xls")
+    uploaded_templates_for_xls = st.file_uploader(
+        "Upload Word Templates to Extract Placeholders (.docx files or a .zip of templates)",
+        type=["docx", "zip"],
+        accept_multiple_files=True,
+        key="uploaded_template_xls",
+    )
 
-    if uploaded_template_for_xls is not None:
+    if uploaded_templates_for_xls:
         if st.button("Generate Intake Template", key="generate_xls"):
             try:
-                st.info("Processing template to find placeholders...")
-                template_bytes_xls = io.BytesIO(uploaded_template_for_xls.getvalue())
-                document_xls = Document(template_bytes_xls)
-                placeholders = set() # Use a set to avoid duplicates
-
-                # Function to extract placeholders (can be reused or adapted)
-                def extract_placeholders(text):
-                    return re.findall(r'\[\s*([^\]]+)\s*\]', text)
-
-                # Extract from paragraphs
-                for paragraph in document_xls.paragraphs:
-                    found = extract_placeholders(paragraph.text)
-                    for p in found:
-                        placeholders.add(p.strip())
-
-                # Extract from tables
-                for table in document_xls.tables:
-                    for row in table.rows:
-                        for cell in row.cells:
-                            for paragraph in cell.paragraphs:
-                                found = extract_placeholders(paragraph.text)
-                                for p in found:
-                                    placeholders.add(p.strip())
-
-                if not placeholders:
-                    st.warning("No placeholders found in the format {{variable_name}}.")
+                st.info("Processing templates to find placeholders...")
+                templates_xls = expand_templates([(f.name, f.getvalue()) for f in uploaded_templates_for_xls])
+                scanner = get_placeholder_scanner()
+                hits_before = scanner.hits
+                results, scan_errors = scanner.scan(templates_xls)
+                cached_count = scanner.hits - hits_before
+
+                for template_name, error in scan_errors.items():
+                    st.error(f"Could not read {template_name}: {error}")
+
+                placeholders = sorted({name for found in results.values() for name in found})
+                if not templates_xls:
+                    st.warning("No .docx templates found in the upload.")
+                elif not placeholders:
+                    st.warning("No placeholders found in the format [variable_name].")
                 else:
-                    st.success(f"Found {len(placeholders)} unique placeholders: {', '.join(sorted(list(placeholders)))}")
-
-                    # Create an Excel file
-                    output_df = pd.DataFrame(columns=sorted(list(placeholders)))
-                    # Add the 'processed' column, essential for the report generation tab
-                    if 'processed' not in output_df.columns:
-                         output_df['processed'] = None # Add it if not extracted
+                    st.success(
+                        f"Found {len(placeholders)} unique placeholders in {len(results)} templates "
+                        f"({cached_count} unchanged, read from cache): {', '.join(placeholders)}"
+                    )
+                    if len(results) > 1:
+                        st.dataframe(placeholder_matrix(results))
 
-                    excel_output_buffer = io.BytesIO()
-                    output_df.to_excel(excel_output_buffer, index=False)
-                    excel_output_buffer.seek(0)
+                    # The first sheet holds the placeholders plus the 'processed' column used by report generation
+                    excel_output_buffer = io.BytesIO(build_intake_workbook(results))
 
                     xls_filename = f"intake_template_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
 
@@ -420,3 +474,10 @@ with tab2:
 
             except Exception as e:
                 st.error(f"An error occurred while generating the intake template: {e}")
+
+# Without fragments (Streamlit < 1.37) a running job is polled by rerunning the whole page
+if not hasattr(st, 'fragment') and st.session_state.get('job_id'):
+    polled_status = get_job_status(st.session_state.job_id)
+    if polled_status is not None and polled_status['state'] in ACTIVE_STATES:
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
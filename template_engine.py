@@ -0,0 +1,387 @@
+import base64
+import functools
+import hashlib
+import io
+import itertools
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from docx.opc.constants import CONTENT_TYPE
+from docx.opc.part import PartFactory, XmlPart
+from lxml import etree
+
+# Placeholder syntaxes used by the entry points
+# {{variable}} (Streamlit app) and {variable} (command line generator)
+DOUBLE_BRACE_PATTERN = re.compile(r'\{\{\s*([^}]+)\s*\}\}')
+SINGLE_BRACE_PATTERN = re.compile(r'\{([^{}]+)\}')
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W_P = f"{{{W_NS}}}p"
+W_T = f"{{{W_NS}}}t"
+W_BR = f"{{{W_NS}}}br"
+W_TAB = f"{{{W_NS}}}tab"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+DOCUMENT_PART = "word/document.xml"
+CONTENT_TYPES_PART = "[Content_Types].xml"
+CT_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+
+# Parts whose paragraphs can hold placeholders: the main document (also .dotx/.docm),
+# headers, footers, footnotes and endnotes. Tables, nested tables and text boxes are
+# inside these parts.
+STORY_CONTENT_TYPE_SUFFIXES = (
+    ".main+xml",
+    "wordprocessingml.header+xml",
+    "wordprocessingml.footer+xml",
+    "wordprocessingml.footnotes+xml",
+    "wordprocessingml.endnotes+xml",
+)
+
+# python-docx loads footnotes and endnotes as opaque blobs; as XML parts their
+# paragraphs can be edited like the others and are written back on save
+for _notes_content_type in (CONTENT_TYPE.WML_FOOTNOTES, CONTENT_TYPE.WML_ENDNOTES):
+    PartFactory.part_type_for.setdefault(_notes_content_type, XmlPart)
+
+# Private use characters mark the placeholder slots while the XML is serialized
+SLOT_START = "\ue000"
+SLOT_END = "\ue001"
+SLOT_PATTERN = re.compile(f"{SLOT_START}(\\d+){SLOT_END}")
+
+# Characters that are not allowed in XML 1.0 documents
+INVALID_XML_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Line breaks and tabs in run text, written as <w:br/> and <w:tab/>
+RUN_SPECIAL_CHARS = re.compile(r'(\r\n|\r|\n|\t)')
+
+# Line breaks and tabs close the current text node and insert the matching element,
+# the same way python-docx handles them in run text
+BREAK_XML = '</w:t><w:br/><w:t xml:space="preserve">'
+TAB_XML = '</w:t><w:tab/><w:t xml:space="preserve">'
+
+
+def escape_value(value):
+    """Escapes a replacement value so it can be placed inside a <w:t> element."""
+    text = INVALID_XML_CHARS.sub('', escape(value))
+    if '\n' in text or '\r' in text or '\t' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        text = text.replace('\n', BREAK_XML).replace('\t', TAB_XML)
+    return text
+
+
+def copy_zip_info(info):
+    """Copies the name, timestamp and compression of a zip member so output is reproducible."""
+    new_info = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.external_attr = info.external_attr
+    return new_info
+
+
+def story_part_names(package):
+    """Names of the story parts of an open .docx zip, from [Content_Types].xml."""
+    try:
+        content_types = etree.fromstring(package.read(CONTENT_TYPES_PART))
+    except KeyError:
+        return [DOCUMENT_PART]
+    names = []
+    for override in content_types.iter(f"{{{CT_NS}}}Override"):
+        if override.get("ContentType", "").endswith(STORY_CONTENT_TYPE_SUFFIXES):
+            names.append(override.get("PartName", "").lstrip("/"))
+    return names or [DOCUMENT_PART]
+
+
+def story_paragraphs(document):
+    """Returns every <w:p> element of a python-docx Document, each exactly once.
+
+    Covers the body with its tables, nested tables and text boxes, and the
+    headers, footers, footnotes and endnotes (loaded as XML parts, see above).
+    One pass over the XML, unlike document.tables/row.cells which rebuild cell
+    grids and repeat merged cells.
+    """
+    paragraphs = []
+    for part in document.part.package.iter_parts():
+        if part.content_type.endswith(STORY_CONTENT_TYPE_SUFFIXES) and hasattr(part, 'element'):
+            paragraphs.extend(part.element.iter(W_P))
+    return paragraphs
+
+
+def paragraph_text_nodes(paragraph):
+    """Returns the <w:t> elements that belong directly to a paragraph (not nested ones)."""
+    nodes = []
+    for node in paragraph.iter(W_T):
+        # Skip text of paragraphs nested inside this one (e.g. text boxes)
+        if next(node.iterancestors(W_P)) is paragraph:
+            nodes.append(node)
+    return nodes
+
+
+def splice_paragraph(paragraph, pattern, replacement_for, nodes=None):
+    """Replaces placeholders in a paragraph by editing only the <w:t> nodes they cover.
+
+    Each match of pattern in the paragraph text is mapped to the text nodes of
+    its character span. The replacement goes into the node where the
+    placeholder starts and the rest of the placeholder is cut from the
+    following nodes; every other run keeps its text and formatting.
+    replacement_for is called once per match in document order and returns
+    the new text, or None to leave the placeholder. nodes can pass in the
+    paragraph's text nodes if the caller already has them. Returns the number
+    of replaced placeholders.
+    """
+    if nodes is None:
+        nodes = paragraph_text_nodes(paragraph)
+    texts = [node.text or '' for node in nodes]
+    matches = list(pattern.finditer(''.join(texts)))
+    if not matches:
+        return 0
+    replacements = [replacement_for(match) for match in matches]
+
+    starts = []
+    position = 0
+    for text in texts:
+        starts.append(position)
+        position += len(text)
+
+    # The text is edited back to front so the offsets of earlier placeholders stay valid
+    replaced = 0
+    for match, replacement in reversed(list(zip(matches, replacements))):
+        if replacement is None:
+            continue
+        replaced += 1
+        begin, end = match.span()
+        for i, text in enumerate(texts):
+            node_begin = starts[i]
+            node_end = node_begin + len(nodes[i].text or '')
+            if node_end <= begin or node_begin >= end:
+                continue
+            local_begin = max(begin - node_begin, 0)
+            local_end = min(end, node_end) - node_begin
+            texts[i] = text[:local_begin] + (replacement if node_begin <= begin < node_end else '') + text[local_end:]
+
+    for node, text in zip(nodes, texts):
+        if text != (node.text or ''):
+            node.text = text
+            node.set(XML_SPACE, 'preserve')
+    return replaced
+
+
+def mark_slots(paragraph, pattern, add_slot, nodes=None):
+    """Replaces each placeholder in a paragraph with a slot marker.
+
+    add_slot is called with the placeholder match and returns the slot number.
+    """
+    return splice_paragraph(paragraph, pattern, lambda match: f"{SLOT_START}{add_slot(match)}{SLOT_END}", nodes) > 0
+
+
+def set_run_text(node, text):
+    """Sets the text of a <w:t> node, turning line breaks and tabs into <w:br/> and <w:tab/>.
+
+    Characters that XML does not allow are dropped. Matches how python-docx
+    writes run text.
+    """
+    pieces = RUN_SPECIAL_CHARS.split(INVALID_XML_CHARS.sub('', text))
+    node.text = pieces[0]
+    node.set(XML_SPACE, 'preserve')
+    anchor = node
+    for separator, piece in zip(pieces[1::2], pieces[2::2]):
+        element = node.makeelement(W_TAB if separator == '\t' else W_BR, {})
+        anchor.addnext(element)
+        anchor = element
+        if piece:
+            text_node = node.makeelement(W_T, {XML_SPACE: 'preserve'})
+            text_node.text = piece
+            anchor.addnext(text_node)
+            anchor = text_node
+
+
+def replace_in_paragraph(paragraph, pattern, value_for):
+    """Replaces placeholders in a live document paragraph with plain text values.
+
+    Like splice_paragraph, but values may contain line breaks and tabs (which
+    become <w:br/>/<w:tab/> in the run) and characters XML does not allow are
+    dropped. value_for(match) returns the value or None to keep the placeholder.
+    """
+    def replacement_for(match):
+        value = value_for(match)
+        if value is None:
+            return None
+        return INVALID_XML_CHARS.sub('', value)
+
+    nodes = paragraph_text_nodes(paragraph)
+    before = [node.text for node in nodes]
+    replaced = splice_paragraph(paragraph, pattern, replacement_for, nodes)
+    if replaced:
+        for node, text in zip(nodes, before):
+            if node.text != text and node.text and RUN_SPECIAL_CHARS.search(node.text):
+                set_run_text(node, node.text)
+    return replaced
+
+
+class CompiledTemplate:
+    """A Word template parsed once into static XML fragments and placeholder slots.
+
+    Every story part (body with tables and text boxes, headers, footers,
+    footnotes, endnotes) is parsed once and each of its paragraphs visited
+    once. Rendering a row only joins the fragments of the parts that have
+    placeholders with the escaped row values and appends them to a prebuilt
+    copy of the other package parts.
+    """
+
+    def __init__(self, template_bytes, pattern=DOUBLE_BRACE_PATTERN, ignore_case=True):
+        self.ignore_case = ignore_case
+        self.sha256 = hashlib.sha256(template_bytes).hexdigest()
+        self.slots = []  # (normalized name, original placeholder text) per slot
+        self.split_placeholders = []  # Placeholder texts Word split across several runs
+        self.parts = []  # (ZipInfo, fragments, slot order) of each part with placeholders
+
+        with zipfile.ZipFile(io.BytesIO(template_bytes)) as source:
+            templated = {}
+            for name in story_part_names(source):
+                try:
+                    part_xml = source.read(name)
+                except KeyError:
+                    continue
+                if SLOT_START.encode('utf-8') in part_xml or SLOT_END.encode('utf-8') in part_xml:
+                    raise ValueError("Template contains reserved private use characters")
+                root = etree.fromstring(part_xml)
+                found = False
+                for paragraph in root.iter(W_P):
+                    nodes = paragraph_text_nodes(paragraph)
+                    # Offsets where one run's text ends and the next begins
+                    run_ends = list(itertools.accumulate(len(node.text or '') for node in nodes[:-1]))
+                    add_slot = functools.partial(self._add_slot, run_ends=run_ends)
+                    found = mark_slots(paragraph, pattern, add_slot, nodes) or found
+                if found:
+                    templated[name] = root
+
+            # Zip of every part without placeholders, reused as the start of each report
+            prefix_buffer = io.BytesIO()
+            with zipfile.ZipFile(prefix_buffer, 'w') as prefix:
+                for info in source.infolist():
+                    if info.filename not in templated:
+                        prefix.writestr(copy_zip_info(info), source.read(info.filename))
+                    else:
+                        part_info = copy_zip_info(info)
+                        part_info.compress_type = zipfile.ZIP_DEFLATED
+                        self.parts.append((part_info,) + self._split(templated[info.filename]))
+            self.package_prefix = prefix_buffer.getvalue()
+
+    def to_plan(self):
+        """Returns the compiled template as plain data that json can store."""
+        return {
+            "ignore_case": self.ignore_case,
+            "sha256": self.sha256,
+            "slots": [list(slot) for slot in self.slots],
+            "split_placeholders": self.split_placeholders,
+            "parts": [{
+                "filename": info.filename,
+                "date_time": list(info.date_time),
+                "external_attr": info.external_attr,
+                "fragments": [fragment.decode('utf-8') for fragment in fragments],
+                "slot_order": slot_order,
+            } for info, fragments, slot_order in self.parts],
+            "package_prefix": base64.b64encode(self.package_prefix).decode('ascii'),
+        }
+
+    @classmethod
+    def from_plan(cls, plan):
+        """Rebuilds a compiled template from the data of to_plan() without parsing the .docx again."""
+        template = cls.__new__(cls)
+        template.ignore_case = plan["ignore_case"]
+        template.sha256 = plan["sha256"]
+        template.slots = [tuple(slot) for slot in plan["slots"]]
+        template.split_placeholders = list(plan["split_placeholders"])
+        template.parts = []
+        for part in plan["parts"]:
+            info = zipfile.ZipInfo(part["filename"], date_time=tuple(part["date_time"]))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = part["external_attr"]
+            fragments = [fragment.encode('utf-8') for fragment in part["fragments"]]
+            template.parts.append((info, fragments, list(part["slot_order"])))
+        template.package_prefix = base64.b64decode(plan["package_prefix"])
+        return template
+
+    @staticmethod
+    def _split(root):
+        xml = etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True).decode('utf-8')
+        pieces = SLOT_PATTERN.split(xml)
+        # Even entries are static XML, odd entries are slot numbers
+        return [piece.encode('utf-8') for piece in pieces[0::2]], [int(number) for number in pieces[1::2]]
+
+    def _add_slot(self, match, run_ends=()):
+        self.slots.append((self.normalize(match.group(1)), match.group(0)))
+        begin, end = match.span()
+        if match.group(0) not in self.split_placeholders and any(begin < run_end < end for run_end in run_ends):
+            self.split_placeholders.append(match.group(0))
+        return len(self.slots) - 1
+
+    def normalize(self, name):
+        """Normalizes a placeholder or column name for lookup."""
+        name = str(name).strip()
+        return name.lower() if self.ignore_case else name
+
+    @property
+    def placeholders(self):
+        """Unique normalized placeholder names in document order."""
+        return list(dict.fromkeys(name for name, _ in self.slots))
+
+    def bind_columns(self, column_index):
+        """Resolves the placeholders against a column index once per run.
+
+        Returns ({placeholder: column position}, [placeholders without a column]).
+        """
+        bound = {}
+        missing = []
+        for name in self.placeholders:
+            if name in column_index:
+                bound[name] = column_index[name]
+            else:
+                missing.append(name)
+        return bound, missing
+
+    def render_part(self, part, values):
+        """Builds the XML of one templated part from a {normalized name: string value} mapping.
+
+        Placeholders without a value are left in the document as they are.
+        """
+        _, fragments, slot_order = part
+        pieces = [fragments[0]]
+        for number, fragment in zip(slot_order, fragments[1:]):
+            name, original = self.slots[number]
+            value = values.get(name)
+            if value is None:
+                value = original
+            pieces.append(escape_value(value).encode('utf-8'))
+            pieces.append(fragment)
+        return b''.join(pieces)
+
+    def render(self, values):
+        """Renders a complete .docx file and returns its bytes."""
+        buffer = io.BytesIO(self.package_prefix)
+        with zipfile.ZipFile(buffer, 'a') as package:
+            for part in self.parts:
+                package.writestr(part[0], self.render_part(part, values))
+        return buffer.getvalue()
+
+
+def build_column_index(columns, normalize):
+    """Maps normalized column names to column positions, built once per run.
+
+    Returns ({normalized name: position}, {normalized name: [column names]}).
+    When several columns normalize to the same name the first one is used and
+    the clash is listed in the second dictionary.
+    """
+    index = {}
+    collisions = {}
+    for position, column in enumerate(columns):
+        key = normalize(column)
+        if key in index:
+            collisions.setdefault(key, [columns[index[key]]]).append(column)
+        else:
+            index[key] = position
+    return index, collisions
+
+
+def load_compiled_template(path, pattern=DOUBLE_BRACE_PATTERN, ignore_case=True):
+    """Reads and compiles a template file from disk."""
+    with open(path, 'rb') as template_file:
+        return CompiledTemplate(template_file.read(), pattern=pattern, ignore_case=ignore_case)
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from template_engine import CompiledTemplate, DOUBLE_BRACE_PATTERN
+
+# Bump when CompiledTemplate changes so stale entries on disk are not loaded
+TEMPLATE_FORMAT_VERSION = 4
+
+
+class TemplateLibrary:
+    """Compiled templates keyed by the SHA-256 of the template bytes.
+
+    Holds up to max_entries parsed templates (with their placeholder inventory)
+    in memory, least recently used first out. With store_dir set, the compiled
+    XML fragments and slots are also written to disk as JSON so later runs skip
+    parsing entirely. JSON rather than pickle, so a file planted in the store
+    cannot run code when it is loaded.
+    Safe to share between threads (e.g. through st.cache_resource).
+    """
+
+    def __init__(self, max_entries=16, store_dir=None, max_stored=64):
+        self.max_entries = max_entries
+        self.max_stored = max_stored
+        self.store_dir = Path(store_dir) if store_dir else None
+        if self.store_dir is not None:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(template_hash, pattern, ignore_case):
+        options = f"{TEMPLATE_FORMAT_VERSION}|{pattern.pattern}|{ignore_case}".encode('utf-8')
+        return f"{template_hash}-{hashlib.sha256(options).hexdigest()[:12]}"
+
+    def get(self, template_bytes, pattern=DOUBLE_BRACE_PATTERN, ignore_case=True):
+        """Returns the compiled template for the given bytes, compiling it only on a miss."""
+        key = self.key(hashlib.sha256(template_bytes).hexdigest(), pattern, ignore_case)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+
+        template = self._load_stored(key)
+        if template is None:
+            self.misses += 1
+            template = CompiledTemplate(template_bytes, pattern=pattern, ignore_case=ignore_case)
+            self._store(key, template)
+        else:
+            self.hits += 1
+
+        with self._lock:
+            self._templates[key] = template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        return template
+
+    def get_file(self, path, pattern=DOUBLE_BRACE_PATTERN, ignore_case=True):
+        """Returns the compiled template of a template file."""
+        return self.get(Path(path).read_bytes(), pattern=pattern, ignore_case=ignore_case)
+
+    def _stored_path(self, key):
+        return self.store_dir / f"{key}.json"
+
+    def _load_stored(self, key):
+        if self.store_dir is None:
+            return None
+        path = self._stored_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as stored:
+                template = CompiledTemplate.from_plan(json.load(stored))
+            os.utime(path)  # Mark as recently used
+            return template
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # A damaged entry is simply compiled again
+            return None
+
+    def _store(self, key, template):
+        if self.store_dir is None:
+            return
+        path = self._stored_path(key)
+        temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(temporary_path, 'w', encoding='utf-8') as stored:
+            json.dump(template.to_plan(), stored)
+        os.replace(temporary_path, path)
+
+        # Keep only the most recently used entries on disk
+        entries = sorted(self.store_dir.glob('*.json'), key=lambda entry: entry.stat().st_mtime, reverse=True)
+        for entry in entries[self.max_stored:]:
+            try:
+                entry.unlink()
+            except FileNotFoundError:
+                pass
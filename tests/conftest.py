@@ -0,0 +1,80 @@
+import sys
+from pathlib import Path
+
+import zipfile
+
+import openpyxl
+import pytest
+from docx import Document
+
+# The modules live at the top of the repository, the synthetic data builders in benchmarks/
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from synthetic import build_template  # noqa: E402
+
+
+def write_workbook(path, header, rows):
+    """Writes a one-sheet intake workbook and returns its path."""
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+    return path
+
+
+def notes_xml(kind, text):
+    """A footnotes.xml or endnotes.xml part with the two separator notes Word writes and one note of text."""
+    tag = kind[:-1]
+    return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<w:{kind} xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:{tag} w:type="separator" w:id="-1"><w:p><w:r><w:separator/></w:r></w:p></w:{tag}>'
+            f'<w:{tag} w:type="continuationSeparator" w:id="0"><w:p><w:r><w:continuationSeparator/></w:r></w:p></w:{tag}>'
+            f'<w:{tag} w:id="1"><w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p></w:{tag}>'
+            f'</w:{kind}>').encode('utf-8')
+
+
+def build_notes_template(path, body, footnote, endnote):
+    """Writes a template whose body paragraph references one footnote and one endnote.
+
+    python-docx cannot add notes, so the parts, their content types and
+    relationships are added to the saved package directly.
+    """
+    document = Document()
+    document.add_paragraph(body)
+    document.save(path)
+    with zipfile.ZipFile(path) as source:
+        parts = [(info, source.read(info.filename)) for info in source.infolist()]
+    content_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.{}+xml"
+    relationship = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/{}"
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as package:
+        for info, data in parts:
+            if info.filename == "[Content_Types].xml":
+                data = data.replace(b"</Types>", "".join(
+                    f'<Override PartName="/word/{kind}.xml" ContentType="{content_type.format(kind)}"/>'
+                    for kind in ("footnotes", "endnotes")).encode('utf-8') + b"</Types>")
+            elif info.filename == "word/_rels/document.xml.rels":
+                data = data.replace(b"</Relationships>", "".join(
+                    f'<Relationship Id="rId{kind}" Type="{relationship.format(kind)}" Target="{kind}.xml"/>'
+                    for kind in ("footnotes", "endnotes")).encode('utf-8') + b"</Relationships>")
+            elif info.filename == "word/document.xml":
+                data = data.replace(f"{body}</w:t></w:r>".encode('utf-8'), f"{body}</w:t></w:r>".encode('utf-8')
+                                    + b'<w:r><w:footnoteReference w:id="1"/></w:r>'
+                                    + b'<w:r><w:endnoteReference w:id="1"/></w:r>')
+            package.writestr(info, data)
+        package.writestr("word/footnotes.xml", notes_xml("footnotes", footnote))
+        package.writestr("word/endnotes.xml", notes_xml("endnotes", endnote))
+    return path
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    """Inputs/ with a {column} template (template.docx) over the columns field_01..field_04."""
+    directory = tmp_path / "Inputs"
+    directory.mkdir()
+    build_template(directory / "template.docx", paragraphs=5, placeholders=8, columns=4, tables=1,
+                   braces="single", seed=1)
+    return directory
@@ -0,0 +1,14 @@
+from artifact_store import ArtifactStore
+
+
+def test_budget_applies_to_each_job(tmp_path):
+    store = ArtifactStore(root=tmp_path, job_budget=10, global_budget=100)
+    store.put_bytes("job-a", "first.docx", b"x" * 6)
+    store.put_bytes("job-b", "first.docx", b"x" * 6)
+    store.put_bytes("job-a", "second.docx", b"x" * 6)
+
+    # Only job-a went over its budget, so only its oldest output was removed
+    assert store.get_path("job-a", "first.docx") is None
+    assert store.get_path("job-a", "second.docx") is not None
+    assert store.get_path("job-b", "first.docx") is not None
+    assert store.job_bytes("job-a") == 6
@@ -0,0 +1,41 @@
+import json
+
+from conftest import write_workbook
+from report_generator import EXIT_FAILED, EXIT_OK, EXIT_USAGE, main
+
+HEADER = ["field_01", "field_02", "field_03", "field_04", "processed"]
+
+
+def run_batch(inputs, tmp_path, *arguments):
+    summary_path = tmp_path / "summary.json"
+    summary_path.unlink(missing_ok=True)
+    exit_code = main(["--input-dir", str(inputs), "--output-dir", str(tmp_path / "Outputs"), "--no-journal",
+                      "--summary", str(summary_path), *arguments])
+    summary = json.loads(summary_path.read_text(encoding='utf-8')) if summary_path.exists() else None
+    return exit_code, summary
+
+
+def test_batch_exit_codes(inputs, tmp_path):
+    write_workbook(inputs / "good_1.xlsx", HEADER, [["a", 1, 2, 3, None], ["b", 4, 5, 6, None]])
+    write_workbook(inputs / "good_2.xlsx", HEADER, [["c", 7, 8, 9, None]])
+    write_workbook(inputs / "unmatched.xlsx", ["name", "processed"], [["d", None]])
+
+    exit_code, summary = run_batch(inputs, tmp_path, "--excel", "good_*.xlsx", "--template", "template.docx")
+    assert exit_code == EXIT_OK
+    assert (summary["totals"]["jobs"], summary["totals"]["processed"], summary["totals"]["failed_jobs"]) == (2, 3, 0)
+
+    # A failing job is recorded and the batch goes on with the next one
+    manifest = tmp_path / "jobs.json"
+    manifest.write_text(json.dumps([{"excel": str(inputs / "unmatched.xlsx"), "template": str(inputs / "template.docx")},
+                                    {"excel": str(inputs / "good_2.xlsx"), "template": str(inputs / "template.docx")}]),
+                        encoding='utf-8')
+    write_workbook(inputs / "good_2.xlsx", HEADER, [["c", 7, 8, 9, None]])
+    exit_code, summary = run_batch(inputs, tmp_path, "--manifest", str(manifest))
+    assert exit_code == EXIT_FAILED
+    assert [job["status"] for job in summary["jobs"]] == ["failed", "ok"]
+
+    # No matching workbook or template is a usage error, nothing runs
+    exit_code, summary = run_batch(inputs, tmp_path, "--excel", "missing_*.xlsx", "--template", "template.docx")
+    assert (exit_code, summary) == (EXIT_USAGE, None)
+    exit_code, summary = run_batch(inputs, tmp_path, "--excel", "good_1.xlsx", "--template", "missing.docx")
+    assert (exit_code, summary) == (EXIT_USAGE, None)
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from conftest import write_workbook
+from report_generator import EXIT_FAILED, EXIT_OK, main
+
+# template.docx uses field_01..field_04
+COMPLETE = ["field_01", "field_02", "field_03", "field_04", "processed"]
+PARTIAL = ["field_01", "field_02", "processed"]
+UNMATCHED = ["name", "processed"]
+
+
+def dry_run(inputs, tmp_path, header, rows, *options):
+    write_workbook(inputs / "rows.xlsx", header, rows)
+    summary_path = tmp_path / "summary.json"
+    exit_code = main(["--input-dir", str(inputs), "--output-dir", str(tmp_path / "Outputs"), "--excel", "rows.xlsx",
+                      "--dry-run", "--summary", str(summary_path), *options])
+    return exit_code, json.loads(summary_path.read_text(encoding='utf-8'))["jobs"][0]
+
+
+@pytest.mark.parametrize("header, options, expected", [
+    (COMPLETE, [], EXIT_OK),
+    (PARTIAL, [], EXIT_OK),
+    (PARTIAL, ["--strict"], EXIT_FAILED),
+    (UNMATCHED, [], EXIT_FAILED),
+])
+def test_dry_run_applies_the_preflight_check(inputs, tmp_path, header, options, expected):
+    rows = [["x"] * (len(header) - 1) + [None]]
+    exit_code, job = dry_run(inputs, tmp_path, header, rows, "--template", "template.docx", *options)
+    assert exit_code == expected
+    assert job["status"] == ("planned" if expected == EXIT_OK else "failed")
+    assert job["pending"] == 1
+    assert not list((tmp_path / "Outputs").glob("*.docx"))
+
+
+@pytest.mark.parametrize("route, expected", [("template", EXIT_OK), ("missing", EXIT_FAILED), ("", EXIT_FAILED)])
+def test_dry_run_fails_rows_without_a_template(inputs, tmp_path, route, expected):
+    rows = [["a", "b", "c", "d", route, None]]
+    exit_code, job = dry_run(inputs, tmp_path, COMPLETE[:-1] + ["template", "processed"], rows)
+    assert exit_code == expected
+    assert job["status"] == ("planned" if expected == EXIT_OK else "failed")
+    assert job["unrouted"] == ({} if expected == EXIT_OK else {route: 1})
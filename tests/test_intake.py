@@ -0,0 +1,100 @@
+import io
+import zipfile
+from datetime import datetime
+
+import openpyxl
+import openpyxl.styles
+import pytest
+
+from conftest import write_workbook
+from intake import (StreamingIntakeReader, first_sheet_part, format_columns, patch_sheet_stream, read_intake,
+                    write_processed_cells)
+
+HEADER = ["number", "flag", "code", "date", "mixed", "processed"]
+ROWS = [
+    [1, True, "007", datetime(2024, 1, 2), 1.5, None],
+    [2, None, "12", None, "text", "done.docx"],
+    [None, False, "x", datetime(2024, 3, 4, 5, 6), None, None],
+    [4, True, "3", datetime(2024, 5, 6), 7, None],
+    [5, None, None, None, datetime(2024, 7, 8), None],
+]
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    return write_workbook(tmp_path / "intake.xlsx", HEADER, ROWS)
+
+
+def formatted_rows(chunks):
+    rows = {}
+    for chunk in chunks:
+        formatted = format_columns(chunk)
+        for index, row in zip(formatted.index, formatted.itertuples(index=False, name=None)):
+            rows[index] = row
+    return rows
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3])
+def test_chunked_rows_format_like_one_chunk(workbook, chunk_size):
+    whole = formatted_rows(StreamingIntakeReader(workbook, chunk_size=1000))
+    assert formatted_rows(StreamingIntakeReader(workbook, chunk_size=chunk_size)) == whole
+    assert whole[0][:5] == ("1", "True", "007", "2024-01-02", "1.5")
+    assert whole[2][:5] == ("", "False", "x", "2024-03-04", "")
+    assert 1 not in whole  # processed
+
+
+def test_loaded_workbook_formats_like_streamed_one(workbook):
+    streamed = formatted_rows(StreamingIntakeReader(workbook, chunk_size=2))
+    df = read_intake(workbook)
+    assert list(df.index) == [0, 1, 2, 3, 4]
+    loaded = formatted_rows([df[df['processed'] == '']])
+    assert loaded == streamed
+
+
+def test_skipped_rows_do_not_change_formatting(workbook, tmp_path):
+    # A resumed run skips more rows, the rows left must render the same text
+    before = formatted_rows(StreamingIntakeReader(workbook, chunk_size=2))
+    resumed = openpyxl.load_workbook(workbook)
+    resumed.active["F2"] = "report_1.docx"
+    resumed.active["F5"] = "report_4.docx"
+    resumed_path = tmp_path / "resumed.xlsx"
+    resumed.save(resumed_path)
+    after = formatted_rows(StreamingIntakeReader(resumed_path, chunk_size=2))
+    assert set(after) == {2, 4}
+    for index in after:
+        assert after[index] == before[index]
+
+
+def test_patch_keeps_other_sheets_styles_and_formulas(tmp_path):
+    path = tmp_path / "styled.xlsx"
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["name", "amount", "double", "processed"])
+    for number in range(1, 4):
+        sheet.append([f"row {number}", number * 10, f"=B{number + 1}*2", None])
+    sheet["A1"].font = openpyxl.styles.Font(bold=True)
+    sheet["B2"].number_format = "0.00"
+    notes = workbook.create_sheet("Notes")
+    notes["A1"] = "Keep me"
+    notes["B1"] = "=SUM(Sheet!B2:B4)"
+    workbook.save(path)
+    with zipfile.ZipFile(path) as package:
+        original = {name: package.read(name) for name in package.namelist()}
+        # The row by row patch, not the fallback that parses the whole sheet
+        assert patch_sheet_stream(package.open(first_sheet_part(package)), io.BytesIO(), package, {0: "a.docx"})
+
+    write_processed_cells(path, {0: "a.docx", 2: "c.docx"})
+
+    with zipfile.ZipFile(path) as package:
+        sheet_part = first_sheet_part(package)
+        assert sorted(package.namelist()) == sorted(original)
+        for name in original:
+            if name != sheet_part:
+                assert package.read(name) == original[name], name
+    patched = openpyxl.load_workbook(path)
+    sheet = patched["Sheet"]
+    assert [row[3] for row in sheet.iter_rows(min_row=2, values_only=True)] == ["a.docx", None, "c.docx"]
+    assert [row[2] for row in sheet.iter_rows(min_row=2, values_only=True)] == ["=B2*2", "=B3*2", "=B4*2"]
+    assert sheet["A1"].font.bold
+    assert sheet["B2"].number_format == "0.00"
+    assert patched["Notes"]["B1"].value == "=SUM(Sheet!B2:B4)"
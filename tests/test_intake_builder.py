@@ -0,0 +1,72 @@
+import io
+import zipfile
+
+import openpyxl
+from docx import Document
+
+from intake_builder import PlaceholderScanner, build_intake_workbook, expand_templates
+
+
+def template_bytes(*paragraphs, header=None):
+    """A .docx with one paragraph per list of runs, and optionally a header paragraph."""
+    document = Document()
+    for runs in paragraphs:
+        paragraph = document.add_paragraph()
+        for text in runs:
+            paragraph.add_run(text).bold = True  # Keeps python-docx from merging the runs
+    if header:
+        document.sections[0].header.paragraphs[0].text = header
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def test_scanner_finds_placeholders_and_caches_them(tmp_path):
+    letter = template_bytes(["Dear [Name],"], ["Your order [ord", "er_id] ships on [date]."], header="[Company]")
+    memo = template_bytes(["To: [Name]", " from [ author ]"])
+    templates = [("letter.docx", letter), ("memo.docx", memo), ("copy.docx", letter), ("broken.docx", b"not a docx")]
+    cache_path = tmp_path / "scan_cache.json"
+
+    scanner = PlaceholderScanner(workers=1, cache_path=cache_path)
+    results, errors = scanner.scan(templates)
+
+    # In order of appearance, the body before the header; split runs count too
+    assert results == {
+        "letter.docx": ["Name", "order_id", "date", "Company"],
+        "memo.docx": ["Name", "author"],
+        "copy.docx": ["Name", "order_id", "date", "Company"],
+    }
+    assert list(errors) == ["broken.docx"]
+    # Identical files are parsed once
+    assert (scanner.hits, scanner.misses) == (0, 3)
+
+    # A new scanner (e.g. the next run) reads the results from the cache file
+    rescanner = PlaceholderScanner(workers=1, cache_path=cache_path)
+    assert rescanner.scan(templates[:3]) == (results, {})
+    assert (rescanner.hits, rescanner.misses) == (3, 0)
+
+
+def test_pool_scan_matches_serial_scan():
+    templates = [(f"t{number}.docx", template_bytes([f"[field_{number}] and [shared]"])) for number in range(5)]
+    serial, _ = PlaceholderScanner(workers=1).scan(templates)
+    pooled, errors = PlaceholderScanner(workers=2).scan(templates)
+    assert (pooled, errors) == (serial, {})
+    assert pooled["t3.docx"] == ["field_3", "shared"]
+
+
+def test_bundles_are_unpacked_and_intake_has_every_placeholder():
+    bundle = io.BytesIO()
+    with zipfile.ZipFile(bundle, 'w') as archive:
+        archive.writestr("forms/a.docx", template_bytes(["[Name] [City]"]))
+        archive.writestr("forms/~$a.docx", b"lock file")
+        archive.writestr("__MACOSX/forms/._a.docx", b"metadata")
+        archive.writestr("forms/readme.txt", b"text")
+    templates = expand_templates([("bundle.zip", bundle.getvalue()), ("b.docx", template_bytes(["[Name] [Phone]"])),
+                                  ("~$b.docx", b"lock file")])
+    assert [name for name, _ in templates] == ["bundle.zip/forms/a.docx", "b.docx"]
+
+    results, _ = PlaceholderScanner(workers=1).scan(templates)
+    workbook = openpyxl.load_workbook(io.BytesIO(build_intake_workbook(results)))
+    assert [cell.value for cell in workbook["Intake"][1]] == ["City", "Name", "Phone", "processed"]
+    matrix = {row[0]: row[1] for row in workbook["Placeholders"].iter_rows(min_row=2, values_only=True)}
+    assert matrix == {"City": 1, "Name": 2, "Phone": 1}
@@ -0,0 +1,29 @@
+import io
+
+from docx import Document
+
+import langflow_report_generator as langflow
+from conftest import write_workbook
+from report_generator import ReportGenerator
+
+HEADER = ["field_01", "field_02", "field_03", "field_04", "processed"]
+
+
+def document_text(document):
+    cells = [cell.text for table in document.tables for row in table.rows for cell in row.cells]
+    return [paragraph.text for paragraph in document.paragraphs] + cells
+
+
+def test_components_render_like_the_report_stream(inputs, monkeypatch):
+    # The components work on Inputs/ of the current directory
+    monkeypatch.chdir(inputs.parent)
+    write_workbook(inputs / "rows.xlsx", HEADER, [["Ada", 1, 2.5, "x", None], ["Bob", 2, None, "y", None]])
+    df = langflow.load_excel_data_component("rows.xlsx")
+    template = langflow.load_template_component("template.docx")
+
+    reports = list(ReportGenerator(input_dir="Inputs", journal=False).iter_reports(df, "template.docx"))
+    assert len(reports) == 2
+    for (_, row), (_, _, report_bytes) in zip(df.iterrows(), reports):
+        document = langflow.replace_fields_component(template, row)
+        assert document_text(document) == document_text(Document(io.BytesIO(report_bytes)))
+        assert row["field_01"] in "\n".join(document_text(document))
@@ -0,0 +1,38 @@
+import re
+
+from conftest import write_workbook
+from report_generator import ReportGenerator
+
+HEADER = ["field_01", "field_02", "field_03", "field_04", "processed"]
+ROWS = [
+    ["Alice", 1, 2.5, "x", None],
+    ["Bob", 2, 3.5, "y", None],
+    ["Alice", 1, 2.5, "x", None],  # Same values as the first row
+]
+REPORT_NAME = re.compile(r"report_intake_\d{8}_\d{6}_(\d+)\.docx")
+
+
+def run(inputs, tmp_path, output_name):
+    write_workbook(inputs / "intake.xlsx", HEADER, ROWS)
+    generator = ReportGenerator(input_dir=inputs, output_dir=tmp_path / output_name, cache_dir=tmp_path / "cache",
+                                journal=False)
+    result = generator.generate(None, "intake.xlsx", "template.docx", report_prefix="report_intake")
+    return generator, result
+
+
+def test_cached_reports_get_the_job_names(inputs, tmp_path):
+    first, result = run(inputs, tmp_path, "first")
+    assert result["processed"] == 3
+    assert first.render_cache.hits == 0
+
+    # A second run of the same rows is served from the cache
+    second, result = run(inputs, tmp_path, "second")
+    assert result["processed"] == 3
+    assert second.render_cache.hits == 3
+
+    for directory in (tmp_path / "first", tmp_path / "second"):
+        names = sorted(path.name for path in directory.glob("*.docx"))
+        assert [REPORT_NAME.fullmatch(name).group(1) for name in names] == ["1", "2", "3"]
+    first_reports = sorted((tmp_path / "first").glob("*_1.docx"))[0].read_bytes()
+    assert sorted((tmp_path / "second").glob("*_1.docx"))[0].read_bytes() == first_reports
+    assert sorted((tmp_path / "first").glob("*_3.docx"))[0].read_bytes() == first_reports
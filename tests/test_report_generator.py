@@ -0,0 +1,124 @@
+import re
+import shutil
+
+import openpyxl
+import pytest
+
+from conftest import write_workbook
+from report_generator import ReportGenerator
+from synthetic import build_workbook
+
+ROW_NUMBER = re.compile(r"_(\d+)\.docx$")
+
+
+@pytest.fixture
+def workbook(inputs):
+    return build_workbook(inputs / "rows.xlsx", rows=25, columns=4, seed=3)
+
+
+def run(inputs, tmp_path, name, stream=False, **options):
+    """Renders rows.xlsx from a fresh copy of inputs and returns {row number: report bytes}."""
+    job_inputs = tmp_path / name / "Inputs"
+    shutil.copytree(inputs, job_inputs)
+    output_dir = tmp_path / name / "Outputs"
+    generator = ReportGenerator(input_dir=job_inputs, output_dir=output_dir, **options)
+    df = None if stream else generator.load_excel_data("rows.xlsx")
+    result = generator.generate(df, "rows.xlsx", "template.docx")
+    assert result["failed"] == 0
+    return {int(ROW_NUMBER.search(path.name).group(1)): path.read_bytes() for path in output_dir.glob("*.docx")}
+
+
+def test_workers_write_the_same_reports_as_a_serial_run(inputs, tmp_path, workbook):
+    serial = run(inputs, tmp_path, "serial")
+    assert sorted(serial) == list(range(1, 26))
+    assert run(inputs, tmp_path, "workers", workers=2) == serial
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_streamed_chunks_write_the_same_reports_as_a_loaded_workbook(inputs, tmp_path, workbook, chunk_size):
+    loaded = run(inputs, tmp_path, "loaded")
+    assert run(inputs, tmp_path, "streamed", stream=True, chunk_size=chunk_size) == loaded
+
+
+def interrupt_after(generator, monkeypatch, reports):
+    """Runs rows.xlsx with generator until it is stopped after the given number of reports."""
+    render = generator.render
+    rendered = []
+
+    def interrupted_render(*args, **kwargs):
+        # Stops the run as a crash or Ctrl+C would
+        for result in render(*args, **kwargs):
+            if len(rendered) == reports:
+                raise KeyboardInterrupt
+            rendered.append(result)
+            yield result
+
+    monkeypatch.setattr(generator, "render", interrupted_render)
+    with pytest.raises(KeyboardInterrupt):
+        generator.generate(None, "rows.xlsx", "template.docx")
+
+
+def test_interrupted_run_resumes_from_the_journal(inputs, tmp_path, workbook, monkeypatch):
+    generator = ReportGenerator(input_dir=inputs, output_dir=tmp_path / "Outputs", chunk_size=4)
+    interrupt_after(generator, monkeypatch, 10)
+    # Rows 1-10 were journaled; the report of row 11 was written but the run stopped before recording it
+    first_reports = {path.name: path.read_bytes() for path in (tmp_path / "Outputs").glob("*.docx")
+                     if int(ROW_NUMBER.search(path.name).group(1)) <= 10}
+    assert len(first_reports) == 10
+    assert generator.journal_path("rows.xlsx").exists()
+
+    resumed = ReportGenerator(input_dir=inputs, output_dir=tmp_path / "Outputs", chunk_size=4)
+    result = resumed.generate(None, "rows.xlsx", "template.docx")
+    assert (result["resumed"], result["processed"], result["failed"]) == (10, 15, 0)
+    assert not resumed.journal_path("rows.xlsx").exists()
+
+    # The interrupted run's reports are kept as they are and marked in the workbook
+    sheet = openpyxl.load_workbook(inputs / "rows.xlsx").active
+    header = [cell.value for cell in sheet[1]]
+    processed = [row[header.index("processed")] for row in sheet.iter_rows(min_row=2, values_only=True)]
+    assert all(processed)
+    assert set(first_reports) <= set(processed)
+    for name, data in first_reports.items():
+        assert (tmp_path / "Outputs" / name).read_bytes() == data
+
+
+
+def test_reconcile_marks_the_journaled_rows(inputs, tmp_path, workbook, monkeypatch):
+    generator = ReportGenerator(input_dir=inputs, output_dir=tmp_path / "Outputs", chunk_size=4)
+    interrupt_after(generator, monkeypatch, 10)
+
+    reconciler = ReportGenerator(input_dir=inputs, output_dir=tmp_path / "Outputs")
+    assert reconciler.reconcile("rows.xlsx", "template.docx") == {"reconciled": 10, "journaled": 10}
+    assert sum(1 for value in processed_cells(inputs / "rows.xlsx")["processed"] if value) == 10
+    # Without a journal there is nothing left to mark, reported with the same keys
+    assert reconciler.reconcile("rows.xlsx", "template.docx") == {"reconciled": 0, "journaled": 0}
+
+def processed_cells(path):
+    """{column: values below the header} of the columns whose name starts with 'processed'."""
+    sheet = openpyxl.load_workbook(path).active
+    columns = list(sheet.iter_cols(values_only=True))
+    return {column[0]: list(column[1:]) for column in columns if str(column[0]).startswith("processed")}
+
+
+def test_fan_out_tracks_each_template_in_its_own_column(inputs, tmp_path):
+    shutil.copyfile(inputs / "template.docx", inputs / "letter.docx")
+    shutil.move(inputs / "template.docx", inputs / "memo.docx")
+    write_workbook(inputs / "rows.xlsx", ["field_01", "field_02", "processed_memo"],
+                   [["a", 1, None], ["b", 2, "old_memo.docx"], ["c", 3, None]])
+    generator = ReportGenerator(input_dir=inputs, output_dir=tmp_path / "Outputs", journal=False)
+
+    result = generator.generate(None, "rows.xlsx", ["letter.docx", "memo.docx"])
+
+    # Row 2 already has its memo, so it only gets a letter
+    assert (result["processed"], result["failed"]) == (5, 0)
+    cells = processed_cells(inputs / "rows.xlsx")
+    assert cells["processed_memo"][1] == "old_memo.docx"
+    for name in ("letter", "memo"):
+        assert all(re.fullmatch(rf"report_{name}_\d{{8}}_\d{{6}}_{row}\.docx", cells[f"processed_{name}"][row - 1])
+                   for row in (1, 3))
+    assert re.fullmatch(r"report_letter_\d{8}_\d{6}_2\.docx", cells["processed_letter"][1])
+    assert len(list((tmp_path / "Outputs").glob("*.docx"))) == 5
+
+    # Every cell is filled now, a second run has nothing to do
+    result = generator.generate(None, "rows.xlsx", ["letter.docx", "memo.docx"])
+    assert (result["processed"], result["skipped"]) == (0, 3)
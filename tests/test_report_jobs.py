@@ -0,0 +1,102 @@
+import io
+import threading
+import time
+import zipfile
+
+import openpyxl
+
+from artifact_store import ArtifactStore
+from report_jobs import (PROFILE_ARTIFACT, REPORT_ZIP_ARTIFACT, UPDATED_EXCEL_ARTIFACT, JobManager, ReportJob,
+                         run_generation_job)
+from stage_timer import profiled
+from synthetic import build_template, build_workbook
+from template_library import TemplateLibrary
+
+JOB_ID = "0" * 32
+
+
+class CancelledJob(ReportJob):
+    """A job whose cancel button is pressed once rows reports have been rendered."""
+
+    def __init__(self, job_id, directory, rows):
+        super().__init__(job_id, directory)
+        self.rows = rows
+        self.checks = 0
+
+    @property
+    def cancel_requested(self):
+        # Checked once before every report is stored
+        self.checks += 1
+        if self.checks > self.rows:
+            self.cancel()
+        return super().cancel_requested
+
+
+def test_cancel_keeps_the_reports_of_finished_rows(tmp_path):
+    template_bytes = build_template(tmp_path / "template.docx", paragraphs=3, placeholders=4, columns=4, tables=0,
+                                    braces="double").read_bytes()
+    excel_bytes = build_workbook(tmp_path / "rows.xlsx", rows=10, columns=4).read_bytes()
+    store = ArtifactStore(root=tmp_path / "artifacts")
+    job = CancelledJob(JOB_ID, store.job_dir(JOB_ID), rows=3)
+
+    run_generation_job(job, store, TemplateLibrary(), excel_bytes, "rows.xlsx", template_bytes)
+
+    state = job.snapshot()
+    assert (state["state"], state["processed_count"]) == ("cancelled", 3)
+    with zipfile.ZipFile(store.get_path(JOB_ID, REPORT_ZIP_ARTIFACT)) as archive:
+        assert len(archive.namelist()) == 3
+    sheet = openpyxl.load_workbook(io.BytesIO(store.read(JOB_ID, UPDATED_EXCEL_ARTIFACT))).active
+    processed = [row[-1] for row in sheet.iter_rows(min_row=2, values_only=True)]
+    assert set(processed[:3]) == set(archive.namelist())
+    assert processed[3:] == [None] * 7
+
+
+def test_concurrent_profiled_jobs_take_turns(tmp_path):
+    template_bytes = build_template(tmp_path / "template.docx", paragraphs=3, placeholders=4, columns=4, tables=0,
+                                    braces="double").read_bytes()
+    excel_bytes = build_workbook(tmp_path / "rows.xlsx", rows=3, columns=4).read_bytes()
+    store = ArtifactStore(root=tmp_path / "artifacts")
+    results = {}
+
+    def run_job(job_id):
+        job = ReportJob(job_id, store.job_dir(job_id))
+        run_generation_job(job, store, TemplateLibrary(), excel_bytes, "rows.xlsx", template_bytes, profile=True)
+        results[job_id] = job.snapshot()
+
+    # The second job starts while the first one is still being profiled
+    with profiled(tmp_path / "first.pstats"):
+        second = threading.Thread(target=run_job, args=("2" * 32,))
+        second.start()
+        second.join()
+    run_job("3" * 32)
+
+    assert results["2" * 32]["state"] == results["3" * 32]["state"] == "completed"
+    assert not results["2" * 32]["profile"] and store.get_path("2" * 32, PROFILE_ARTIFACT) is None
+    assert any("profiled" in warning for warning in results["2" * 32]["warnings"])
+    assert (tmp_path / "first.pstats").exists()
+    assert results["3" * 32]["profile"] and store.get_path("3" * 32, PROFILE_ARTIFACT) is not None
+
+
+def test_manager_cancels_running_jobs_and_reports_lost_ones(tmp_path):
+    manager = JobManager(max_workers=1)
+    started = threading.Event()
+
+    def target(job):
+        started.set()
+        while not job.cancel_requested:
+            time.sleep(0.01)
+        job.update(state="cancelled")
+
+    job = manager.submit(JOB_ID, tmp_path / JOB_ID, target)
+    assert started.wait(5)
+    assert manager.cancel(JOB_ID)
+    assert not manager.cancel("f" * 32)
+    deadline = time.time() + 5
+    while manager.status(JOB_ID, job.directory)["state"] != "cancelled" and time.time() < deadline:
+        time.sleep(0.01)
+    assert manager.status(JOB_ID, job.directory)["state"] == "cancelled"
+
+    # A job still running when the process stopped is reported as interrupted
+    lost = ReportJob("1" * 32, tmp_path / "lost")
+    lost.update(state="running")
+    assert JobManager().status(lost.id, lost.directory)["state"] == "interrupted"
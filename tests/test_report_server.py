@@ -0,0 +1,76 @@
+import http.client
+import io
+import json
+import threading
+import zipfile
+
+import pytest
+
+from conftest import write_workbook
+from report_server import XLSX_TYPE, ReportServer
+
+HEADER = ["field_01", "field_02", "field_03", "field_04", "processed"]
+ROWS = [
+    ["Alice", 1, 2.5, "x", None],
+    ["Bob", 2, 3.5, "y", "done.docx"],  # Already processed, skipped
+    ["Alice", 3, None, "z", None],
+]
+
+
+@pytest.fixture
+def server(inputs):
+    server = ReportServer(("127.0.0.1", 0), template_dir=inputs, chunk_size=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, query, body, content_type):
+    connection = http.client.HTTPConnection(*server.server_address)
+    connection.request("POST", f"/render?{query}", body=body, headers={"Content-Type": content_type})
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+def report_texts(data):
+    with zipfile.ZipFile(io.BytesIO(data)) as report:
+        return report.read("word/document.xml").decode('utf-8')
+
+
+def test_rows_render_the_same_from_xlsx_csv_and_json(server, tmp_path):
+    workbook = write_workbook(tmp_path / "rows.xlsx", HEADER, ROWS).read_bytes()
+    csv = "field_01,field_02,field_03,field_04,processed\nAlice,1,2.5,x,\nBob,2,3.5,y,done.docx\nAlice,3,,z,\n"
+    rows = [dict(zip(HEADER, row)) for row in ROWS]
+    bodies = [(workbook, XLSX_TYPE), (csv.encode('utf-8'), "text/csv"), (json.dumps(rows).encode('utf-8'), "application/json")]
+
+    archives = []
+    for body, content_type in bodies:
+        status, data = post(server, "template=template.docx&filename_column=field_01", body, content_type)
+        assert status == 200
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            archives.append({name: report_texts(archive.read(name)) for name in archive.namelist()})
+
+    # Reports are named after the column, repeated names get a counter
+    assert list(archives[0]) == ["Alice.docx", "Alice_2.docx"]
+    assert "3.5" not in "".join(archives[0].values())
+    assert archives[1] == archives[0]
+    assert archives[2] == archives[0]
+
+
+def test_single_report_and_errors(server):
+    rows = [{"field_01": "Alice", "field_02": 1}]
+    status, data = post(server, "template=template.docx&format=docx", json.dumps(rows), "application/json")
+    assert status == 200
+    assert "Alice" in report_texts(data)
+
+    status, data = post(server, "template=template.docx&format=docx", json.dumps(rows * 2), "application/json")
+    assert status == 400
+    assert "exactly one row" in json.loads(data)["error"]
+
+    status, data = post(server, "template=template.docx", json.dumps([{"processed": "x"}]), "application/json")
+    assert (status, json.loads(data)["error"]) == (400, "No rows to render")
+
+    status, data = post(server, "template=template.docx&filename_column=name", json.dumps(rows), "application/json")
+    assert (status, json.loads(data)["error"]) == (400, "Unknown filename_column: name")
@@ -0,0 +1,79 @@
+import re
+
+import openpyxl
+import pytest
+
+from conftest import write_workbook
+from report_generator import ReportGenerator, TemplateRouter
+from synthetic import build_template
+from template_library import TemplateLibrary
+
+HEADER = ["field_01", "field_02", "field_03", "field_04", "template", "processed"]
+
+
+@pytest.fixture
+def templates(tmp_path):
+    """Templates/ with three templates of different content."""
+    directory = tmp_path / "Templates"
+    directory.mkdir()
+    for seed, name in enumerate(("letter", "memo", "notice"), 1):
+        build_template(directory / f"{name}.docx", paragraphs=3, placeholders=4 + seed, columns=4, tables=0,
+                       braces="single", seed=seed)
+    return directory
+
+
+def routed_generator(inputs, templates, tmp_path, **options):
+    return ReportGenerator(input_dir=inputs, output_dir=tmp_path / "Outputs", template_dir=templates, journal=False,
+                           **options)
+
+
+def processed_column(path):
+    sheet = openpyxl.load_workbook(path).active
+    return [row[-1] for row in sheet.iter_rows(min_row=2, values_only=True)]
+
+
+def test_router_resolves_names_without_extension_and_case(templates):
+    router = TemplateRouter.from_directory(templates, TemplateLibrary().get_file)
+    assert router.resolve("Letter")[0] == "letter"
+    assert router.resolve(" MEMO.docx ")[0] == "memo"
+    with pytest.raises(ValueError, match="no template named 'invoice'"):
+        router.resolve("invoice")
+
+
+def test_rows_render_with_the_template_they_name(inputs, templates, tmp_path):
+    write_workbook(inputs / "rows.xlsx", HEADER, [
+        ["a", 1, 2, 3, "letter", None],
+        ["b", 1, 2, 3, "Memo.docx", None],
+        ["c", 1, 2, 3, "", None],  # Falls back to the default template
+        ["d", 1, 2, 3, "invoice", None],  # Unknown, the row fails
+    ])
+    generator = routed_generator(inputs, templates, tmp_path)
+
+    result = generator.generate(None, "rows.xlsx", "template.docx")
+
+    assert (result["processed"], result["failed"]) == (3, 1)
+    assert result["templates"] == {"letter": 1, "memo": 1, "template": 1}
+    processed = processed_column(inputs / "rows.xlsx")
+    assert [name.split("_")[1] for name in processed[:2]] == ["letter", "memo"]
+    assert re.fullmatch(r"report_\d{8}_\d{6}_3\.docx", processed[2])
+    assert processed[3] is None
+
+
+def test_empty_cell_without_a_default_template_fails_the_row(inputs, templates, tmp_path):
+    write_workbook(inputs / "rows.xlsx", HEADER, [["a", 1, 2, 3, "notice", None], ["b", 1, 2, 3, None, None]])
+    result = routed_generator(inputs, templates, tmp_path).generate(None, "rows.xlsx", None)
+    assert (result["processed"], result["failed"]) == (1, 1)
+    assert processed_column(inputs / "rows.xlsx")[1] is None
+
+
+@pytest.mark.parametrize("pool_size, misses", [(1, 3), (16, 2)])
+def test_template_pool_keeps_at_most_pool_size_templates(inputs, templates, tmp_path, pool_size, misses):
+    # One row per chunk, so every row resolves its template again
+    write_workbook(inputs / "rows.xlsx", HEADER, [["a", 1, 2, 3, name, None] for name in ("letter", "memo", "letter")])
+    generator = routed_generator(inputs, templates, tmp_path, chunk_size=1, template_pool_size=pool_size)
+
+    result = generator.generate(None, "rows.xlsx", None)
+
+    assert result["processed"] == 3
+    # With room for one template, letter is compiled again after memo pushed it out
+    assert generator.template_library.misses == misses
@@ -0,0 +1,51 @@
+import io
+import zipfile
+
+from docx import Document
+
+from conftest import build_notes_template
+from template_engine import (SINGLE_BRACE_PATTERN, CompiledTemplate, replace_in_paragraph, splice_paragraph,
+                             story_paragraphs)
+
+
+def test_placeholders_in_footnotes_and_endnotes(tmp_path):
+    path = build_notes_template(tmp_path / "notes.docx", "Dear {name}", "Footnote for {name}", "Endnote on {city}")
+    values = {"name": "Ada", "city": "London"}
+
+    compiled = CompiledTemplate(path.read_bytes(), pattern=SINGLE_BRACE_PATTERN)
+    assert compiled.placeholders == ["name", "city"]
+    with zipfile.ZipFile(io.BytesIO(compiled.render(values))) as report:
+        assert b"Footnote for Ada" in report.read("word/footnotes.xml")
+        assert b"Endnote on London" in report.read("word/endnotes.xml")
+
+    # The python-docx helpers reach the notes as well
+    document = Document(path)
+    for paragraph in story_paragraphs(document):
+        replace_in_paragraph(paragraph, SINGLE_BRACE_PATTERN, lambda match: values.get(match.group(1)))
+    buffer = io.BytesIO()
+    document.save(buffer)
+    with zipfile.ZipFile(buffer) as report:
+        assert b"Footnote for Ada" in report.read("word/footnotes.xml")
+        assert b"Endnote on London" in report.read("word/endnotes.xml")
+        assert b"Dear Ada" in report.read("word/document.xml")
+
+
+def test_splice_paragraph_keeps_run_formatting():
+    paragraph = Document().add_paragraph()
+    paragraph.add_run("Dear ").italic = True
+    paragraph.add_run("{na").bold = True  # Word split the placeholder over two runs
+    paragraph.add_run("me}").underline = True
+    paragraph.add_run(", from {city}.").italic = True
+
+    values = {"name": "Ada", "city": "London"}
+    replaced = splice_paragraph(paragraph._p, SINGLE_BRACE_PATTERN, lambda match: values[match.group(1)])
+
+    assert replaced == 2
+    assert paragraph.text == "Dear Ada, from London."
+    # Every run keeps its formatting; the placeholder's text goes to the run it started in
+    assert [(run.text, run.bold, run.italic, run.underline) for run in paragraph.runs] == [
+        ("Dear ", None, True, None),
+        ("Ada", True, None, None),
+        ("", None, None, True),
+        (", from London.", None, True, None),
+    ]
@@ -0,0 +1,21 @@
+import json
+
+from template_engine import SINGLE_BRACE_PATTERN
+from template_library import TemplateLibrary
+
+
+def test_stored_templates_render_the_same(inputs, tmp_path):
+    template_bytes = (inputs / "template.docx").read_bytes()
+    values = {f"field_{number:02d}": f"value <{number}>" for number in range(1, 5)}
+
+    compiled = TemplateLibrary(store_dir=tmp_path / "store").get(template_bytes, pattern=SINGLE_BRACE_PATTERN)
+    # The store holds plain JSON, nothing that runs code when it is loaded
+    stored = list((tmp_path / "store").iterdir())
+    assert [path.suffix for path in stored] == [".json"]
+    json.loads(stored[0].read_text(encoding='utf-8'))
+
+    library = TemplateLibrary(store_dir=tmp_path / "store")
+    loaded = library.get(template_bytes, pattern=SINGLE_BRACE_PATTERN)
+    assert (library.hits, library.misses) == (1, 0)
+    assert loaded.slots == compiled.slots
+    assert loaded.render(values) == compiled.render(values)